@@ -0,0 +1,32 @@
+"""product keyset pagination indexes
+
+Revision ID: 3f9a1c7d2e4b
+Revises: 488811bc64fe
+Create Date: 2026-10-17 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c7d2e4b'
+down_revision: Union[str, Sequence[str], None] = '488811bc64fe'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_price_id', 'products', ['price', 'id'], unique=False)
+    op.create_index('ix_products_created_at_id', 'products', ['created_at', 'id'], unique=False)
+    op.create_index('ix_products_name_id', 'products', ['name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_name_id', table_name='products')
+    op.drop_index('ix_products_created_at_id', table_name='products')
+    op.drop_index('ix_products_price_id', table_name='products')
@@ -0,0 +1,41 @@
+"""cart reservation expiry
+
+Revision ID: 5d81f3a6b2c9
+Revises: c47e0b95d3a2
+Create Date: 2026-10-17 23:05:00.000000
+
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d81f3a6b2c9'
+down_revision: Union[str, Sequence[str], None] = 'c47e0b95d3a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('cart_items') as batch_op:
+        batch_op.add_column(sa.Column('reserved_until', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_cart_items_reserved_until'), 'cart_items', ['reserved_until'], unique=False)
+    # Give lines that predate expiry the default 30 minute window from now,
+    # so existing abandoned carts are reclaimed too.
+    cart_items = sa.table('cart_items', sa.column('reserved_until', sa.DateTime(timezone=True)))
+    op.execute(
+        cart_items.update()
+        .where(cart_items.c.reserved_until.is_(None))
+        .values(reserved_until=datetime.now(timezone.utc) + timedelta(minutes=30))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_cart_items_reserved_until'), table_name='cart_items')
+    with op.batch_alter_table('cart_items') as batch_op:
+        batch_op.drop_column('reserved_until')
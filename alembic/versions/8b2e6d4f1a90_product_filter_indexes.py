@@ -0,0 +1,34 @@
+"""product catalog filter indexes
+
+Revision ID: 8b2e6d4f1a90
+Revises: 3f9a1c7d2e4b
+Create Date: 2026-10-17 21:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b2e6d4f1a90'
+down_revision: Union[str, Sequence[str], None] = '3f9a1c7d2e4b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_products_category_id_id', 'products', ['category_id', 'id'], unique=False)
+    op.create_index('ix_products_category_id_price_id', 'products', ['category_id', 'price', 'id'], unique=False)
+    op.create_index('ix_products_category_id_created_at_id', 'products', ['category_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_products_category_id_name_id', 'products', ['category_id', 'name', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_products_category_id_name_id', table_name='products')
+    op.drop_index('ix_products_category_id_created_at_id', table_name='products')
+    op.drop_index('ix_products_category_id_price_id', table_name='products')
+    op.drop_index('ix_products_category_id_id', table_name='products')
@@ -0,0 +1,73 @@
+"""product full-text search
+
+Revision ID: c47e0b95d3a2
+Revises: 8b2e6d4f1a90
+Create Date: 2026-10-17 22:15:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c47e0b95d3a2'
+down_revision: Union[str, Sequence[str], None] = '8b2e6d4f1a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PG_SEARCH_VECTOR = (
+    "to_tsvector('english'::regconfig, "
+    "coalesce(products.name, '') || ' ' || coalesce(products.description, ''))"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("""
+            CREATE VIRTUAL TABLE products_fts USING fts5(
+                name, description,
+                content='products', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+            )
+        """)
+        op.execute("""
+            CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN
+                INSERT INTO products_fts(rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+            END
+        """)
+        op.execute("""
+            CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+                INSERT INTO products_fts(products_fts, rowid, name, description)
+                VALUES ('delete', old.id, old.name, old.description);
+                INSERT INTO products_fts(rowid, name, description)
+                VALUES (new.id, new.name, new.description);
+            END
+        """)
+        # Index the rows that already exist.
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    elif dialect == "postgresql":
+        op.execute(
+            f"CREATE INDEX ix_products_search ON products USING gin (({PG_SEARCH_VECTOR}))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    dialect = op.get_bind().dialect.name
+    if dialect == "sqlite":
+        op.execute("DROP TRIGGER IF EXISTS products_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS products_fts_ai")
+        op.execute("DROP TABLE IF EXISTS products_fts")
+    elif dialect == "postgresql":
+        op.execute("DROP INDEX IF EXISTS ix_products_search")
@@ -0,0 +1,40 @@
+"""unique cart item per product
+
+Revision ID: d5b8e2f4a671
+Revises: a1d4c6e8f203
+Create Date: 2026-10-18 10:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5b8e2f4a671'
+down_revision: Union[str, Sequence[str], None] = 'a1d4c6e8f203'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fold duplicate lines left by concurrent adds into the oldest one.
+    op.execute(
+        "UPDATE cart_items SET quantity = ("
+        " SELECT SUM(d.quantity) FROM cart_items AS d"
+        " WHERE d.cart_id = cart_items.cart_id AND d.product_id = cart_items.product_id)"
+        " WHERE id IN ("
+        " SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id HAVING COUNT(*) > 1)"
+    )
+    op.execute(
+        "DELETE FROM cart_items WHERE id NOT IN ("
+        " SELECT MIN(id) FROM cart_items GROUP BY cart_id, product_id)"
+    )
+    op.create_index('ix_cart_items_cart_id_product_id', 'cart_items', ['cart_id', 'product_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_cart_items_cart_id_product_id', table_name='cart_items')
@@ -0,0 +1,230 @@
+"""Streaming product import.
+
+The request body is consumed chunk by chunk and parsed into rows as
+complete lines arrive, so memory is bounded by one batch, not by the
+file. Each batch resolves its category ids with a single query and is
+written with one bulk statement (executemany, or COPY when the engine is
+PostgreSQL on asyncpg), then committed so a large feed never holds one
+long write transaction. A line or CSV record longer than
+``bulk_import_max_row_length`` characters is dropped as it streams in and
+reported as a failed row.
+"""
+import codecs
+import csv
+import json
+import time
+from typing import AsyncIterator
+
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+
+IMPORT_COLUMNS = ("name", "description", "price", "stock_quantity", "category_id")
+
+product_row_adapter = TypeAdapter(schemas.ProductCreate)
+
+
+class _Overlong:
+    """Stands in for a line or CSV record over the import's length limit."""
+
+    def __repr__(self):
+        return "OVERLONG"
+
+
+OVERLONG = _Overlong()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_length: int) -> AsyncIterator[str | _Overlong]:
+    """Split a byte stream into text lines without reading it all.
+
+    A line longer than max_length comes out as OVERLONG, and its text is
+    dropped as it arrives instead of being buffered.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    parts: list[str] = []
+    length, overlong = 0, False
+
+    def extend(text: str):
+        nonlocal length, overlong
+        length += len(text)
+        if length > max_length:
+            parts.clear()
+            overlong = True
+        elif not overlong:
+            parts.append(text)
+
+    def finish() -> str | _Overlong:
+        nonlocal length, overlong
+        line = OVERLONG if overlong else "".join(parts).rstrip("\r")
+        parts.clear()
+        length, overlong = 0, False
+        return line
+
+    async for chunk in chunks:
+        *lines, rest = decoder.decode(chunk).split("\n")
+        for line in lines:
+            extend(line)
+            yield finish()
+        extend(rest)
+    extend(decoder.decode(b"", final=True))
+    if length or overlong:
+        yield finish()
+
+
+async def iter_csv_records(lines: AsyncIterator[str | _Overlong], max_length: int) -> AsyncIterator[tuple[int, dict | None | _Overlong]]:
+    """(row number, record) pairs; the first line is the header.
+
+    A quoted field may contain newlines, so lines are joined until the
+    quotes balance before the record is handed to the csv module. A record
+    that grows past max_length is reported as OVERLONG and skipped.
+    """
+    header, row = None, 0
+    record: list[str] = []
+    length = quotes = 0
+    async for line in lines:
+        if line is OVERLONG or length + len(line) > max_length:
+            record, length, quotes = [], 0, 0
+            if header is not None:
+                row += 1
+                yield row, OVERLONG
+            continue
+        record.append(line)
+        length += len(line) + 1
+        quotes += line.count('"')
+        if quotes % 2:
+            continue
+        values = next(csv.reader(["\n".join(record)]))
+        record, length, quotes = [], 0, 0
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if not values:
+            continue
+        row += 1
+        yield row, {name: value for name, value in zip(header, values)
+                    if value != ""}
+
+
+async def iter_ndjson_records(lines: AsyncIterator[str | _Overlong], max_length: int) -> AsyncIterator[tuple[int, dict | None | _Overlong]]:
+    """(row number, record) pairs, with None for lines that aren't objects."""
+    row = 0
+    async for line in lines:
+        if line is OVERLONG:
+            row += 1
+            yield row, OVERLONG
+            continue
+        if not line.strip():
+            continue
+        row += 1
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        yield row, record if isinstance(record, dict) else None
+
+
+def parse_row(record: dict | None | _Overlong, max_length: int) -> dict:
+    """Validate one record into insert parameters; ValueError explains why not."""
+    if record is OVERLONG:
+        raise ValueError(f"Row is longer than {max_length} characters")
+    if record is None:
+        raise ValueError("Row is not a JSON object")
+    try:
+        product = product_row_adapter.validate_python(record)
+    except ValidationError as e:
+        raise ValueError("; ".join(
+            f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors()))
+    if product.price < 0:
+        raise ValueError("Price must be non-negative")
+    if product.stock_quantity < 0:
+        raise ValueError("Stock quantity must be non-negative")
+    return product.model_dump()
+
+
+async def _write_batch(db: AsyncSession, rows: list[dict]):
+    if db.bind.dialect.name == "postgresql" and db.bind.dialect.driver == "asyncpg":
+        connection = await db.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            models.Product.__tablename__, columns=IMPORT_COLUMNS,
+            records=[tuple(row[column] for column in IMPORT_COLUMNS)
+                     for row in rows])
+    else:
+        await db.execute(insert(models.Product), rows)
+
+
+class ProductImporter:
+    """Accumulates validated rows and flushes them a batch at a time."""
+
+    def __init__(self, db: AsyncSession, batch_size: int, max_errors: int, max_row_length: int):
+        self.db = db
+        self.batch_size = batch_size
+        self.max_errors = max_errors
+        self.max_row_length = max_row_length
+        self.batch: list[tuple[int, dict]] = []
+        self.rows_received = 0
+        self.rows_imported = 0
+        self.rows_failed = 0
+        self.errors: list[schemas.ImportRowError] = []
+
+    def fail(self, row: int, error: str):
+        self.rows_failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(schemas.ImportRowError(row=row, error=error))
+
+    async def add(self, row: int, record: dict | None | _Overlong):
+        self.rows_received += 1
+        try:
+            self.batch.append((row, parse_row(record, self.max_row_length)))
+        except ValueError as e:
+            self.fail(row, str(e))
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        category_ids = {values["category_id"] for _, values in batch}
+        known = set((await self.db.execute(
+            select(models.Category.id).where(models.Category.id.in_(category_ids))
+        )).scalars())
+        rows = []
+        for row, values in batch:
+            if values["category_id"] in known:
+                rows.append(values)
+            else:
+                self.fail(
+                    row, f"Category not found with id {values['category_id']}")
+        if rows:
+            await _write_batch(self.db, rows)
+            await self.db.commit()
+            self.rows_imported += len(rows)
+
+
+async def import_products(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    batch_size: int,
+    max_errors: int,
+    max_row_length: int,
+) -> schemas.ProductImportReport:
+    started = time.perf_counter()
+    importer = ProductImporter(db, batch_size, max_errors, max_row_length)
+    records = iter_csv_records if fmt == "csv" else iter_ndjson_records
+    async for row, record in records(iter_lines(chunks, max_row_length), max_row_length):
+        await importer.add(row, record)
+    await importer.flush()
+    seconds = time.perf_counter() - started
+    return schemas.ProductImportReport(
+        rows_received=importer.rows_received,
+        rows_imported=importer.rows_imported,
+        rows_failed=importer.rows_failed,
+        errors=importer.errors,
+        errors_truncated=importer.rows_failed > len(importer.errors),
+        seconds=round(seconds, 3),
+        rows_per_second=round(importer.rows_imported / seconds, 1) if seconds else 0.0,
+    )
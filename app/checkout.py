@@ -0,0 +1,113 @@
+"""Set-based checkout.
+
+A cart becomes an order in three statements whatever its size:
+
+1. ``INSERT INTO orders ... SELECT`` with the total summed in SQL over the
+   cart joined to current prices (no row at all when the cart is empty);
+2. ``INSERT INTO order_items ... SELECT`` copying every cart line at its
+   current price, returning the new rows;
+3. ``DELETE FROM cart_items ... RETURNING`` clearing the cart.
+
+The lines the DELETE removed must be exactly the lines copied into the
+order; if a concurrent add, removal or reservation sweep changed the cart
+in between, the transaction is rolled back instead of committing an order
+that disagrees with the stock that was reserved for it.
+"""
+from collections import Counter
+
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models, schemas
+
+carts = models.Cart.__table__
+cart_items = models.CartItem.__table__
+products = models.Product.__table__
+orders = models.Order.__table__
+order_items = models.OrderItem.__table__
+
+
+async def place_order(db: AsyncSession, user_id: int) -> schemas.Order:
+    cart_id = (
+        select(carts.c.id).where(carts.c.user_id == user_id).scalar_subquery()
+    )
+    priced_lines = cart_items.join(
+        products, products.c.id == cart_items.c.product_id)
+
+    result = await db.execute(
+        insert(orders)
+        .from_select(
+            ["user_id", "total_amount"],
+            select(literal(user_id),
+                   func.sum(cart_items.c.quantity * products.c.price))
+            .select_from(priced_lines)
+            .where(cart_items.c.cart_id == cart_id)
+            .having(func.count() > 0),
+        )
+        .returning(orders.c.id, orders.c.total_amount, orders.c.created_at)
+    )
+    order = result.first()
+    if order is None:
+        await db.rollback()
+        await _raise_empty_cart(db, user_id)
+
+    result = await db.execute(
+        insert(order_items)
+        .from_select(
+            ["order_id", "product_id", "quantity", "price_at_purchase"],
+            select(literal(order.id), cart_items.c.product_id,
+                   cart_items.c.quantity, products.c.price)
+            .select_from(priced_lines)
+            .where(cart_items.c.cart_id == cart_id)
+            .order_by(cart_items.c.id),
+        )
+        .returning(order_items.c.id, order_items.c.product_id,
+                   order_items.c.quantity, order_items.c.price_at_purchase)
+    )
+    items = sorted(result.all(), key=lambda row: row.id)
+
+    result = await db.execute(
+        delete(cart_items)
+        .where(cart_items.c.cart_id == cart_id)
+        .returning(cart_items.c.product_id, cart_items.c.quantity)
+    )
+    cleared = Counter((row.product_id, row.quantity) for row in result)
+    if cleared != Counter((row.product_id, row.quantity) for row in items):
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Cart changed during checkout, please retry"
+        )
+    await db.commit()
+
+    return schemas.Order(
+        id=order.id,
+        user_id=user_id,
+        total_amount=order.total_amount,
+        created_at=order.created_at,
+        order_items=[
+            schemas.OrderItem(
+                id=row.id,
+                order_id=order.id,
+                product_id=row.product_id,
+                quantity=row.quantity,
+                price_at_purchase=row.price_at_purchase,
+            )
+            for row in items
+        ],
+    )
+
+
+async def _raise_empty_cart(db: AsyncSession, user_id: int):
+    cart = (await db.execute(
+        select(carts.c.id).where(carts.c.user_id == user_id))).first()
+    if cart is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Cart not found"
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Cart is empty"
+    )
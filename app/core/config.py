@@ -9,6 +9,82 @@ class Config(BaseSettings):
     algorithm: str = "HS256"
     token_expiry_minutes: int = 30
 
+    # Read replicas, e.g. DATABASE_REPLICA_URLS='["sqlite+aiosqlite:///./replica1.db"]'.
+    # Local stand-in for replication between SQLite files: copy the primary
+    # into the replicas this often (0 turns it off).
+    database_replica_urls: list[str] = []
+    read_your_writes_seconds: float = 5.0
+    sqlite_replica_sync_interval_seconds: float = 0.0
+
+    # Connection pool
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
+    db_pool_pre_ping: bool = True
+    db_pool_recycle: int = 1800
+    db_pool_timeout: float = 30.0
+
+    # Authenticated principal cache
+    principal_cache_size: int = 10000
+    principal_cache_ttl_seconds: float = 60.0
+    trust_token_role: bool = True
+
+    # Product catalog
+    product_count_cache_ttl_seconds: float = 30.0
+    response_cache_ttl_seconds: float = 10.0
+    response_cache_max_bytes: int = 64 * 1024 * 1024
+    response_cache_max_entries: int = 10000
+
+    # SQLite file databases: PRAGMAs applied to every connection, and the
+    # single-writer queue that group-commits the hot write routes
+    sqlite_pragmas_enabled: bool = True
+    sqlite_journal_mode: str = "WAL"
+    sqlite_synchronous: str = "NORMAL"
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_write_queue_enabled: bool = True
+    sqlite_write_queue_max_batch: int = 64
+
+    # Cache invalidation between workers: "local" (this process only),
+    # "sqlite" (a polled SQLite file, one host) or "redis" (PUBLISH/SUBSCRIBE)
+    invalidation_backend: str = "local"
+    invalidation_sqlite_path: str = "./shopscale-invalidations.db"
+    invalidation_poll_interval_seconds: float = 0.2
+    invalidation_retention_seconds: float = 300.0
+    invalidation_redis_url: str = "redis://localhost:6379/0"
+    invalidation_channel: str = "shopscale:invalidations"
+
+    # Cart stock reservations
+    cart_reservation_minutes: int = 30
+    reservation_sweeper_enabled: bool = True
+    reservation_sweep_interval_seconds: float = 60.0
+    reservation_sweep_batch_size: int = 500
+
+    # Idempotency-Key handling
+    idempotency_key_ttl_hours: int = 24
+    idempotency_wait_seconds: float = 10.0
+    idempotency_claim_lease_seconds: float = 60.0
+    idempotency_janitor_enabled: bool = True
+    idempotency_cleanup_interval_seconds: float = 300.0
+
+    # Admin bulk import and export
+    bulk_import_batch_size: int = 1000
+    bulk_import_max_errors: int = 1000
+    bulk_import_max_row_length: int = 1024 * 1024
+    order_export_batch_size: int = 1000
+
+    # Metrics
+    event_loop_lag_interval_seconds: float = 0.5
+
+    # SQL query budgets: "off", "warn" (log) or "raise" (tests)
+    query_budget_mode: str = "warn"
+    default_query_budget: int | None = None
+    query_repeat_threshold: int = 5
+
+    # Password hashing executor
+    password_hash_workers: int = 4
+    password_hash_queue_depth: int = 64
+
     model_config = SettingsConfigDict(
         env_file=".env", env_file_encoding="utf-8")
 
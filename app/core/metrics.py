@@ -0,0 +1,283 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Every update happens on the event loop thread: the request middleware,
+and the SQLAlchemy engine and pool events, which the async drivers run
+in greenlets on that same thread. So the structures below are plain
+dicts and lists with no locks, and recording a sample is a dict lookup
+and a few integer additions.
+
+Statements are attributed to the route of the request that issued them
+through a context variable the middleware sets. Statements issued outside
+a request, such as the background sweepers, count under route
+"background".
+"""
+import asyncio
+import contextvars
+import time
+from bisect import bisect_left
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.utils.background import PeriodicWorker
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\")
+                         .replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, labels: tuple = ()) -> float:
+        return self.values.get(labels, 0)
+
+    def clear(self):
+        self.values.clear()
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+                for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, labels: tuple = ()):
+        self.values[labels] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def count(self, labels: tuple = ()) -> int:
+        series = self.series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def clear(self):
+        self.series.clear()
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, series in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), series):
+                cumulative += count
+                le = 'le="{}"'.format(_format_value(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+http_requests_total = registry.register(Counter(
+    "http_requests_total", "HTTP responses by method, route and status code.",
+    ("method", "route", "status")))
+http_request_duration_seconds = registry.register(Histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response.",
+    ("method", "route")))
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ("method",)))
+db_statements_total = registry.register(Counter(
+    "db_statements_total", "SQL statements executed, by the route that issued them.",
+    ("route",)))
+db_statement_duration_seconds = registry.register(Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time, by route.",
+    ("route",), DB_BUCKETS))
+db_pool_checkout_wait_seconds = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection.",
+    (), DB_BUCKETS))
+db_pool_connections = registry.register(Gauge(
+    "db_pool_connections", "Pooled connections by state, sampled at scrape time.",
+    ("state",)))
+db_statements_per_request = registry.register(Histogram(
+    "db_statements_per_request", "SQL statements issued by one request, by route.",
+    ("route",), (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)))
+db_repeated_statement_requests_total = registry.register(Counter(
+    "db_repeated_statement_requests_total",
+    "Requests that ran one statement more often than the repeat threshold (likely N+1).",
+    ("route",)))
+query_budget_exceeded_total = registry.register(Counter(
+    "query_budget_exceeded_total", "Requests that issued more SQL than their route's budget.",
+    ("route",)))
+cache_invalidations_published_total = registry.register(Counter(
+    "cache_invalidations_published_total", "Cache invalidation events published by this worker.",
+    ("table",)))
+cache_invalidations_received_total = registry.register(Counter(
+    "cache_invalidations_received_total", "Cache invalidation events received from other workers.",
+    ("table",)))
+cache_invalidation_lag_seconds = registry.register(Histogram(
+    "cache_invalidation_lag_seconds", "Time from another worker's publish to eviction here.",
+    ("table",), (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+event_loop_lag_seconds = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a timer.",
+    (), DB_BUCKETS))
+
+
+class RequestStats:
+    """SQL issued while handling one request.
+
+    patterns counts executions per statement text. Statements are compiled
+    with bound parameters, so the same query run for different rows has
+    the same text and a repeat count above one is a loop issuing SQL.
+    """
+
+    __slots__ = ("statements", "durations", "patterns", "budgeted")
+
+    def __init__(self):
+        # statements and patterns only count budgeted statements (see
+        # query_budget.exempt_from_budget); durations covers all of them.
+        self.statements = 0
+        self.durations: list[float] = []
+        self.patterns: dict[str, int] = {}
+        self.budgeted = True
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        """Statements executed more than threshold times."""
+        return {statement: count for statement, count in self.patterns.items()
+                if count > threshold}
+
+
+current_request: contextvars.ContextVar[RequestStats | None] = contextvars.ContextVar(
+    "current_request", default=None)
+
+
+# Savepoints a session opens inside a larger transaction (see
+# app.write_queue) are transaction control, not queries of the request.
+_TRANSACTION_CONTROL = ("SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("statement_started", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["statement_started"].pop()
+    stats = current_request.get()
+    if stats is None:
+        db_statements_total.inc(("background",))
+        db_statement_duration_seconds.observe(elapsed, ("background",))
+        return
+    stats.durations.append(elapsed)
+    if stats.budgeted and not statement.startswith(_TRANSACTION_CONTROL):
+        stats.statements += 1
+        stats.patterns[statement] = stats.patterns.get(statement, 0) + 1
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    started = context.connection.info.get("statement_started") if context.connection else None
+    if started:
+        started.pop()
+
+
+def record_request(method: str, route: str, status: int, elapsed: float, stats: RequestStats):
+    http_requests_total.inc((method, route, status))
+    http_request_duration_seconds.observe(elapsed, (method, route))
+    db_statements_per_request.observe(len(stats.durations), (route,))
+    if stats.durations:
+        db_statements_total.inc((route,), len(stats.durations))
+        for duration in stats.durations:
+            db_statement_duration_seconds.observe(duration, (route,))
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """The default async pool, timing how long each checkout waits."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            db_pool_checkout_wait_seconds.observe(time.perf_counter() - started)
+
+
+class EventLoopLagMonitor(PeriodicWorker):
+    """Records how much later than scheduled each of its timers fires."""
+
+    name = "Event loop lag monitor"
+
+    def __init__(self, interval: float):
+        super().__init__(interval)
+        self._last: float | None = None
+
+    async def run_once(self):
+        now = asyncio.get_running_loop().time()
+        if self._last is not None:
+            event_loop_lag_seconds.observe(
+                max(0.0, now - self._last - self.interval))
+        self._last = now
+
+    async def stop(self):
+        await super().stop()
+        self._last = None
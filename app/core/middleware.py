@@ -1,21 +1,75 @@
-from fastapi import Request
+import re
 import time
 import uuid
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core import metrics
+from app.core.query_budget import check_request
 from app.utils.logger import logger
 
-async def add_process_time_header(request: Request, call_next):
-    start_time = time.time()
+REQUEST_ID_HEADER = b"x-request-id"
+# Incoming ids are echoed back in a header and into logs, so only accept
+# short, plain tokens.
+_VALID_REQUEST_ID = re.compile(rb"^[A-Za-z0-9._-]{1,128}$")
+
+
+class RequestContextMiddleware:
+    """Time each request, assign or propagate X-Request-Id, log it, and
+    record its route metrics.
+
+    A plain ASGI middleware: unlike ``@app.middleware("http")`` it does not
+    wrap the request and response in BaseHTTPMiddleware's task group and
+    streams, it only appends two headers to ``http.response.start``.
+    Metrics are labelled with the matched route template (set in the scope
+    by the router), so ids in paths don't create new series.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-    response = await call_next(request)
+        start = time.perf_counter_ns()
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                if _VALID_REQUEST_ID.match(value):
+                    request_id = value
+                break
+        if request_id is None:
+            request_id = uuid.uuid4().hex.encode()
+        scope.setdefault("state", {})["request_id"] = request_id.decode()
+        logger.info("Request ID: %s: %s %s", scope["state"]["request_id"],
+                    scope["method"], scope["path"])
 
-    process_time = time.time() - start_time
-    response.headers["X-Process-Time"] = str(process_time)
+        status_code = 500
 
-    return response
+        async def send_with_headers(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                elapsed = (time.perf_counter_ns() - start) / 1e9
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", str(elapsed).encode()))
+                headers.append((REQUEST_ID_HEADER, request_id))
+                message["headers"] = headers
+            await send(message)
 
-async def add_request_id_header(request: Request, call_next):
-    request_id = str(uuid.uuid4())
-    logger.info(f"Request ID: {request_id}: {request.method} {request.url}")
-    response = await call_next(request)
-    response.headers["X-Request-Id"] = request_id
-    return response
+        method = scope["method"]
+        stats = metrics.RequestStats()
+        token = metrics.current_request.set(stats)
+        metrics.http_requests_in_flight.inc((method,))
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            metrics.http_requests_in_flight.inc((method,), -1)
+            metrics.current_request.reset(token)
+            route = scope.get("route")
+            metrics.record_request(
+                method, getattr(route, "path", "unmatched"), status_code,
+                (time.perf_counter_ns() - start) / 1e9, stats)
+        check_request(method, route, stats)
@@ -0,0 +1,128 @@
+"""Per-route SQL query budgets and N+1 detection.
+
+A route declares how many statements one request may issue with the
+``query_budget`` decorator::
+
+    @router.get("/")
+    @query_budget(3)
+    async def read_things(...): ...
+
+After each request the middleware hands the request's statement counts
+(see ``metrics.RequestStats``) to ``check_request``. It flags a request
+that went over its route's budget (or ``default_query_budget``), or that
+ran any single statement more than its repeat limit. A repeat usually
+means an N+1 loop. Depending on ``query_budget_mode`` the problem is
+logged ("warn") or raised as QueryBudgetExceeded ("raise", which the
+test suite uses so regressions fail the test that caused them).
+
+Tests can also capture the stats of the requests they make::
+
+    with QueryCapture() as queries:
+        client.get("/cart/")
+    assert queries.last.statements <= 2
+"""
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from app.core import metrics
+from app.core.config import config
+from app.utils.logger import logger
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    max_statements: int
+    max_repeats: int | None = None
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_budget(max_statements: int, max_repeats: int | None = None):
+    """Declare the most SQL statements one request to this endpoint may issue.
+
+    max_repeats overrides query_repeat_threshold for routes that legitimately
+    run one statement several times (e.g. chunked IN lists).
+    """
+    def decorate(endpoint):
+        endpoint.query_budget = QueryBudget(max_statements, max_repeats)
+        return endpoint
+    return decorate
+
+
+@contextmanager
+def exempt_from_budget():
+    """Don't count statements run inside the block against the budget.
+
+    For deliberate polling loops, whose repeats are not an N+1; the
+    statements still show up in the per-route DB metrics.
+    """
+    stats = metrics.current_request.get()
+    if stats is None or not stats.budgeted:
+        yield
+        return
+    stats.budgeted = False
+    try:
+        yield
+    finally:
+        stats.budgeted = True
+
+
+class QueryCapture:
+    """Collects (method, route, stats) for every request finished inside the block."""
+
+    def __init__(self):
+        self.requests: list[tuple[str, str, metrics.RequestStats]] = []
+
+    def __enter__(self):
+        _captures.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _captures.remove(self)
+
+    @property
+    def last(self) -> metrics.RequestStats:
+        return self.requests[-1][2]
+
+    @property
+    def statements(self) -> int:
+        return sum(stats.statements for _, _, stats in self.requests)
+
+
+_captures: list[QueryCapture] = []
+
+
+def check_request(method: str, route, stats: metrics.RequestStats):
+    """Record and enforce the query budget for one finished request."""
+    path = getattr(route, "path", "unmatched")
+    for capture in _captures:
+        capture.requests.append((method, path, stats))
+    if config.query_budget_mode == "off" or not stats.statements:
+        return
+
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+    max_statements = budget.max_statements if budget else config.default_query_budget
+    threshold = config.query_repeat_threshold
+    if budget is not None and budget.max_repeats is not None:
+        threshold = budget.max_repeats
+
+    problems = []
+    if max_statements is not None and stats.statements > max_statements:
+        metrics.query_budget_exceeded_total.inc((path,))
+        problems.append(
+            f"{stats.statements} statements, budget is {max_statements}")
+    repeated = stats.repeated(threshold)
+    if repeated:
+        metrics.db_repeated_statement_requests_total.inc((path,))
+        problems.extend(
+            f"ran {count} times (limit {threshold}): {' '.join(statement.split())[:200]}"
+            for statement, count in repeated.items())
+    if not problems:
+        return
+
+    message = f"Query budget exceeded for {method} {path}: " + "; ".join(problems)
+    if config.query_budget_mode == "raise":
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -1,27 +1,109 @@
-from sqlalchemy.orm import declarative_base
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from typing import Callable
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, declarative_base
+from sqlalchemy.pool import QueuePool
 
 from app.core.config import config
+from app.core.metrics import InstrumentedAsyncQueuePool
 
 Base = declarative_base()
 DATABASE_URL = config.database_url
 
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_async_engine(
-        DATABASE_URL, connect_args={"check_same_thread": False}
-    )
-else:
-    engine = create_async_engine(
-        DATABASE_URL,
+
+def is_sqlite_file(url: str) -> bool:
+    return url.startswith("sqlite") and not (":memory:" in url or url.endswith("://"))
+
+
+def _engine_options(url: str) -> dict:
+    """Build create_async_engine kwargs, with pool tuning taken from Config."""
+    options: dict = {}
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+        if not is_sqlite_file(url):
+            # In-memory databases live on a single connection; no pool to tune.
+            return options
+    options.update(
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=config.db_pool_size,
+        max_overflow=config.db_max_overflow,
+        pool_pre_ping=config.db_pool_pre_ping,
+        pool_recycle=config.db_pool_recycle,
+        pool_timeout=config.db_pool_timeout,
     )
-sessionLocal = AsyncSession(autocommit=False, autoflush=False, bind=engine)
+    return options
+
+
+def sqlite_pragmas() -> list[str]:
+    """PRAGMAs for every connection to a SQLite file, from Config.
+
+    WAL lets readers run alongside the one writer, and with it
+    synchronous=NORMAL only syncs at checkpoints. busy_timeout makes a
+    writer wait for the lock instead of failing with "database is locked".
+    """
+    return [
+        f"PRAGMA journal_mode={config.sqlite_journal_mode}",
+        f"PRAGMA synchronous={config.sqlite_synchronous}",
+        f"PRAGMA mmap_size={config.sqlite_mmap_size}",
+        f"PRAGMA cache_size=-{config.sqlite_cache_size_kib}",
+        f"PRAGMA busy_timeout={config.sqlite_busy_timeout_ms}",
+    ]
+
+
+def tune_sqlite(engine: AsyncEngine) -> None:
+    """Apply sqlite_pragmas() to each new connection of engine."""
+    pragmas = sqlite_pragmas()
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+engine = create_async_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+if is_sqlite_file(DATABASE_URL) and config.sqlite_pragmas_enabled:
+    tune_sqlite(engine)
+
+SessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 
 async def get_db():
-    async with sessionLocal as db:
-        try:
-            yield db
-        finally:
-            await db.close()
+    async with SessionLocal() as db:
+        yield db
+
+
+def after_commit(session: Session, effect: Callable[[], None]) -> None:
+    """Run effect once session's commit is durable, from an after_commit hook.
+
+    A write queue session's commit only releases a SAVEPOINT; its effects
+    wait in ``session.info["deferred_effects"]`` for the group's COMMIT.
+    """
+    deferred = session.info.get("deferred_effects")
+    if deferred is None:
+        effect()
+    else:
+        deferred.append(effect)
+
+
+def pool_stats() -> dict:
+    """Return a snapshot of the engine's connection pool usage."""
+    pool = engine.pool
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            max_overflow=config.db_max_overflow,
+            timeout=pool.timeout(),
+        )
+    return stats
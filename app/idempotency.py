@@ -0,0 +1,218 @@
+"""Idempotency-Key support for retried writes.
+
+The first request with a given (user, key) claims a row in
+``idempotency_keys`` and runs; its response is stored on the row once the
+work has committed. A retry with the same key gets the stored response
+back without touching carts, products or orders. A duplicate that arrives
+while the first is still running waits for it instead of running in
+parallel. If the first request fails, its claim is dropped so a retry can
+run again: the failing handler rolled its own changes back. If it died
+without dropping its claim (a killed worker), the claim lapses after
+``idempotency_claim_lease_seconds`` and the next retry takes the key over.
+"""
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+
+from fastapi import HTTPException, Request, Response, status
+from pydantic import TypeAdapter
+from sqlalchemy import delete, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import models
+from app.core.config import config
+from app.core.query_budget import exempt_from_budget
+from app.utils.background import PeriodicWorker
+from app.write_queue import run_write
+
+keys = models.IdempotencyKey.__table__
+
+# Wake-ups for duplicates waiting on a request running in this process;
+# duplicates that landed on another worker fall back to polling.
+_in_flight: dict[tuple[int, str], asyncio.Event] = {}
+_POLL_INTERVAL = 0.05
+
+
+async def _fingerprint(request: Request) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.url.path.encode())
+    digest.update(request.url.query.encode())
+    digest.update(await request.body())
+    return digest.hexdigest()
+
+
+def _replay(row) -> Response:
+    return Response(content=row.response_body, status_code=row.status_code,
+                    media_type="application/json",
+                    headers={"Idempotent-Replayed": "true"})
+
+
+def _lease_expired_before(now: datetime) -> datetime:
+    return now - timedelta(seconds=config.idempotency_claim_lease_seconds)
+
+
+async def _claim(db: AsyncSession, user_id: int, key: str, fingerprint: str) -> bool:
+    now = datetime.now(timezone.utc)
+    try:
+        await db.execute(insert(keys).values(
+            user_id=user_id, key=key, fingerprint=fingerprint, claimed_at=now,
+            expires_at=now + timedelta(hours=config.idempotency_key_ttl_hours),
+        ))
+        await db.commit()
+        return True
+    except IntegrityError:
+        await db.rollback()
+    # Take over a claim whose request never finished. Only one of several
+    # waiters can win, since the update re-checks the old lease.
+    with exempt_from_budget():
+        result = await db.execute(
+            update(keys)
+            .where(keys.c.user_id == user_id, keys.c.key == key,
+                   keys.c.fingerprint == fingerprint,
+                   keys.c.status_code.is_(None),
+                   keys.c.claimed_at < _lease_expired_before(now))
+            .values(claimed_at=now)
+        )
+    await db.commit()
+    return result.rowcount == 1
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite hands timestamps back without their UTC offset.
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+async def _wait_for_first(db: AsyncSession, user_id: int, key: str, fingerprint: str):
+    """Return the stored row once the first request finishes, or None if it
+    failed or was abandoned."""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + config.idempotency_wait_seconds
+    while True:
+        with exempt_from_budget():
+            row = (await db.execute(
+                select(keys).where(keys.c.user_id == user_id, keys.c.key == key))).first()
+        await db.rollback()  # don't hold a read snapshot between polls
+        if row is None:
+            return None
+        if row.fingerprint != fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_CONTENT,
+                detail="Idempotency-Key was already used for a different request"
+            )
+        if row.status_code is not None:
+            return row
+        if _as_utc(row.claimed_at) < _lease_expired_before(datetime.now(timezone.utc)):
+            return None  # abandoned; the caller takes the key over
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A request with this Idempotency-Key is still in progress",
+                headers={"Retry-After": "1"},
+            )
+        event = _in_flight.get((user_id, key))
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            else:
+                await asyncio.sleep(min(_POLL_INTERVAL, remaining))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_idempotent(
+    request: Request,
+    db: AsyncSession,
+    user_id: int,
+    key: str | None,
+    status_code: int,
+    adapter: TypeAdapter,
+    operation: Callable[[AsyncSession], Awaitable[Any]],
+) -> Any:
+    """Run operation at most once per (user_id, key) and replay its response.
+
+    The claim, and any wait for a duplicate's first request, use db. Only
+    operation and storing its response go through run_write, so a waiting
+    duplicate never holds the SQLite write queue's single writer.
+    """
+    if key is None:
+        return await run_write(db, operation)
+    if not 1 <= len(key) <= 255:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Idempotency-Key must be 1-255 characters"
+        )
+    fingerprint = await _fingerprint(request)
+
+    while not await _claim(db, user_id, key, fingerprint):
+        row = await _wait_for_first(db, user_id, key, fingerprint)
+        if row is not None:
+            return _replay(row)
+        # The first attempt failed and released the key; try to claim it.
+
+    done = _in_flight[(user_id, key)] = asyncio.Event()
+    try:
+        try:
+            body = await run_write(db, lambda db: _run_and_store(
+                db, user_id, key, status_code, adapter, operation))
+        except Exception:
+            await db.rollback()
+            await db.execute(delete(keys).where(
+                keys.c.user_id == user_id, keys.c.key == key))
+            await db.commit()
+            raise
+    finally:
+        _in_flight.pop((user_id, key), None)
+        done.set()
+    return Response(content=body, status_code=status_code,
+                    media_type="application/json")
+
+
+async def _run_and_store(db: AsyncSession, user_id: int, key: str, status_code: int,
+                         adapter: TypeAdapter, operation) -> bytes:
+    result = await operation(db)
+    body = adapter.dump_json(
+        adapter.validate_python(result, from_attributes=True))
+    await db.execute(
+        update(keys)
+        .where(keys.c.user_id == user_id, keys.c.key == key)
+        .values(status_code=status_code, response_body=body.decode())
+    )
+    await db.commit()
+    return body
+
+
+class IdempotencyKeyJanitor(PeriodicWorker):
+    """Deletes expired idempotency keys, a batch at a time."""
+
+    name = "Idempotency key cleanup"
+
+    def __init__(self, session_factory: async_sessionmaker, interval: float, batch_size: int = 1000):
+        super().__init__(interval)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.purged_total = 0
+
+    async def run_once(self) -> int:
+        now = datetime.now(timezone.utc)
+        purged = 0
+        async with self.session_factory() as db:
+            while True:
+                # Keys are only unique per user, so match on both columns.
+                expired = (
+                    select(keys.c.user_id, keys.c.key)
+                    .where(keys.c.expires_at < now)
+                    .limit(self.batch_size)
+                )
+                result = await db.execute(
+                    delete(keys).where(tuple_(keys.c.user_id, keys.c.key).in_(expired))
+                )
+                await db.commit()
+                purged += result.rowcount
+                if result.rowcount < self.batch_size:
+                    break
+        self.purged_total += purged
+        return purged
@@ -0,0 +1,382 @@
+"""Cache invalidation events shared between workers.
+
+Catalog responses, product counts and principals are cached per process.
+When a write changes one of them, the handler publishes a (table, key)
+event after its commit. The publishing worker evicts right away, and the
+backend carries the event to every other worker, where the handlers that
+subscribed to the table evict their entries. A key of None means the whole
+table.
+
+Backends (``invalidation_backend``):
+
+* ``local``: this process only, for a single worker;
+* ``sqlite``: events are rows in a small SQLite file shared by the
+  workers on one host, and each worker polls it every
+  ``invalidation_poll_interval_seconds``. Rows older than
+  ``invalidation_retention_seconds`` are pruned;
+* ``redis``: PUBLISH / SUBSCRIBE on ``invalidation_channel``, spoken
+  directly over the Redis protocol, so any Redis-compatible server works.
+
+Whatever the backend, a worker evicts within a bounded delay of the
+publish. SQLite delivers within one poll interval. Redis delivers on
+arrival, and a worker that lost its subscription clears every subscribed
+cache when it reconnects, because events may have been missed. A SQLite
+poller that fell further behind than the retention window does the same.
+``cache_invalidation_lag_seconds`` records publish-to-eviction time per
+table, measured with wall clocks since events cross processes.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+from app.core import metrics
+from app.core.config import config
+from app.utils.logger import logger
+
+Handler = Callable[[Any], None]
+
+
+class InvalidationBus:
+    """Fans (table, key) events out to this process's caches and, through
+    the backend, to the other workers."""
+
+    def __init__(self, backend: "LocalBackend"):
+        self.backend = backend
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: dict[str, list[Handler]] = defaultdict(list)
+        self._outbox: asyncio.Queue | None = None
+        self._sender: asyncio.Task | None = None
+
+    def subscribe(self, table: str, handler: Handler):
+        self._handlers[table].append(handler)
+
+    def publish(self, table: str, key: Any = None):
+        """Evict locally now and queue the event for the other workers.
+
+        Call it after the change has committed, so a worker that evicts
+        and reloads cannot read the old row back.
+        """
+        metrics.cache_invalidations_published_total.inc((table,))
+        self._evict(table, key)
+        if self._outbox is not None:
+            self._outbox.put_nowait(json.dumps({
+                "table": table, "key": key, "origin": self.origin, "sent_at": time.time()}))
+
+    def receive(self, payload: str | bytes):
+        """Apply an event delivered by the backend."""
+        try:
+            message = json.loads(payload)
+            table, key = message["table"], message.get("key")
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed invalidation event %r", payload)
+            return
+        if message.get("origin") == self.origin:
+            return
+        self._evict(table, key)
+        metrics.cache_invalidations_received_total.inc((table,))
+        if isinstance(message.get("sent_at"), (int, float)):
+            metrics.cache_invalidation_lag_seconds.observe(
+                max(0.0, time.time() - message["sent_at"]), (table,))
+
+    def evict_all(self):
+        """Clear every subscribed cache; used when events may have been lost."""
+        for table in self._handlers:
+            self._evict(table, None)
+
+    def _evict(self, table: str, key: Any):
+        for handler in self._handlers.get(table, ()):
+            try:
+                handler(key)
+            except Exception:
+                logger.exception("Invalidation handler for %s failed", table)
+
+    @property
+    def running(self) -> bool:
+        return self._sender is not None
+
+    async def start(self):
+        if self._sender is not None:
+            return
+        await self.backend.start(self)
+        self._outbox = asyncio.Queue()
+        self._sender = asyncio.create_task(self._send_forever(), name="Invalidation sender")
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+            self._outbox = None
+            await self.backend.stop()
+
+    async def _send_forever(self):
+        while True:
+            batch = [await self._outbox.get()]
+            while not self._outbox.empty():
+                batch.append(self._outbox.get_nowait())
+            try:
+                await self.backend.send(batch)
+            except Exception:
+                # Receivers still converge through the caches' TTLs.
+                logger.exception("Publishing %d invalidation events failed", len(batch))
+
+
+class LocalBackend:
+    """No transport: events never leave this process."""
+
+    async def start(self, bus: InvalidationBus):
+        self.bus = bus
+
+    async def stop(self):
+        pass
+
+    async def send(self, payloads: list[str]):
+        pass
+
+
+class SQLiteBackend(LocalBackend):
+    """Events as rows in a SQLite file that every worker on the host polls."""
+
+    def __init__(self, path: str, poll_interval: float, retention: float):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._last_id = 0
+        self._poller: asyncio.Task | None = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # The poller's connection is used from whichever executor thread
+        # runs the next poll.
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _setup(self) -> int:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "payload TEXT NOT NULL, created_at REAL NOT NULL)")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS ix_invalidations_created_at "
+                "ON invalidations (created_at)")
+            return conn.execute("SELECT coalesce(max(id), 0) FROM invalidations").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _insert(self, payloads: list[str]):
+        now = time.time()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("BEGIN")
+                conn.executemany(
+                    "INSERT INTO invalidations (payload, created_at) VALUES (?, ?)",
+                    [(payload, now) for payload in payloads])
+                conn.execute("DELETE FROM invalidations WHERE created_at < ?",
+                             (now - self.retention,))
+        finally:
+            conn.close()
+
+    def _fetch(self, conn: sqlite3.Connection) -> list[tuple[int, str]]:
+        return conn.execute(
+            "SELECT id, payload FROM invalidations WHERE id > ? ORDER BY id",
+            (self._last_id,)).fetchall()
+
+    async def start(self, bus: InvalidationBus):
+        await super().start(bus)
+        # Only events published from now on matter to a fresh worker.
+        self._last_id = await asyncio.to_thread(self._setup)
+        self._poller = asyncio.create_task(self._poll_forever(), name="Invalidation poller")
+
+    async def stop(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    async def send(self, payloads: list[str]):
+        await asyncio.to_thread(self._insert, payloads)
+
+    async def _poll_forever(self):
+        conn = await asyncio.to_thread(self._connect)
+        last_poll = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    rows = await asyncio.to_thread(self._fetch, conn)
+                except sqlite3.Error:
+                    logger.exception("Polling invalidation events failed")
+                    continue
+                if time.monotonic() - last_poll > self.retention:
+                    # Rows we never saw may have been pruned already.
+                    self.bus.evict_all()
+                last_poll = time.monotonic()
+                for row_id, payload in rows:
+                    self.bus.receive(payload)
+                    self._last_id = row_id
+        finally:
+            conn.close()
+
+
+def _resp_command(*args: str | bytes) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg.encode() if isinstance(arg, str) else arg
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    return b"".join(parts)
+
+
+async def _resp_read(reader: asyncio.StreamReader) -> Any:
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by the server")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b"+":
+        return rest.decode()
+    if kind == b"-":
+        raise ConnectionError(rest.decode())
+    if kind == b":":
+        return int(rest)
+    if kind == b"$":
+        length = int(rest)
+        if length < 0:
+            return None
+        return (await reader.readexactly(length + 2))[:-2]
+    if kind in (b"*", b">"):
+        length = int(rest)
+        return None if length < 0 else [await _resp_read(reader) for _ in range(length)]
+    raise ConnectionError(f"Unexpected reply {line!r}")
+
+
+class RedisBackend(LocalBackend):
+    """PUBLISH / SUBSCRIBE over the Redis wire protocol (RESP2)."""
+
+    def __init__(self, url: str, channel: str, connect_timeout: float = 5.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = parsed.username
+        self.password = parsed.password
+        self.channel = channel
+        self.connect_timeout = connect_timeout
+        self._publisher: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None = None
+        self._subscriber: asyncio.Task | None = None
+        self.reconnects = 0
+
+    async def _connect(self):
+        # Without a bound, an unreachable host would stall the sender for
+        # the OS's TCP timeout while events pile up in the outbox.
+        try:
+            return await asyncio.wait_for(self._open(), timeout=self.connect_timeout)
+        except asyncio.TimeoutError:
+            raise ConnectionError(f"Timed out connecting to {self.host}:{self.port}")
+
+    async def _open(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            credentials = ([self.username] if self.username else []) + [self.password]
+            writer.write(_resp_command("AUTH", *credentials))
+            try:
+                await _resp_read(reader)
+            except BaseException:
+                writer.close()
+                raise
+        return reader, writer
+
+    async def start(self, bus: InvalidationBus):
+        await super().start(bus)
+        subscribed = asyncio.get_running_loop().create_future()
+        self._subscriber = asyncio.create_task(
+            self._subscribe_forever(subscribed), name="Invalidation subscriber")
+        try:
+            await asyncio.wait_for(asyncio.shield(subscribed), timeout=5.0)
+        except asyncio.TimeoutError:
+            logger.warning("Redis at %s:%s not reachable yet; will keep retrying",
+                           self.host, self.port)
+
+    async def stop(self):
+        if self._subscriber is not None:
+            self._subscriber.cancel()
+            try:
+                await self._subscriber
+            except asyncio.CancelledError:
+                pass
+            self._subscriber = None
+        if self._publisher is not None:
+            self._publisher[1].close()
+            self._publisher = None
+
+    async def send(self, payloads: list[str]):
+        if self._publisher is None:
+            self._publisher = await self._connect()
+        reader, writer = self._publisher
+        try:
+            writer.write(b"".join(_resp_command("PUBLISH", self.channel, payload)
+                                  for payload in payloads))
+            for _ in payloads:
+                await _resp_read(reader)
+        except (OSError, ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            self._publisher = None
+            raise
+
+    async def _subscribe_forever(self, subscribed: asyncio.Future):
+        delay = 0.1
+        while True:
+            writer = None
+            try:
+                reader, writer = await self._connect()
+                writer.write(_resp_command("SUBSCRIBE", self.channel))
+                await _resp_read(reader)  # ["subscribe", channel, 1]
+                if subscribed.done():
+                    # Anything published while we were away is lost.
+                    self.reconnects += 1
+                    self.bus.evict_all()
+                else:
+                    subscribed.set_result(None)
+                delay = 0.1
+                while True:
+                    message = await _resp_read(reader)
+                    if isinstance(message, list) and len(message) == 3 and message[0] == b"message":
+                        self.bus.receive(message[2])
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ConnectionError, asyncio.IncompleteReadError) as exc:
+                logger.warning("Invalidation subscription lost (%s); retrying in %.1fs", exc, delay)
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 5.0)
+
+
+def create_backend(name: str) -> LocalBackend:
+    if name == "sqlite":
+        return SQLiteBackend(config.invalidation_sqlite_path,
+                             config.invalidation_poll_interval_seconds,
+                             config.invalidation_retention_seconds)
+    if name == "redis":
+        return RedisBackend(config.invalidation_redis_url, config.invalidation_channel)
+    if name == "local":
+        return LocalBackend()
+    raise ValueError(f"Unknown invalidation backend {name!r}")
+
+
+invalidation_bus = InvalidationBus(create_backend(config.invalidation_backend))
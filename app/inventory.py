@@ -0,0 +1,72 @@
+"""Set-based stock reservation.
+
+Every stock change is a single conditional UPDATE, so the availability
+check and the decrement happen atomically in the database: concurrent
+carts can never take a product below zero, and nothing is locked beyond
+the one product row for the length of the statement.
+"""
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+RESERVED_PRODUCT_COLUMNS = (
+    models.Product.id,
+    models.Product.name,
+    models.Product.description,
+    models.Product.price,
+    models.Product.category_id,
+)
+
+
+async def reserve_stock(db: AsyncSession, product_id: int, quantity: int):
+    """Take quantity units of product_id if that many are in stock.
+
+    Returns the product's (id, name, description, price, category_id) row,
+    or None when the product is missing or has too little stock.
+    """
+    statement = (
+        update(models.Product)
+        .where(models.Product.id == product_id,
+               models.Product.stock_quantity >= quantity)
+        .values(stock_quantity=models.Product.stock_quantity - quantity)
+        .execution_options(synchronize_session=False)
+    )
+    if db.bind.dialect.update_returning:
+        result = await db.execute(statement.returning(*RESERVED_PRODUCT_COLUMNS))
+        return result.first()
+    result = await db.execute(statement)
+    if result.rowcount != 1:
+        return None
+    result = await db.execute(
+        select(*RESERVED_PRODUCT_COLUMNS).where(models.Product.id == product_id))
+    return result.first()
+
+
+async def release_stock(db: AsyncSession, product_id: int, quantity: int) -> bool:
+    """Put quantity units of product_id back; False if the product is gone."""
+    result = await db.execute(
+        update(models.Product)
+        .where(models.Product.id == product_id)
+        .values(stock_quantity=models.Product.stock_quantity + quantity)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def adjust_stock_batch(db: AsyncSession, deltas: dict[int, int]) -> bool:
+    """Take deltas[product_id] units of every product at once (negative gives back).
+
+    One UPDATE covers every product; a product only matches if it can give
+    up its delta, so the batch applies in full or the caller rolls back.
+    Returns False when any product is missing or short of stock.
+    """
+    delta = case(deltas, value=models.Product.id)
+    result = await db.execute(
+        update(models.Product)
+        .where(models.Product.id.in_(deltas),
+               models.Product.stock_quantity >= delta)
+        .values(stock_quantity=models.Product.stock_quantity - delta)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == len(deltas)
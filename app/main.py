@@ -1,12 +1,57 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from app.core.middleware import add_process_time_header, add_request_id_header
+from app.core import metrics
+from app.core.middleware import RequestContextMiddleware
 from app.routers import cart, category, orders
 from .routers import products, auth
-from .database import engine
+from .core.config import config
+from .database import SessionLocal, engine, pool_stats
+from .idempotency import IdempotencyKeyJanitor
+from .invalidation import invalidation_bus
+from .replicas import SQLiteReplicator, replicas, replicator
+from .reservations import ReservationSweeper
+from .utils.oauth2 import password_executor
+from .write_queue import write_queue, write_queue_supported
 
+reservation_sweeper = ReservationSweeper(
+    SessionLocal,
+    interval=config.reservation_sweep_interval_seconds,
+    batch_size=config.reservation_sweep_batch_size,
+)
+idempotency_janitor = IdempotencyKeyJanitor(
+    SessionLocal, interval=config.idempotency_cleanup_interval_seconds)
+loop_lag_monitor = metrics.EventLoopLagMonitor(
+    interval=config.event_loop_lag_interval_seconds)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if config.reservation_sweeper_enabled:
+        reservation_sweeper.start()
+    if config.idempotency_janitor_enabled:
+        idempotency_janitor.start()
+    if write_queue_supported():
+        write_queue.start()
+    if config.sqlite_replica_sync_interval_seconds > 0 and SQLiteReplicator.supported(
+            replicator.primary_url, replicator.replica_urls):
+        await replicator.run_once()
+        replicator.start()
+    await invalidation_bus.start()
+    loop_lag_monitor.start()
+    yield
+    await loop_lag_monitor.stop()
+    await invalidation_bus.stop()
+    await idempotency_janitor.stop()
+    await reservation_sweeper.stop()
+    await write_queue.stop()
+    await replicator.stop()
+    await replicas.dispose()
+    password_executor.shutdown()
+    await engine.dispose()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -15,6 +60,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(RequestContextMiddleware)
 
 app.include_router(products.router)
 app.include_router(auth.router)
@@ -23,16 +69,6 @@ app.include_router(orders.router)
 app.include_router(category.router)
 
 
-@app.middleware("http")
-async def process_time_middleware(request, call_next):
-    return await add_process_time_header(request, call_next)
-
-
-@app.middleware("http")
-async def request_id_middleware(request, call_next):
-    return await add_request_id_header(request, call_next)
-
-
 @app.get("/health", tags=["health"])
 async def health_check():
     return {
@@ -42,6 +78,35 @@ async def health_check():
     }
 
 
+@app.get("/health/pool", tags=["health"])
+async def pool_health():
+    return pool_stats()
+
+
+@app.get("/health/reservations", tags=["health"])
+async def reservation_health():
+    return reservation_sweeper.stats()
+
+
+@app.get("/health/write-queue", tags=["health"])
+async def write_queue_health():
+    return write_queue.stats()
+
+
+@app.get("/health/invalidation", tags=["health"])
+async def invalidation_health():
+    return {"backend": config.invalidation_backend, "running": invalidation_bus.running}
+
+
+@app.get("/metrics", tags=["health"])
+async def read_metrics():
+    stats = pool_stats()
+    for state in ("checked_in", "checked_out", "overflow"):
+        if state in stats:
+            metrics.db_pool_connections.set(stats[state], (state,))
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/")
 def root():
     return {"message": "Welcome to ShopScale API"}
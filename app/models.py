@@ -1,4 +1,4 @@
-from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String, func
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, func
 from .database import Base
 from sqlalchemy.orm import relationship
 
@@ -45,6 +45,21 @@ class Product(Base):
     order_items = relationship("OrderItem", back_populates="product")
     cart_items = relationship("CartItem", back_populates="product")
 
+    # (sort key, id) pairs backing keyset pagination on GET /products, and
+    # the same pairs behind category_id for the category filter.
+    __table_args__ = (
+        Index("ix_products_price_id", "price", "id"),
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_name_id", "name", "id"),
+        Index("ix_products_category_id_id", "category_id", "id"),
+        Index("ix_products_category_id_price_id",
+              "category_id", "price", "id"),
+        Index("ix_products_category_id_created_at_id",
+              "category_id", "created_at", "id"),
+        Index("ix_products_category_id_name_id",
+              "category_id", "name", "id"),
+    )
+
 
 class Order(Base):
     __tablename__ = "orders"
@@ -57,6 +72,11 @@ class Order(Base):
     user = relationship("User", back_populates="orders")
     order_items = relationship("OrderItem", back_populates="order")
 
+    __table_args__ = (
+        Index("ix_orders_user_id_created_at_id",
+              "user_id", "created_at", "id"),
+    )
+
 
 class OrderItem(Base):
     __tablename__ = "order_items"
@@ -71,6 +91,10 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="order_items")
     product = relationship("Product", back_populates="order_items")
 
+    __table_args__ = (
+        Index("ix_order_items_order_id", "order_id"),
+    )
+
 
 class Cart(Base):
     __tablename__ = "carts"
@@ -91,7 +115,36 @@ class CartItem(Base):
     cart_id = Column(Integer, ForeignKey("carts.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     quantity = Column(Integer, nullable=False, server_default='1', default=1)
+    # Stock held for this line is released by the sweeper after this time.
+    reserved_until = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True),
                         nullable=False, server_default=func.now())
     cart = relationship("Cart", back_populates="cart_items")
     product = relationship("Product", back_populates="cart_items")
+
+    __table_args__ = (
+        # One line per product, so concurrent adds can't both insert one.
+        Index("ix_cart_items_cart_id_product_id",
+              "cart_id", "product_id", unique=True),
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    # Hash of method, path, query and body; a key reused for a different
+    # request is rejected rather than replayed.
+    fingerprint = Column(String(64), nullable=False)
+    # NULL while the first request is still running.
+    status_code = Column(Integer, nullable=True)
+    response_body = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True),
+                        nullable=False, server_default=func.now())
+    # When the running request claimed the key. A claim older than
+    # idempotency_claim_lease_seconds with no response belongs to a request
+    # that died, and the next retry takes it over.
+    claimed_at = Column(DateTime(timezone=True),
+                        nullable=False, server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
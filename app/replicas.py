@@ -0,0 +1,165 @@
+"""Read replicas for endpoints that only read.
+
+``get_read_db`` gives such endpoints a session on one of the replicas in
+``database_replica_urls``, taken round robin. A user who has just written
+is sent to the primary instead for ``read_your_writes_seconds``, so a new
+order or cart line shows up in their next read even while the replicas
+lag. A write is noticed when a session that ran an INSERT, UPDATE or
+DELETE commits, and it is credited to the caller that app.utils.oauth2
+resolved for the request. The record of recent writers is per process,
+like the other in-process caches. Anonymous reads always go to a replica.
+Without replicas configured, ``get_read_db`` is just ``get_db``. The shared
+catalog response cache is kept consistent with this in
+app.utils.response_cache.
+
+For local testing, ``SQLiteReplicator`` stands in for replication between
+SQLite files. Every ``sqlite_replica_sync_interval_seconds`` it copies the
+primary into each replica with SQLite's online backup API, which gives
+replicas that lag by up to one interval.
+"""
+import asyncio
+import itertools
+import sqlite3
+
+from fastapi import Depends, Request
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.core.config import config
+from app.database import (
+    DATABASE_URL, _engine_options, after_commit, get_db, is_sqlite_file, tune_sqlite)
+from app.utils.background import PeriodicWorker
+from app.utils.cache import TTLCache
+from app.utils.oauth2 import current_user_id, decode_access_token
+
+
+class ReplicaSet:
+    """Engines for the replica URLs, handed out round robin."""
+
+    def __init__(self, urls: list[str]):
+        self.configure(urls)
+
+    def configure(self, urls: list[str]):
+        self.urls = list(urls)
+        self.engines = []
+        for url in self.urls:
+            engine = create_async_engine(url, **_engine_options(url))
+            if is_sqlite_file(url) and config.sqlite_pragmas_enabled:
+                tune_sqlite(engine)
+            self.engines.append(engine)
+        self._sessions = [
+            async_sessionmaker(bind=engine, class_=AsyncSession,
+                               autoflush=False, expire_on_commit=False)
+            for engine in self.engines
+        ]
+        self._next = itertools.cycle(self._sessions)
+
+    def __bool__(self) -> bool:
+        return bool(self._sessions)
+
+    def session(self) -> AsyncSession:
+        return next(self._next)()
+
+    async def dispose(self):
+        for engine in self.engines:
+            await engine.dispose()
+
+
+replicas = ReplicaSet(config.database_replica_urls)
+
+recent_writers = TTLCache(maxsize=100000, ttl=config.read_your_writes_seconds)
+
+
+def _caller_id(request: Request) -> int | None:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(decode_access_token(token)["id"])
+    except Exception:
+        # Rejecting bad tokens is the endpoint's own auth dependency's job.
+        return None
+
+
+def is_recent_writer(request: Request) -> bool:
+    user_id = _caller_id(request)
+    return user_id is not None and recent_writers.get(user_id) is not None
+
+
+def reads_from_primary(request: Request) -> bool:
+    return not replicas or is_recent_writer(request)
+
+
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)):
+    if reads_from_primary(request):
+        yield db
+        return
+    async with replicas.session() as replica_db:
+        yield replica_db
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_statement_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_flush")
+def _note_flush_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_writer(session):
+    if session.info.pop("wrote", False):
+        user_id = current_user_id.get()
+        if user_id is not None:
+            after_commit(session, lambda: recent_writers.set(user_id, True))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
+
+
+def _sqlite_path(url: str) -> str:
+    return make_url(url).database
+
+
+def copy_sqlite_database(source: str, target: str):
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+class SQLiteReplicator(PeriodicWorker):
+    """Copies a SQLite primary into SQLite replicas: local replication lag."""
+
+    name = "SQLite replica sync"
+
+    def __init__(self, primary_url: str, replica_urls: list[str], interval: float):
+        super().__init__(interval)
+        self.primary_url = primary_url
+        self.replica_urls = replica_urls
+        self.syncs = 0
+
+    @staticmethod
+    def supported(primary_url: str, replica_urls: list[str]) -> bool:
+        return bool(replica_urls) and all(
+            is_sqlite_file(url) for url in (primary_url, *replica_urls))
+
+    async def run_once(self):
+        source = _sqlite_path(self.primary_url)
+        for url in self.replica_urls:
+            await asyncio.to_thread(copy_sqlite_database, source, _sqlite_path(url))
+        self.syncs += 1
+
+
+replicator = SQLiteReplicator(
+    DATABASE_URL, config.database_replica_urls,
+    interval=config.sqlite_replica_sync_interval_seconds)
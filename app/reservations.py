@@ -0,0 +1,108 @@
+"""Expiry of cart stock reservations.
+
+Adding to a cart takes stock immediately (see app.inventory) and stamps the
+cart line with ``reserved_until``. ReservationSweeper runs in the app's
+lifespan and hands expired lines' stock back in batches: one
+``DELETE ... RETURNING`` over an index range scan on ``reserved_until``,
+then one executemany UPDATE of the affected products per batch.
+"""
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import bindparam, delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app import models
+from app.core.config import config
+from app.utils.background import PeriodicWorker
+from app.utils.logger import logger
+
+
+def reservation_deadline() -> datetime:
+    return datetime.now(timezone.utc) + timedelta(minutes=config.cart_reservation_minutes)
+
+
+async def release_expired_batch(db: AsyncSession, now: datetime, batch_size: int) -> tuple[int, int]:
+    """Release up to batch_size expired cart lines; returns (rows, units)."""
+    expired_ids = (
+        select(models.CartItem.id)
+        .where(models.CartItem.reserved_until < now)
+        .order_by(models.CartItem.reserved_until)
+        .limit(batch_size)
+    )
+    # Re-check the deadline in the DELETE itself so a line refreshed by a
+    # concurrent add after the scan is left alone.
+    result = await db.execute(
+        delete(models.CartItem.__table__)
+        .where(models.CartItem.id.in_(expired_ids),
+               models.CartItem.reserved_until < now)
+        .returning(models.CartItem.product_id, models.CartItem.quantity)
+    )
+    released: dict[int, int] = defaultdict(int)
+    rows = 0
+    for product_id, quantity in result:
+        released[product_id] += quantity
+        rows += 1
+    if released:
+        products = models.Product.__table__
+        await db.execute(
+            update(products)
+            .where(products.c.id == bindparam("product_id"))
+            .values(stock_quantity=products.c.stock_quantity + bindparam("units")),
+            [{"product_id": product_id, "units": units}
+             for product_id, units in released.items()],
+        )
+    await db.commit()
+    return rows, sum(released.values())
+
+
+class ReservationSweeper(PeriodicWorker):
+    name = "Cart reservation sweep"
+
+    def __init__(self, session_factory: async_sessionmaker, interval: float, batch_size: int):
+        super().__init__(interval)
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.runs = 0
+        self.rows_reclaimed_total = 0
+        self.last_run: dict = {}
+
+    async def sweep(self) -> dict:
+        """Release every reservation that has expired as of now."""
+        started = time.perf_counter()
+        now = datetime.now(timezone.utc)
+        rows_total = units_total = batches = 0
+        async with self.session_factory() as db:
+            while True:
+                rows, units = await release_expired_batch(db, now, self.batch_size)
+                rows_total += rows
+                units_total += units
+                batches += 1
+                if rows < self.batch_size:
+                    break
+        self.runs += 1
+        self.rows_reclaimed_total += rows_total
+        self.last_run = {
+            "rows_reclaimed": rows_total,
+            "units_released": units_total,
+            "batches": batches,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if rows_total:
+            logger.info("Released %d expired cart reservations (%d units) in %.1fms",
+                        rows_total, units_total, self.last_run["duration_ms"])
+        return self.last_run
+
+    async def run_once(self):
+        await self.sweep()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "rows_reclaimed_total": self.rows_reclaimed_total,
+            "last_run": self.last_run,
+        }
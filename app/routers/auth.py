@@ -3,9 +3,12 @@ from fastapi import APIRouter, status, HTTPException, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy import select
 from app.database import get_db
+from app.replicas import get_read_db
 from .. import schemas, models
-from app.utils.oauth2 import get_password_hash, is_admin, verify_password, get_current_user, create_access_token, get_token_data
+from app.utils.fast_json import json_response, rows_as_dicts, schema_columns
+from app.utils.oauth2 import get_password_hash_async, is_admin, verify_password_async, get_current_user, create_access_token, get_token_data
 from sqlalchemy.ext.asyncio import AsyncSession
+from app.write_queue import run_write
 
 router = APIRouter(
     prefix="/auth",
@@ -24,8 +27,11 @@ async def register_user(user_create: schemas.UserCreate, db: AsyncSession = Depe
             detail="Email already registered"
         )
 
-    hashed_password = get_password_hash(user_create.password)
+    hashed_password = await get_password_hash_async(user_create.password)
+    return await run_write(db, lambda db: _create_user(db, user_create, hashed_password))
 
+
+async def _create_user(db: AsyncSession, user_create: schemas.UserCreate, hashed_password: str) -> models.User:
     new_user = models.User(
         full_name=user_create.fullname,
         email=user_create.email,
@@ -42,16 +48,22 @@ async def register_user(user_create: schemas.UserCreate, db: AsyncSession = Depe
     return new_user
 
 
+# is_active is stored as an integer; compare it so it comes back a bool.
+USER_COLUMNS = schema_columns(schemas.User, models.User.__table__,
+                              is_active=models.User.is_active != 0)
+USER_FIELDS = list(schemas.User.model_fields)
+
+
 @router.get("/users", response_model=List[schemas.User], dependencies=[Depends(is_admin)])
-async def get_all_users(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.User).where(models.User.role == "client"))
-    user = result.scalars().all()
+async def get_all_users(db: AsyncSession = Depends(get_read_db)):
+    result = await db.execute(select(*USER_COLUMNS).where(models.User.role == "client"))
+    user = rows_as_dicts(result, USER_FIELDS)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="No users found"
         )
-    return user
+    return json_response(user)
 
 
 @router.post("/login", response_model=schemas.Token)
@@ -64,7 +76,7 @@ async def login_user(form_data: OAuth2PasswordRequestForm = Depends(), db: Async
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email not registered"
         )
-    if not verify_password(form_data.password, str(user.hashed_password)):
+    if not await verify_password_async(form_data.password, str(user.hashed_password)):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Wrong password"
@@ -1,11 +1,19 @@
-from fastapi import Depends, HTTPException, APIRouter, status
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+from collections import Counter
 from typing import List
+from fastapi import Depends, Header, HTTPException, APIRouter, Query, Request, status
+from pydantic import TypeAdapter
+from sqlalchemy import case, delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
 from app.database import get_db
+from app.checkout import place_order
+from app.core.query_budget import query_budget
+from app.idempotency import run_idempotent
+from app.inventory import adjust_stock_batch, release_stock, reserve_stock
+from app.reservations import reservation_deadline
+from app.utils.fast_json import json_response, schema_columns
 from app.utils.oauth2 import get_current_user
-from sqlalchemy.orm import joinedload, selectinload
 
 router = APIRouter(
     prefix="/cart",
@@ -13,166 +21,316 @@ router = APIRouter(
 )
 
 
+PRODUCT_IN_CART_COLUMNS = schema_columns(
+    schemas.ProductInCart, models.Product.__table__)
+PRODUCT_IN_CART_FIELDS = list(schemas.ProductInCart.model_fields)
+
+
 @router.get("/", status_code=status.HTTP_200_OK, response_model=List[schemas.CartItemInList])
+@query_budget(2)
 async def get_cart_items(db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    result = await db.execute(select(models.Cart).filter(models.Cart.user_id == current_user.id))
-    cart = result.scalars().first()
-    if not cart:
-        return []
-    items = (
-        await db.execute(
-            select(models.CartItem)
-            .options(joinedload(models.CartItem.product))
-            .filter(models.CartItem.cart_id == cart.id)
-        )
+    cart_id = select(models.Cart.id).filter(
+        models.Cart.user_id == current_user.id).scalar_subquery()
+    return json_response(await _list_cart_items(db, cart_id))
+
+
+async def _list_cart_items(db: AsyncSession, cart_id) -> list[dict]:
+    """The cart's lines as plain dicts shaped like schemas.CartItemInList."""
+    rows = await db.execute(
+        select(models.CartItem.id, models.CartItem.quantity,
+               *PRODUCT_IN_CART_COLUMNS)
+        .join(models.Product, models.Product.id == models.CartItem.product_id)
+        .filter(models.CartItem.cart_id == cart_id)
+        .order_by(models.CartItem.id)
     )
-    items = items.scalars().all()
-    return items
+    return [
+        {"id": row[0],
+         "product": dict(zip(PRODUCT_IN_CART_FIELDS, row[2:])),
+         "quantity": row[1]}
+        for row in rows
+    ]
 
 
-@router.post("/add", status_code=status.HTTP_201_CREATED, response_model=schemas.CartItemInList)
-async def add_item_to_cart(product_add: schemas.CartItemAdd, quantity: int = 1, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    product = await db.get(models.Product, product_add.product_id)
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product with id {product_add.product_id} not found"
-        )
-    if product.stock_quantity < quantity:  # type: ignore
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Product with id {product_add.product_id} is out of stock"
-        )
+async def _get_or_create_cart_id(db: AsyncSession, user_id: int) -> int:
+    cart_id = (await db.execute(
+        select(models.Cart.id).filter(models.Cart.user_id == user_id))).scalar()
+    if cart_id is None:
+        cart = models.Cart(user_id=user_id)
+        try:
+            async with db.begin_nested():
+                db.add(cart)
+                await db.flush()
+            cart_id = cart.id
+        except IntegrityError:
+            # A concurrent first add created the cart; use that one.
+            cart_id = (await db.execute(
+                select(models.Cart.id).filter(models.Cart.user_id == user_id))).scalar_one()
+    return cart_id
 
-    result = await db.execute(
-        select(models.Cart)
-        .options(selectinload(models.Cart.cart_items).selectinload(models.CartItem.product))
-        .filter(models.Cart.user_id == current_user.id)
+
+async def _add_to_cart_item(db: AsyncSession, cart_id: int, product_id: int, quantity: int):
+    """Increase the cart line for product_id, creating it if needed; returns (id, quantity).
+
+    Either way the line's reservation is extended to a fresh deadline.
+    """
+    reserved_until = reservation_deadline()
+    add_to_line = (
+        update(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id,
+               models.CartItem.product_id == product_id)
+        .values(quantity=models.CartItem.quantity + quantity,
+                reserved_until=reserved_until)
+        .returning(models.CartItem.id, models.CartItem.quantity)
+        .execution_options(synchronize_session=False)
     )
-    cart = result.scalars().first()
-    if not cart:
-        cart = models.Cart(user_id=current_user.id)
-        db.add(cart)
-        await db.flush()
-        cart.cart_items = []
-
-    cart_item = next(
-        (item for item in cart.cart_items if item.product_id == product.id),
-        None,
+    row = (await db.execute(add_to_line)).first()
+    if row is not None:
+        return row.id, row.quantity
+    cart_item = models.CartItem(
+        cart_id=cart_id, product_id=product_id, quantity=quantity,
+        reserved_until=reserved_until)
+    try:
+        async with db.begin_nested():
+            db.add(cart_item)
+            await db.flush()
+    except IntegrityError:
+        # A concurrent add inserted the line first; add to it instead.
+        row = (await db.execute(add_to_line)).one()
+        return row.id, row.quantity
+    return cart_item.id, cart_item.quantity
+
+
+cart_item_adapter = TypeAdapter(schemas.CartItemInList)
+cart_adapter = TypeAdapter(List[schemas.CartItemInList])
+order_adapter = TypeAdapter(schemas.Order)
+
+
+@router.post("/add", status_code=status.HTTP_201_CREATED, response_model=schemas.CartItemInList)
+@query_budget(8)
+async def add_item_to_cart(request: Request, product_add: schemas.CartItemAdd, quantity: int = Query(1, ge=1), db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user), idempotency_key: str | None = Header(None)):
+    return await run_idempotent(
+        request, db, current_user.id, idempotency_key,
+        status.HTTP_201_CREATED, cart_item_adapter,
+        lambda db: _add_item(db, current_user.id, product_add.product_id, quantity),
     )
-    if cart_item:
-        cart_item.quantity += quantity  # type: ignore
-    else:
-        cart_item = models.CartItem(
-            cart_id=cart.id,
-            product_id=product.id,  # type: ignore[arg-type]
-            quantity=quantity,
+
+
+async def _add_item(db: AsyncSession, user_id: int, product_id: int, quantity: int) -> schemas.CartItemInList:
+    # Check and decrement in one statement so concurrent adds can't oversell.
+    product = await reserve_stock(db, product_id, quantity)
+    if product is None:
+        await db.rollback()
+        if await db.get(models.Product, product_id) is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with id {product_id} not found"
+            )
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Product with id {product_id} is out of stock"
         )
-        db.add(cart_item)
-        cart.cart_items.append(cart_item)
 
-    product.stock_quantity -= quantity  # type: ignore
-    await db.flush()
-    await db.refresh(cart_item, attribute_names=["product"])
+    cart_id = await _get_or_create_cart_id(db, user_id)
+    item_id, item_quantity = await _add_to_cart_item(
+        db, cart_id, product.id, quantity)
+    await db.commit()
 
-    # Build response before commit to avoid detached instance issues
-    response_payload = schemas.CartItemInList(
-        id=cart_item.id,  # type: ignore
+    return schemas.CartItemInList(
+        id=item_id,
         product=schemas.ProductInCart(
-            id=cart_item.product.id,
-            name=cart_item.product.name,
-            description=cart_item.product.description,
-            price=cart_item.product.price,
-            category_id=cart_item.product.category_id,
+            id=product.id,
+            name=product.name,
+            description=product.description,
+            price=product.price,
+            category_id=product.category_id,
         ),
-        quantity=cart_item.quantity,  # type: ignore
+        quantity=item_quantity,
     )
+
+
+@router.patch("/", status_code=status.HTTP_200_OK, response_model=List[schemas.CartItemInList])
+@query_budget(11)
+async def update_cart(request: Request, changes: List[schemas.CartItemChange], db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user), idempotency_key: str | None = Header(None)):
+    return await run_idempotent(
+        request, db, current_user.id, idempotency_key,
+        status.HTTP_200_OK, cart_adapter,
+        lambda db: _apply_cart_changes(db, current_user.id, changes),
+    )
+
+
+async def _apply_cart_changes(db: AsyncSession, user_id: int, changes: List[schemas.CartItemChange]):
+    """Apply every (product_id, quantity delta) in one transaction.
+
+    Stock for all products is checked and moved by a single UPDATE, the
+    existing cart lines by another, and new lines by one executemany
+    INSERT, so a whole basket sync costs the same handful of statements
+    and one commit however many products it touches.
+    """
+    deltas = Counter()
+    for change in changes:
+        deltas[change.product_id] += change.quantity
+    deltas = {product_id: delta for product_id,
+              delta in deltas.items() if delta}
+
+    cart_id = await _get_or_create_cart_id(db, user_id)
+    if deltas:
+        in_cart = dict((await db.execute(
+            select(models.CartItem.product_id, models.CartItem.quantity)
+            .where(models.CartItem.cart_id == cart_id,
+                   models.CartItem.product_id.in_(deltas))
+        )).all())
+        for product_id, delta in deltas.items():
+            if product_id not in in_cart and delta < 0:
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Product with id {product_id} not in cart"
+                )
+            if in_cart.get(product_id, 0) + delta < 0:
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Cannot remove more items than present in cart"
+                )
+
+        if not await adjust_stock_batch(db, deltas):
+            await db.rollback()
+            await _raise_stock_error(db, deltas)
+
+        reserved_until = reservation_deadline()
+        existing = {product_id: deltas[product_id] for product_id in in_cart}
+        if existing:
+            delta = case(existing, value=models.CartItem.product_id)
+            values = {"quantity": models.CartItem.quantity + delta}
+            extended = {product_id: reserved_until for product_id,
+                        change in existing.items() if change > 0}
+            if extended:
+                values["reserved_until"] = case(
+                    extended, value=models.CartItem.product_id,
+                    else_=models.CartItem.reserved_until)
+            result = await db.execute(
+                update(models.CartItem)
+                .where(models.CartItem.cart_id == cart_id,
+                       models.CartItem.product_id.in_(existing),
+                       models.CartItem.quantity + delta >= 0)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount != len(existing):
+                # A concurrent removal got there first.
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Cart changed while updating; please retry"
+                )
+        new_lines = [
+            {"cart_id": cart_id, "product_id": product_id,
+             "quantity": delta, "reserved_until": reserved_until}
+            for product_id, delta in deltas.items() if product_id not in in_cart
+        ]
+        if new_lines:
+            try:
+                await db.execute(insert(models.CartItem), new_lines)
+            except IntegrityError:
+                # A concurrent add created one of these lines.
+                await db.rollback()
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Cart changed while updating; please retry"
+                )
+        await db.execute(
+            delete(models.CartItem)
+            .where(models.CartItem.cart_id == cart_id,
+                   models.CartItem.product_id.in_(deltas),
+                   models.CartItem.quantity <= 0)
+            .execution_options(synchronize_session=False)
+        )
     await db.commit()
+    return await _list_cart_items(db, cart_id)
 
-    return response_payload
+
+async def _raise_stock_error(db: AsyncSession, deltas: dict[int, int]):
+    """Explain why the batch stock update did not match every product."""
+    stock = dict((await db.execute(
+        select(models.Product.id, models.Product.stock_quantity)
+        .where(models.Product.id.in_(deltas))
+    )).all())
+    for product_id in deltas:
+        if product_id not in stock:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product with id {product_id} not found"
+            )
+    for product_id, delta in deltas.items():
+        if stock[product_id] < delta:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Product with id {product_id} is out of stock"
+            )
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="Stock changed while updating; please retry"
+    )
 
 
 @router.delete("/{product_remove}", status_code=status.HTTP_204_NO_CONTENT)
-async def remove_item_from_cart(product_remove: int, quantity: int = 1, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    result = await db.execute(select(models.Cart).filter(models.Cart.user_id == current_user.id))
-    cart = result.scalars().first()
-    if not cart:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Cart not found"
-        )
-    result = await db.execute(select(models.CartItem).filter(models.CartItem.cart_id ==
-                                                             cart.id, models.CartItem.product_id == product_remove))
-    cart_item = result.scalars().first()
-    if not cart_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product not in cart"
-        )
-    if cart_item.quantity < quantity:  # type: ignore
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Cannot remove more items than present in cart"
-        )
-    result = await db.execute(select(models.Product).filter(models.Product.id == product_remove))
-    product = result.scalars().first()
-    if not product:
+@query_budget(5)
+async def remove_item_from_cart(product_remove: int, quantity: int = Query(1, ge=1), db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
+    cart_id = select(models.Cart.id).filter(
+        models.Cart.user_id == current_user.id).scalar_subquery()
+    result = await db.execute(
+        update(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id,
+               models.CartItem.product_id == product_remove,
+               models.CartItem.quantity >= quantity)
+        .values(quantity=models.CartItem.quantity - quantity)
+        .returning(models.CartItem.id, models.CartItem.quantity)
+        .execution_options(synchronize_session=False)
+    )
+    cart_item = result.first()
+    if cart_item is None:
+        await db.rollback()
+        await _raise_remove_error(db, current_user.id, product_remove)
+    if not await release_stock(db, product_remove, quantity):
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Product not in inventory"
         )
-    cart_item.quantity -= quantity  # type: ignore
-    product.stock_quantity += quantity  # type: ignore
-    if cart_item.quantity == 0:  # type: ignore
-        await db.delete(cart_item)
+    if cart_item.quantity == 0:
+        await db.execute(
+            delete(models.CartItem).where(models.CartItem.id == cart_item.id))
     await db.commit()
     return
 
 
-@router.post("/checkout", status_code=status.HTTP_200_OK, response_model=schemas.Order)
-async def checkout_cart(db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user)):
-    result = await db.execute(select(models.Cart).filter(
-        models.Cart.user_id == current_user.id))
+async def _raise_remove_error(db: AsyncSession, user_id: int, product_id: int):
+    """Explain why the conditional cart decrement matched nothing."""
+    result = await db.execute(select(models.Cart).filter(models.Cart.user_id == user_id))
     cart = result.scalars().first()
     if not cart:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cart not found"
         )
-    result = await db.execute(
-        select(models.CartItem)
-        .options(joinedload(models.CartItem.product))
-        .filter(models.CartItem.cart_id == cart.id)
-    )
-    items = result.scalars().all()
-    if not items:
+    result = await db.execute(select(models.CartItem).filter(models.CartItem.cart_id ==
+                                                             cart.id, models.CartItem.product_id == product_id))
+    if not result.scalars().first():
         raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cart is empty"
-        )
-    total_amount = 0.0
-    order = models.Order(user_id=current_user.id, total_amount=0.0)
-    db.add(order)
-    await db.flush()
-    await db.refresh(order)
-    for item in items:
-        product: models.Product = item.product
-        order_item = models.OrderItem(
-            order_id=order.id,
-            product_id=product.id,  # type: ignore
-            quantity=item.quantity,
-            price_at_purchase=product.price  # type: ignore
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product not in cart"
         )
-        db.add(order_item)
-        total_amount += product.price * item.quantity  # type: ignore
-        await db.delete(item)
-    order.total_amount = total_amount  # type: ignore
-    order_id = order.id
-    await db.commit()
-    result = await db.execute(
-        select(models.Order)
-        .options(selectinload(models.Order.order_items))
-        .filter(models.Order.id == order_id)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Cannot remove more items than present in cart"
+    )
+
+
+@router.post("/checkout", status_code=status.HTTP_200_OK, response_model=schemas.Order)
+@query_budget(8)
+async def checkout_cart(request: Request, db: AsyncSession = Depends(get_db), current_user: schemas.User = Depends(get_current_user), idempotency_key: str | None = Header(None)):
+    return await run_idempotent(
+        request, db, current_user.id, idempotency_key,
+        status.HTTP_200_OK, order_adapter,
+        lambda db: place_order(db, current_user.id),
     )
-    order_with_items = result.scalars().unique().one()
-    return order_with_items
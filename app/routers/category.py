@@ -1,30 +1,49 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import TypeAdapter
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
+from app.core.query_budget import query_budget
 from app.database import get_db
+from app.invalidation import invalidation_bus
+from app.replicas import get_read_db
+from app.utils.fast_json import rows_as_dicts, schema_columns
 from app.utils.oauth2 import is_admin
+from app.utils.response_cache import cached_response, catalog_cache
 
 router = APIRouter(
     prefix="/categories",
     tags=["categories"],
 )
 
+CATEGORY_COLUMNS = schema_columns(schemas.Category, models.Category.__table__)
+category_adapter = TypeAdapter(schemas.Category)
+
+invalidation_bus.subscribe(
+    "categories", lambda category_id: catalog_cache.invalidate("categories"))
+
 
 @router.get("/", response_model=list[schemas.Category])
-async def read_categories(db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Category))
-    categories = result.scalars().all()
-    return categories
+@query_budget(1)
+async def read_categories(request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def build():
+        result = await db.execute(select(*CATEGORY_COLUMNS))
+        return rows_as_dicts(result, list(schemas.Category.model_fields))
+
+    return await cached_response(request, "categories", None, build)
 
 
 @router.get("/{category_id}", response_model=schemas.Category)
-async def read_category(category_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Category).filter(models.Category.id == category_id))
-    category = result.scalars().first()
-    if not category:
-        raise HTTPException(status_code=404, detail="Category not found")
-    return category
+@query_budget(1)
+async def read_category(category_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def build():
+        result = await db.execute(select(models.Category).filter(models.Category.id == category_id))
+        category = result.scalars().first()
+        if not category:
+            raise HTTPException(status_code=404, detail="Category not found")
+        return category
+
+    return await cached_response(request, "categories", category_adapter, build)
 
 
 @router.post("/add", response_model=schemas.Category, status_code=201, dependencies=[Depends(is_admin)])
@@ -32,6 +51,7 @@ async def create_category(category: schemas.CategoryCreate, db: AsyncSession = D
     db_category = models.Category(**category.model_dump())
     db.add(db_category)
     await db.commit()
+    invalidation_bus.publish("categories", db_category.id)
     await db.refresh(db_category)
     return db_category
 
@@ -45,5 +65,6 @@ async def update_category(category_id: int, category: schemas.CategoryCreate, db
     for key, value in category.model_dump().items():
         setattr(db_category, key, value)
     await db.commit()
+    invalidation_bus.publish("categories", category_id)
     await db.refresh(db_category)
     return db_category
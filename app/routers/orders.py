@@ -1,11 +1,17 @@
-from typing import List
-from fastapi import APIRouter, status, HTTPException, Depends
-from sqlalchemy import select
+from datetime import datetime
+from typing import List, Literal
+from fastapi import APIRouter, Query, Request, status, HTTPException, Depends
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
-from app.database import get_db
-from app.utils.oauth2 import get_current_user
-from sqlalchemy.orm import joinedload
+from app.core.config import config
+from app.exports import order_export_filters, stream_order_export
+from app.replicas import get_read_db
+from app.utils.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from app.utils.fast_json import json_response, rows_as_dicts, schema_columns
+from app.utils.oauth2 import get_current_user, is_admin
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_column, keyset_predicate
 
 
 router = APIRouter(
@@ -14,19 +20,158 @@ router = APIRouter(
 )
 
 
-@router.get("/", status_code=status.HTTP_200_OK, response_model=List[schemas.Order])
-async def read_orders(db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    try:
-        result = await db.execute(
-            select(models.Order)
-            .options(joinedload(models.Order.order_items))
-            .where(models.Order.user_id == current_user.id)
-            .order_by(models.Order.created_at.desc())
+async def _order_history_version(db: AsyncSession, user_id: int):
+    """(count, max id) of a user's orders.
+
+    Orders are never edited once placed, so this changes exactly when the
+    history does, and it is answered from the orders table without loading
+    any order items. Only an ETag is derived from it: a Last-Modified from
+    created_at has one-second resolution, and a second order placed in the
+    same second would be answered with a stale 304.
+    """
+    result = await db.execute(
+        select(func.count(models.Order.id), func.max(models.Order.id))
+        .where(models.Order.user_id == user_id)
+    )
+    return result.one()
+
+
+ORDER_COLUMNS = (models.Order.user_id, models.Order.total_amount,
+                 models.Order.id, models.Order.created_at)
+ORDER_ITEM_COLUMNS = schema_columns(schemas.OrderItem, models.OrderItem.__table__)
+ORDER_ITEM_FIELDS = list(schemas.OrderItem.model_fields)
+ORDER_SUMMARY_FIELDS = list(schemas.OrderSummary.model_fields)
+
+# Matches the batching selectinload uses for its IN lists.
+ORDER_ITEMS_CHUNK = 500
+
+
+def _order_summary_columns():
+    """Per-order item and unit counts, each answered by an index probe on
+    order_items.order_id for just the orders on the page."""
+    item_count = (
+        select(func.count(models.OrderItem.id))
+        .where(models.OrderItem.order_id == models.Order.id)
+        .scalar_subquery()
+    )
+    unit_count = (
+        select(func.coalesce(func.sum(models.OrderItem.quantity), 0))
+        .where(models.OrderItem.order_id == models.Order.id)
+        .scalar_subquery()
+    )
+    return schema_columns(schemas.OrderSummary, models.Order.__table__,
+                          item_count=item_count, unit_count=unit_count)
+
+
+# The one ordering order history has, recorded in its cursors.
+ORDER_HISTORY_SORT = "-created_at"
+
+
+def build_order_history_query(dialect: str, user_id: int, summary: bool):
+    """Newest-first orders for one user plus the (created_at, id) cursor values.
+
+    The order matches ix_orders_user_id_created_at_id, so a page is a range
+    scan that stops after limit rows however long the history is.
+    """
+    sort_columns = [keyset_column(models.Order.created_at, dialect),
+                    models.Order.id]
+    cursor_values = [col.label(f"cursor_{i}")
+                     for i, col in enumerate(sort_columns)]
+    columns = _order_summary_columns() if summary else ORDER_COLUMNS
+    query = (
+        select(*columns, *cursor_values)
+        .where(models.Order.user_id == user_id)
+        .order_by(*[col.desc() for col in sort_columns])
+    )
+    return query, sort_columns
+
+
+async def _load_order_items(db: AsyncSession, order_ids: list[int]) -> dict[int, list[dict]]:
+    """Items of just these orders, grouped by order id, as plain dicts."""
+    items = {order_id: [] for order_id in order_ids}
+    for start in range(0, len(order_ids), ORDER_ITEMS_CHUNK):
+        rows = await db.execute(
+            select(*ORDER_ITEM_COLUMNS)
+            .where(models.OrderItem.order_id.in_(
+                order_ids[start:start + ORDER_ITEMS_CHUNK]))
+            .order_by(models.OrderItem.order_id, models.OrderItem.id)
         )
-        orders = result.unique().scalars().all()
+        for item in rows_as_dicts(rows, ORDER_ITEM_FIELDS):
+            items[item["order_id"]].append(item)
+    return items
+
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=List[schemas.Order] | List[schemas.OrderSummary] | schemas.OrderPage | schemas.OrderSummaryPage)
+async def read_orders(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: schemas.User = Depends(get_current_user),
+    pagination: Literal["all", "cursor"] = "all",
+    cursor: str | None = None,
+    limit: int = Query(20, ge=1, le=100),
+    summary: bool = False,
+):
+    paginated = pagination == "cursor" or cursor is not None
+    after = decode_cursor(cursor, ORDER_HISTORY_SORT, 2) if cursor else None
+    try:
+        count, max_id = await _order_history_version(db, current_user.id)
+        etag = make_etag("orders", current_user.id, count,
+                         max_id, request.url.query)
+        if is_not_modified(request, etag, None):
+            return not_modified(etag, None)
+        query, sort_columns = build_order_history_query(
+            db.bind.dialect.name, current_user.id, summary)
+        if after is not None:
+            query = query.where(keyset_predicate(sort_columns, after, True))
+        if paginated:
+            # Fetch one extra row to learn whether there is a next page.
+            query = query.limit(limit + 1)
+        rows = (await db.execute(query)).all()
+        next_cursor = None
+        if paginated and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(list(rows[-1][-2:]), ORDER_HISTORY_SORT)
+
+        if summary:
+            items = rows_as_dicts(rows, ORDER_SUMMARY_FIELDS)
+        else:
+            order_items = await _load_order_items(db, [row.id for row in rows])
+            # Field order of schemas.Order.
+            items = [
+                {"user_id": row.user_id, "total_amount": row.total_amount,
+                 "id": row.id, "order_items": order_items[row.id],
+                 "created_at": row.created_at}
+                for row in rows
+            ]
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="An error occurred while fetching orders: {}".format(str(e))
         )
-    return orders
+
+    content = {"items": items, "next_cursor": next_cursor} if paginated else items
+    headers = validator_headers(etag, None)
+    headers["Cache-Control"] = "private, no-cache"
+    return json_response(content, headers=headers)
+
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+@router.get("/export", status_code=status.HTTP_200_OK, dependencies=[Depends(is_admin)])
+async def export_orders(
+    db: AsyncSession = Depends(get_read_db),
+    format: Literal["ndjson", "csv"] = "ndjson",
+    since_id: int | None = None,
+    created_from: datetime | None = None,
+    created_to: datetime | None = None,
+    batch_size: int = Query(config.order_export_batch_size, ge=1, le=50000),
+):
+    filters = order_export_filters(since_id, created_from, created_to)
+    return StreamingResponse(
+        stream_order_export(db, format, filters, batch_size),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'},
+    )
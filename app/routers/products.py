@@ -1,7 +1,19 @@
-from turtle import st
-from fastapi import APIRouter, status, HTTPException, Depends
-from sqlalchemy import select
+import sys
+from typing import Literal
+from fastapi import APIRouter, Query, Request, status, HTTPException, Depends
+from pydantic import TypeAdapter
+from sqlalchemy import func, select, text
+from app.bulk_import import import_products
+from app.core.config import config
+from app.core.query_budget import query_budget
 from app.database import get_db
+from app.invalidation import invalidation_bus
+from app.replicas import get_read_db
+from app.search import search_products
+from app.utils.cache import TTLCache
+from app.utils.fast_json import rows_as_dicts, schema_columns
+from app.utils.response_cache import cached_response, catalog_cache
+from app.utils.pagination import decode_cursor, encode_cursor, keyset_column, keyset_predicate
 from app.utils.oauth2 import get_current_user, is_admin
 from .. import schemas, models
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -12,25 +24,208 @@ router = APIRouter(
 )
 
 
-@router.get("/", response_model=list[schemas.Product], status_code=status.HTTP_200_OK)
-async def read_products(db: AsyncSession = Depends(get_db), page: int = 1, limit: int = 10):
-    skip = (page - 1) * limit
-    products = await db.execute(
-        select(models.Product).offset(skip).limit(limit))
-    return products.scalars().all()
+PRODUCT_COLUMNS = schema_columns(schemas.Product, models.Product.__table__)
+PRODUCT_FIELDS = list(schemas.Product.model_fields)
 
+SORT_FIELDS = {
+    "id": models.Product.id,
+    "price": models.Product.price,
+    "created_at": models.Product.created_at,
+    "name": models.Product.name,
+}
 
-@router.get("/{product_id}", response_model=schemas.Product, status_code=status.HTTP_200_OK)
-async def read_product(product_id: int, db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(models.Product).filter(
-        models.Product.id == product_id))
-    db_product = result.scalars().first()
-    if not db_product:
+# Exact counts are cached briefly so clients that ask for a total on every
+# page don't each pay for a COUNT(*).
+product_count_cache = TTLCache(
+    maxsize=256, ttl=config.product_count_cache_ttl_seconds)
+
+
+def _evict_products(product_id: int | None):
+    # Counts are per filter, not per product, so any change drops them all.
+    product_count_cache.clear()
+    catalog_cache.invalidate("products")
+
+
+invalidation_bus.subscribe("products", _evict_products)
+
+
+def _parse_sort(sort: str):
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    if field not in SORT_FIELDS:
         raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product not found with id {product_id}"
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Cannot sort by {field}; choose one of {', '.join(SORT_FIELDS)}"
         )
-    return db_product
+    return field, descending
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Smallest string greater than every string starting with prefix.
+
+    None when there is no such string (prefix is all U+10FFFF).
+    """
+    prefix = prefix.rstrip(chr(sys.maxunicode))
+    if not prefix:
+        return None
+    following = ord(prefix[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000  # surrogates can't be encoded; skip past them
+    return prefix[:-1] + chr(following)
+
+
+def product_filters(
+    category_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool = False,
+    name_prefix: str | None = None,
+) -> list:
+    """WHERE clauses for the catalog filters.
+
+    The name prefix is expressed as a half-open range rather than LIKE so
+    it can seek on the name indexes on both SQLite and PostgreSQL.
+    """
+    clauses = []
+    if category_id is not None:
+        clauses.append(models.Product.category_id == category_id)
+    if min_price is not None:
+        clauses.append(models.Product.price >= min_price)
+    if max_price is not None:
+        clauses.append(models.Product.price <= max_price)
+    if in_stock:
+        clauses.append(models.Product.stock_quantity > 0)
+    if name_prefix:
+        clauses.append(models.Product.name >= name_prefix)
+        upper_bound = _prefix_upper_bound(name_prefix)
+        if upper_bound is not None:
+            clauses.append(models.Product.name < upper_bound)
+    return clauses
+
+
+def build_product_query(dialect: str, sort: str, filters: list):
+    """Select product columns plus the (sort key, id) values a cursor is built from."""
+    field, descending = _parse_sort(sort)
+    sort_columns = [keyset_column(SORT_FIELDS[field], dialect)]
+    if field != "id":
+        sort_columns.append(models.Product.id)
+    ordering = [col.desc() if descending else col.asc() for col in sort_columns]
+    cursor_values = [col.label(f"cursor_{i}")
+                     for i, col in enumerate(sort_columns)]
+    query = (
+        select(*PRODUCT_COLUMNS, *cursor_values)
+        .where(*filters)
+        .order_by(*ordering)
+    )
+    return query, sort_columns, descending
+
+
+async def _count_products(db: AsyncSession, mode: str, filters: list, cache_key: tuple) -> tuple[int, bool]:
+    if mode == "estimate" and not filters:
+        dialect = db.bind.dialect.name
+        if dialect == "postgresql":
+            estimate = (await db.execute(text(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = 'products'"
+            ))).scalar()
+            if estimate is not None and estimate >= 0:
+                return int(estimate), True
+        elif dialect == "sqlite":
+            # A max() on the primary key is a single b-tree probe.
+            estimate = (await db.execute(select(func.max(models.Product.id)))).scalar()
+            return int(estimate or 0), True
+    total = product_count_cache.get(cache_key)
+    if total is None:
+        total = (await db.execute(
+            select(func.count()).select_from(models.Product).where(*filters)
+        )).scalar_one()
+        product_count_cache.set(cache_key, total)
+    return total, False
+
+
+product_adapter = TypeAdapter(schemas.Product)
+
+
+@router.get("/", response_model=list[schemas.Product] | schemas.ProductPage, status_code=status.HTTP_200_OK)
+@query_budget(2)
+async def read_products(
+    request: Request,
+    db: AsyncSession = Depends(get_read_db),
+    page: int = 1,
+    limit: int = Query(10, ge=1),
+    sort: str = "id",
+    pagination: Literal["offset", "cursor"] = "offset",
+    cursor: str | None = None,
+    count: Literal["exact", "estimate"] | None = None,
+    category_id: int | None = None,
+    min_price: float | None = None,
+    max_price: float | None = None,
+    in_stock: bool = False,
+    name_prefix: str | None = None,
+):
+    async def build():
+        filters = product_filters(
+            category_id, min_price, max_price, in_stock, name_prefix)
+        query, sort_columns, descending = build_product_query(
+            db.bind.dialect.name, sort, filters)
+
+        if pagination == "offset" and cursor is None:
+            skip = (page - 1) * limit
+            products = await db.execute(query.offset(skip).limit(limit))
+            return rows_as_dicts(products, PRODUCT_FIELDS)
+
+        if cursor:
+            query = query.where(keyset_predicate(
+                sort_columns, decode_cursor(cursor, sort, len(sort_columns)), descending))
+        # Fetch one extra row to learn whether there is a next page.
+        rows = (await db.execute(query.limit(limit + 1))).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(
+                list(rows[-1][len(PRODUCT_FIELDS):]), sort)
+
+        total, total_is_estimate = None, False
+        if count is not None:
+            cache_key = (category_id, min_price, max_price, in_stock, name_prefix)
+            total, total_is_estimate = await _count_products(
+                db, count, filters, cache_key)
+        # Same fields, in the same order, as schemas.ProductPage.
+        return {
+            "items": rows_as_dicts(rows, PRODUCT_FIELDS),
+            "next_cursor": next_cursor,
+            "total": total,
+            "total_is_estimate": total_is_estimate,
+        }
+
+    return await cached_response(request, "products", None, build)
+
+
+@router.get("/search", response_model=list[schemas.Product], status_code=status.HTTP_200_OK)
+@query_budget(1)
+async def search_catalog(
+    q: str = Query(..., min_length=1),
+    db: AsyncSession = Depends(get_read_db),
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+):
+    return await search_products(db, q, limit=limit, offset=(page - 1) * limit)
+
+
+@router.get("/{product_id}", response_model=schemas.Product, status_code=status.HTTP_200_OK)
+@query_budget(1)
+async def read_product(product_id: int, request: Request, db: AsyncSession = Depends(get_read_db)):
+    async def build():
+        result = await db.execute(select(models.Product).filter(
+            models.Product.id == product_id))
+        db_product = result.scalars().first()
+        if not db_product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Product not found with id {product_id}"
+            )
+        return db_product
+
+    return await cached_response(request, "products", product_adapter, build)
 
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.Product, dependencies=[Depends(is_admin)])
@@ -56,10 +251,43 @@ async def create_product(product: schemas.ProductCreate, db: AsyncSession = Depe
     db_product = models.Product(**product.model_dump())
     db.add(db_product)
     await db.commit()
+    invalidation_bus.publish("products", db_product.id)
     await db.refresh(db_product)
     return db_product
 
 
+IMPORT_CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+
+@router.post("/import", status_code=status.HTTP_200_OK, response_model=schemas.ProductImportReport, dependencies=[Depends(is_admin)])
+async def import_product_feed(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    format: Literal["csv", "ndjson"] | None = None,
+    batch_size: int = Query(config.bulk_import_batch_size, ge=1, le=50000),
+):
+    if format is None:
+        content_type = request.headers.get(
+            "content-type", "").split(";")[0].strip().lower()
+        format = IMPORT_CONTENT_TYPES.get(content_type)
+        if format is None:
+            raise HTTPException(
+                status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                detail="Send text/csv or application/x-ndjson, or pass ?format="
+            )
+    report = await import_products(
+        db, request.stream(), format, batch_size, config.bulk_import_max_errors,
+        config.bulk_import_max_row_length)
+    if report.rows_imported:
+        invalidation_bus.publish("products")
+    return report
+
+
 @router.put("/{product_id}", status_code=status.HTTP_200_OK, response_model=schemas.Product, dependencies=[Depends(is_admin)])
 async def update_product(product_id: int, product: schemas.ProductUpdate, db: AsyncSession = Depends(get_db)):
     if product.price is not None and product.price < 0:
@@ -73,6 +301,7 @@ async def update_product(product_id: int, product: schemas.ProductUpdate, db: As
     for key, value in product.model_dump(exclude_unset=True).items():
         setattr(db_product, key, value)
     await db.commit()
+    invalidation_bus.publish("products", product_id)
     await db.refresh(db_product)
     return db_product
 
@@ -89,4 +318,5 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
         )
     await db.delete(product)
     await db.commit()
+    invalidation_bus.publish("products", product_id)
     return
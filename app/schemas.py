@@ -67,6 +67,28 @@ class Product(ProductBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: str | None = None
+    total: int | None = None
+    total_is_estimate: bool = False
+
+
+class ImportRowError(BaseModel):
+    row: int
+    error: str
+
+
+class ProductImportReport(BaseModel):
+    rows_received: int
+    rows_imported: int
+    rows_failed: int
+    errors: List[ImportRowError] = []
+    errors_truncated: bool = False
+    seconds: float
+    rows_per_second: float
+
+
 class ProductInCart(BaseModel):
     id: int
     name: str
@@ -116,6 +138,11 @@ class CartitemRemove(BaseModel):
     quantity: int = 1
 
 
+class CartItemChange(BaseModel):
+    product_id: int
+    quantity: int
+
+
 class CartItemInList(BaseModel):
     id: int
     product: ProductInCart
@@ -158,6 +185,25 @@ class Order(OrderBase):
     model_config = ConfigDict(from_attributes=True)
 
 
+class OrderSummary(OrderBase):
+    id: int
+    created_at: datetime
+    item_count: int
+    unit_count: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+
+class OrderPage(BaseModel):
+    items: List[Order]
+    next_cursor: str | None = None
+
+
+class OrderSummaryPage(BaseModel):
+    items: List[OrderSummary]
+    next_cursor: str | None = None
+
+
 class CategoryBase(BaseModel):
     name: str
     description: Optional[str] = None
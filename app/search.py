@@ -0,0 +1,107 @@
+"""Full-text product search backed by the database's own text index.
+
+SQLite keeps an FTS5 external-content table (``products_fts``) in sync with
+``products`` through triggers; PostgreSQL uses a GIN index over a tsvector
+expression. Both are created by the Alembic migration and, for
+``Base.metadata.create_all`` (tests, local dev), by the DDL hooks below.
+"""
+import re
+
+from sqlalchemy import DDL, event, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+# Must match the GIN index expression exactly for PostgreSQL to use it.
+PG_SEARCH_VECTOR = (
+    "to_tsvector('english'::regconfig, "
+    "coalesce(products.name, '') || ' ' || coalesce(products.description, ''))"
+)
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, description,
+        content='products', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO products_fts(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+POSTGRES_DDL = [
+    f"CREATE INDEX IF NOT EXISTS ix_products_search ON products USING gin (({PG_SEARCH_VECTOR}))",
+]
+
+for statement in SQLITE_DDL:
+    event.listen(models.Product.__table__, "after_create",
+                 DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_DDL:
+    event.listen(models.Product.__table__, "after_create",
+                 DDL(statement).execute_if(dialect="postgresql"))
+event.listen(models.Product.__table__, "after_drop",
+             DDL("DROP TABLE IF EXISTS products_fts").execute_if(dialect="sqlite"))
+
+
+def _fts5_query(q: str) -> str:
+    """Turn free text into an FTS5 query: every word must match, as a prefix.
+
+    Quoting each token keeps user input from being parsed as FTS5 syntax.
+    """
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", q))
+
+
+async def search_products(db: AsyncSession, q: str, limit: int, offset: int) -> list[models.Product]:
+    dialect = db.bind.dialect.name
+    if dialect == "sqlite":
+        match = _fts5_query(q)
+        if not match:
+            return []
+        statement = text(
+            "SELECT products.* FROM products_fts "
+            "JOIN products ON products.id = products_fts.rowid "
+            "WHERE products_fts MATCH :match "
+            "ORDER BY products_fts.rank, products.id "
+            "LIMIT :limit OFFSET :offset"
+        ).bindparams(match=match, limit=limit, offset=offset)
+    elif dialect == "postgresql":
+        statement = text(
+            "SELECT products.* FROM products, "
+            "websearch_to_tsquery('english', :q) AS query "
+            f"WHERE {PG_SEARCH_VECTOR} @@ query "
+            f"ORDER BY ts_rank({PG_SEARCH_VECTOR}, query) DESC, products.id "
+            "LIMIT :limit OFFSET :offset"
+        ).bindparams(q=q, limit=limit, offset=offset)
+    else:
+        pattern = f"%{q}%"
+        result = await db.execute(
+            select(models.Product)
+            .where(or_(models.Product.name.ilike(pattern),
+                       models.Product.description.ilike(pattern)))
+            .order_by(models.Product.id)
+            .limit(limit).offset(offset)
+        )
+        return list(result.scalars().all())
+
+    result = await db.execute(
+        select(models.Product).from_statement(statement))
+    return list(result.scalars().all())
@@ -0,0 +1,47 @@
+import asyncio
+from abc import ABC, abstractmethod
+
+from app.utils.logger import logger
+
+
+class PeriodicWorker(ABC):
+    """Runs ``run_once()`` every ``interval`` seconds on the event loop.
+
+    Subclasses implement run_once(); start() and stop() are called from the
+    app lifespan.
+    """
+
+    name = "periodic worker"
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    @abstractmethod
+    async def run_once(self):
+        """One pass of the worker's job."""
+
+    async def _run_forever(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("%s failed", self.name)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
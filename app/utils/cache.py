@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Hashable, NamedTuple
+
+
+class TTLCache:
+    """A bounded LRU cache whose entries also expire after a TTL.
+
+    Bounded by entry count and, when ``maxweight`` is given, by the summed
+    ``weigher(value)`` of its entries. Safe to share between the event loop
+    and threadpool-run endpoints.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        maxweight: int | None = None,
+        weigher: Callable[[Any], int] = lambda value: 1,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.maxweight = maxweight
+        self.weigher = weigher
+        self._data: OrderedDict[Hashable, tuple[float, Any, int]] = OrderedDict()
+        self._weight = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def _remove(self, key: Hashable) -> tuple[float, Any, int]:
+        entry = self._data.pop(key)
+        self._weight -= entry[2]
+        return entry
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        weight = self.weigher(value)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        if self.maxweight is not None and weight > self.maxweight:
+            return
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + ttl, value, weight)
+            self._weight += weight
+            while len(self._data) > self.maxsize or (
+                self.maxweight is not None and self._weight > self.maxweight
+            ):
+                self._remove(next(iter(self._data)))
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return None
+            return self._remove(key)[1]
+
+    def evict_where(self, predicate: Callable[[Hashable], bool]) -> int:
+        """Drop every entry whose key matches predicate; return how many."""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self._weight = 0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "weight": self._weight,
+            "maxweight": self.maxweight,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+class ResponseCache(TTLCache):
+    """Serialized response bodies, bounded by total bytes and grouped by tag.
+
+    Keys are ``(tag, path, query)`` so one write can drop every cached view
+    of the table it touched. Values are CachedResponse tuples.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, maxsize: int = 10000):
+        super().__init__(maxsize=maxsize, ttl=ttl, maxweight=max_bytes,
+                         weigher=lambda entry: len(entry.body))
+        self._generations: dict[str, int] = {}
+        self._invalidated_at: dict[str, float] = {}
+        self._issued: dict[str, datetime] = {}
+        self._modified_floor: dict[str, datetime] = {}
+
+    def generation(self, tag: str) -> int:
+        """How many times tag has been invalidated."""
+        return self._generations.get(tag, 0)
+
+    def invalidated_within(self, tag: str, seconds: float) -> bool:
+        invalidated_at = self._invalidated_at.get(tag)
+        return invalidated_at is not None and time.monotonic() - invalidated_at < seconds
+
+    def last_modified(self, tag: str) -> datetime:
+        """Last-Modified, in whole seconds, for an entry of tag read from now.
+
+        Strictly later than any value handed out before tag's last
+        invalidation, so a client revalidating with one of those by
+        If-Modified-Since is never told a same-second write didn't happen.
+        """
+        with self._lock:
+            stamp = datetime.now(timezone.utc).replace(microsecond=0)
+            floor = self._modified_floor.get(tag)
+            if floor is not None and floor > stamp:
+                stamp = floor
+            self._issued[tag] = max(stamp, self._issued.get(tag, stamp))
+            return stamp
+
+    def set_if_current(self, key: Hashable, value: Any, generation: int) -> bool:
+        """Store value unless key's tag was invalidated since generation.
+
+        A response built from rows read before an invalidation would
+        otherwise be cached after it and outlive the write.
+        """
+        with self._lock:
+            if self.generation(key[0]) != generation:
+                return False
+            self.set(key, value)
+            return True
+
+    def invalidate(self, *tags: str) -> int:
+        with self._lock:
+            now = time.monotonic()
+            for tag in tags:
+                self._generations[tag] = self.generation(tag) + 1
+                self._invalidated_at[tag] = now
+                issued = self._issued.pop(tag, None)
+                if issued is not None:
+                    self._modified_floor[tag] = issued + timedelta(seconds=1)
+            return self.evict_where(lambda key: key[0] in tags)
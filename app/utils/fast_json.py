@@ -0,0 +1,35 @@
+"""Fast response path for high-volume list endpoints.
+
+The default path loads ORM objects, validates each one into a schema with
+``from_attributes`` and dumps the models. For plain list reads the routes
+instead select just the schema's columns, in the schema's field order,
+and encode the rows as dicts with ``pydantic_core.to_json``. That is the
+same serializer FastAPI uses for response models, so floats, datetimes
+and escaping come out byte-for-byte identical, without building a model
+per row.
+"""
+from typing import Any, Iterable, Sequence
+
+from fastapi import Response
+from pydantic_core import to_json
+
+
+def schema_columns(schema, table, **overrides) -> tuple:
+    """table's columns for each field of schema, labeled and in field order."""
+    return tuple(
+        (overrides[name] if name in overrides else table.c[name]).label(name)
+        for name in schema.model_fields
+    )
+
+
+def rows_as_dicts(rows: Iterable, fields: Sequence[str]) -> list[dict]:
+    """Map the leading len(fields) values of each row onto fields."""
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def encode(content: Any) -> bytes:
+    return to_json(content)
+
+
+def json_response(content: Any, **kwargs) -> Response:
+    return Response(content=encode(content), media_type="application/json", **kwargs)
@@ -0,0 +1,55 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
+from fastapi import HTTPException, status
+
+
+class BoundedExecutor:
+    """Run blocking calls on a dedicated thread pool with a hard backlog limit.
+
+    At most ``max_workers`` calls run at once and at most ``max_queue`` more
+    may wait for a thread; anything beyond that is refused with a 503 so a
+    burst of logins degrades into fast failures instead of unbounded latency.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, name: str = "executor"):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.name = name
+        self._executor: ThreadPoolExecutor | None = None
+        # Only touched from the event loop thread, so no lock is needed.
+        self._in_flight = 0
+        self.rejected = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queued(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=self.name)
+        self._in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    def shutdown(self) -> None:
+        """Stop the worker threads; the next run() starts a fresh pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,11 +1,17 @@
-from sqlalchemy import select
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
 from app.core.config import config
 from fastapi import Depends, HTTPException
 from pwdlib import PasswordHash
 from datetime import datetime, timedelta, timezone
 from fastapi.security import OAuth2PasswordBearer
-from app.database import get_db
+from app.database import after_commit, get_db
+from app.invalidation import invalidation_bus
 from app import models, schemas
+from app.utils.cache import TTLCache
+from app.utils.hashing import BoundedExecutor
+import contextvars
+from functools import partial
 import jwt
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -18,6 +24,27 @@ TOKEN_EXPIRY_MINUTES = 30
 
 password_hasher = PasswordHash.recommended()
 
+# argon2 releases the GIL, so hashing on a few threads keeps the event loop
+# responsive while still using spare cores.
+password_executor = BoundedExecutor(
+    max_workers=config.password_hash_workers,
+    max_queue=config.password_hash_queue_depth,
+    name="password-hash",
+)
+
+# Principals keyed by (user_id, token exp), so a fresh token never reuses
+# an entry cached for an older one.
+principal_cache = TTLCache(
+    maxsize=config.principal_cache_size,
+    ttl=config.principal_cache_ttl_seconds,
+)
+
+
+# The caller resolved for the current request, so writes can be credited
+# to them (see app.replicas).
+current_user_id: contextvars.ContextVar[int | None] = contextvars.ContextVar(
+    "current_user_id", default=None)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return password_hasher.verify(plain_password, hashed_password)
@@ -27,6 +54,14 @@ def get_password_hash(password: str) -> str:
     return password_hasher.hash(password)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_executor.run(verify_password, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    return await password_executor.run(get_password_hash, password)
+
+
 def create_access_token(data: dict, expires_delta: timedelta | None = None):
     to_encode = data.copy()
     if expires_delta:
@@ -39,16 +74,52 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     return encoded_jwt
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.User:
+def decode_access_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("id")
-        if user_id is None:
-            raise ValueError("Invalid token")
-        return await get_user(user_id=int(user_id), db=db)
     except jwt.PyJWTError as e:
         raise HTTPException(
             status_code=401, detail=str(e))
+    if payload.get("id") is None:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+
+def invalidate_principal(user_id: int) -> None:
+    """Evict every cached principal for user_id (role/active-flag changes)."""
+    principal_cache.evict_where(lambda key: key[0] == user_id)
+
+
+def _evict_principals(user_id: int | None) -> None:
+    if user_id is None:
+        principal_cache.clear()
+    else:
+        invalidate_principal(user_id)
+
+
+invalidation_bus.subscribe("users", _evict_principals)
+
+
+async def _resolve_principal(payload: dict, db: AsyncSession) -> schemas.User:
+    user_id = int(payload["id"])
+    key = (user_id, payload.get("exp"))
+    principal = principal_cache.get(key)
+    if principal is None:
+        user = await get_user(user_id=user_id, db=db)
+        principal = schemas.User.model_validate(user, from_attributes=True)
+        ttl = config.principal_cache_ttl_seconds
+        if payload.get("exp") is not None:
+            ttl = min(ttl, payload["exp"] -
+                      datetime.now(timezone.utc).timestamp())
+        principal_cache.set(key, principal, ttl=ttl)
+    if not principal.is_active:
+        raise HTTPException(status_code=401, detail="Inactive user")
+    current_user_id.set(user_id)
+    return principal
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> schemas.User:
+    return await _resolve_principal(decode_access_token(token), db)
 
 
 async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
@@ -60,12 +131,44 @@ async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
     return user
 
 
-def is_admin(user: schemas.User = Depends(get_current_user)):
+async def is_admin(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    payload = decode_access_token(token)
+    # The role claim is signed, so a non-admin token can be turned away
+    # without looking the user up at all.
+    if config.trust_token_role and payload.get("role") != "admin":
+        raise HTTPException(
+            status_code=403, detail="Not authorized as admin")
+    user = await _resolve_principal(payload, db)
     if user.role != "admin":
         raise HTTPException(
             status_code=403, detail="Not authorized as admin")
     return user
 
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    changed = session.info.setdefault("principal_changes", set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if not isinstance(obj, models.User):
+            continue
+        state = inspect(obj)
+        if obj in session.deleted or any(
+            state.attrs[name].history.has_changes()
+            for name in ("role", "is_active")
+        ):
+            changed.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _evict_changed_principals(session):
+    for user_id in session.info.pop("principal_changes", ()):
+        after_commit(session, partial(invalidation_bus.publish, "users", user_id))
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session):
+    session.info.pop("principal_changes", None)
+
 # Test
 
 
@@ -0,0 +1,76 @@
+from typing import Any, Awaitable, Callable
+
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+from app.core.config import config
+from app.replicas import is_recent_writer, replicas
+from app.utils.cache import CachedResponse, ResponseCache
+from app.utils.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from app.utils.fast_json import encode
+
+# Catalog reads (products, categories) keyed by tag; admin writes purge
+# their tag right after they commit.
+catalog_cache = ResponseCache(
+    max_bytes=config.response_cache_max_bytes,
+    ttl=config.response_cache_ttl_seconds,
+    maxsize=config.response_cache_max_entries,
+)
+
+
+async def cached_response(
+    request: Request,
+    tag: str,
+    adapter: TypeAdapter | None,
+    build: Callable[[], Awaitable[Any]],
+) -> Response:
+    """Serve the cached JSON body for this request, building it on a miss.
+
+    The body is produced exactly as FastAPI would for the route's response
+    model (validate from attributes, then dump JSON), so hits and misses are
+    byte-identical. With adapter None, build already returns plain data in
+    the response model's shape and it is encoded as is. Each entry carries
+    a content-hash ETag and a Last-Modified taken before its rows are read
+    (see ResponseCache.last_modified), so revalidations on a hit are
+    answered with 304 without touching the database.
+
+    With read replicas, a recent writer bypasses the cache, and nothing is
+    cached within ``read_your_writes_seconds`` of the tag's invalidation.
+    """
+    if replicas and is_recent_writer(request):
+        # Kept on the primary to see their own writes, which entries filled
+        # from a lagging replica may not show yet.
+        return _respond(request, await _build_entry(tag, adapter, build))
+    key = (tag, request.url.path, tuple(
+        sorted(request.query_params.multi_items())))
+    entry = catalog_cache.get(key)
+    if entry is None:
+        generation = catalog_cache.generation(tag)
+        entry = await _build_entry(tag, adapter, build)
+        # Just after a write, a replica may still return the old rows; they
+        # would outlive the purge by a whole TTL if cached now.
+        if not (replicas and catalog_cache.invalidated_within(
+                tag, config.read_your_writes_seconds)):
+            catalog_cache.set_if_current(key, entry, generation)
+    return _respond(request, entry)
+
+
+async def _build_entry(tag: str, adapter: TypeAdapter | None,
+                       build: Callable[[], Awaitable[Any]]) -> CachedResponse:
+    # Stamped first: a write committing mid-build then moves the next
+    # stamp past this one, even if the body already shows it.
+    last_modified = catalog_cache.last_modified(tag)
+    result = await build()
+    if adapter is None:
+        body = encode(result)
+    else:
+        body = adapter.dump_json(
+            adapter.validate_python(result, from_attributes=True))
+    return CachedResponse(body, make_etag(body), last_modified)
+
+
+def _respond(request: Request, entry: CachedResponse) -> Response:
+    if is_not_modified(request, entry.etag, entry.last_modified):
+        return not_modified(entry.etag, entry.last_modified)
+    return Response(content=entry.body, media_type="application/json",
+                    headers=validator_headers(entry.etag, entry.last_modified))
@@ -0,0 +1,206 @@
+"""Single-writer queue with group commit for SQLite.
+
+SQLite allows one writer at a time. When every request writes through its
+own pooled connection, concurrent adds, checkouts and registrations queue
+up on the file lock, and past busy_timeout they fail with "database is
+locked". On a SQLite file database the hot write routes hand their work
+to this queue instead, through ``run_write``.
+
+One task owns a dedicated writer connection. It takes every operation
+waiting in the queue (up to ``max_batch``), opens a single ``BEGIN
+IMMEDIATE`` transaction, runs the operations one after another, and
+commits them together: one lock acquisition and one commit for the whole
+group. Each operation gets its own session joined to that transaction
+with ``join_transaction_mode="create_savepoint"``. Its ``commit()``
+releases a SAVEPOINT and its ``rollback()`` rolls back to one, so a
+handler that fails undoes only its own work and the rest of the group
+still commits. Operations run serially and see earlier operations' rows,
+exactly as if they had committed one by one. The difference is
+durability: callers are answered only after the group's COMMIT, and if
+that fails, every operation in the group fails. For the same reason
+``after_commit`` effects (cache evictions, read-your-writes marks) are
+held until the COMMIT and dropped with the group.
+
+Operations hold the writer while they run. They must not wait on other
+requests or do slow non-database work; hash passwords before submitting.
+"""
+import asyncio
+import contextvars
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession, create_async_engine
+
+from app.core.config import config
+from app.database import DATABASE_URL, _engine_options, is_sqlite_file, tune_sqlite
+from app.utils.logger import logger
+
+T = TypeVar("T")
+Operation = Callable[[AsyncSession], Awaitable[T]]
+
+
+def create_writer_engine(url: str) -> AsyncEngine:
+    """A one-connection engine whose transactions start with BEGIN IMMEDIATE.
+
+    The driver's own implicit transaction handling is turned off so the
+    write lock is taken up front and SAVEPOINTs work.
+    """
+    options = _engine_options(url)
+    options.update(pool_size=1, max_overflow=0)
+    engine = create_async_engine(url, **options)
+    if config.sqlite_pragmas_enabled:
+        tune_sqlite(engine)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _manual_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _begin_immediate(conn):
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class WriteQueue:
+    """Runs submitted operations on one connection, committing them in groups."""
+
+    def __init__(self, url: str, max_batch: int):
+        self.url = url
+        self.max_batch = max_batch
+        self.engine: AsyncEngine | None = None
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self.groups = 0
+        self.operations = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self.engine = create_writer_engine(self.url)
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run_forever(), name="SQLite write queue")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue is not None and not self._queue.empty():
+            _fail([self._queue.get_nowait()], RuntimeError("The write queue was stopped"))
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    async def submit(self, operation: Operation[T]) -> T:
+        """Queue operation(session) and return its result once its group commits.
+
+        The operation runs in the caller's context, so its statements count
+        towards the calling request's metrics and query budget.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((operation, contextvars.copy_context(), future))
+        return await future
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "groups": self.groups,
+            "operations": self.operations,
+        }
+
+    async def _run_forever(self):
+        while True:
+            group = [await self._queue.get()]
+            while len(group) < self.max_batch and not self._queue.empty():
+                group.append(self._queue.get_nowait())
+            # Callers that gave up (client disconnected) are not run.
+            group = [item for item in group if not item[2].cancelled()]
+            if not group:
+                continue
+            try:
+                await self._commit_group(group)
+            except Exception as exc:
+                logger.exception("SQLite write group failed")
+                _fail(group, exc)
+            except asyncio.CancelledError:
+                _fail(group, RuntimeError("The write queue was stopped"))
+                raise
+
+    async def _commit_group(self, group: list):
+        outcomes = []
+        effects = []
+        async with self.engine.connect() as conn:
+            await conn.begin()
+            try:
+                for operation, context, _ in group:
+                    outcomes.append(await self._run_operation(
+                        conn, operation, context, effects))
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+        self.groups += 1
+        self.operations += len(group)
+        for effect in effects:
+            try:
+                effect()
+            except Exception:
+                logger.exception("After-commit effect of a write group failed")
+        for (_, _, future), (failed, value) in zip(group, outcomes):
+            if future.done():
+                continue
+            if failed:
+                future.set_exception(value)
+            else:
+                future.set_result(value)
+
+    async def _run_operation(self, conn: AsyncConnection, operation: Operation,
+                             context: contextvars.Context,
+                             effects: list) -> tuple[bool, Any]:
+        session = AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                               autoflush=False, expire_on_commit=False,
+                               info={"deferred_effects": effects})
+        try:
+            return False, await asyncio.create_task(
+                _run_in_session(session, operation), context=context)
+        except Exception as exc:
+            return True, exc
+
+
+def _fail(group: list, exc: BaseException):
+    for _, _, future in group:
+        if not future.done():
+            future.set_exception(exc)
+
+
+async def _run_in_session(session: AsyncSession, operation: Operation):
+    try:
+        return await operation(session)
+    except BaseException:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+write_queue = WriteQueue(DATABASE_URL, config.sqlite_write_queue_max_batch)
+
+
+def write_queue_supported(url: str = DATABASE_URL) -> bool:
+    return config.sqlite_write_queue_enabled and is_sqlite_file(url)
+
+
+async def run_write(db: AsyncSession, operation: Operation[T]) -> T:
+    """Run operation through the write queue when it is running, else on db."""
+    if write_queue.running:
+        return await write_queue.submit(operation)
+    return await operation(db)
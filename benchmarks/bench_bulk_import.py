@@ -0,0 +1,88 @@
+"""Throughput of the streaming product import by feed format and batch size.
+
+Run with::
+
+    python -m benchmarks.bench_bulk_import --rows 100000 --batch-sizes 500 5000
+
+A synthetic feed is generated in memory, fed to import_products in 64 KiB
+chunks (as a streamed request body would arrive) and the import report's
+rows/sec is printed per format and batch size.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.bulk_import import import_products
+from app.core.config import config
+from app.database import Base
+
+CHUNK_SIZE = 64 * 1024
+
+
+def make_feed(fmt: str, rows: int, category_ids: list[int]) -> bytes:
+    if fmt == "csv":
+        lines = ["name,description,price,stock_quantity,category_id"]
+        lines += [f"Product {i},Feed item {i},{1 + i % 500}.99,{i % 100},"
+                  f"{category_ids[i % len(category_ids)]}" for i in range(rows)]
+    else:
+        lines = [json.dumps({"name": f"Product {i}", "description": f"Feed item {i}",
+                             "price": 1 + i % 500 + 0.99, "stock_quantity": i % 100,
+                             "category_id": category_ids[i % len(category_ids)]})
+                 for i in range(rows)]
+    return "\n".join(lines).encode()
+
+
+async def chunked(data: bytes):
+    for i in range(0, len(data), CHUNK_SIZE):
+        yield data[i:i + CHUNK_SIZE]
+
+
+async def run(database_url: str, rows: int, batch_sizes: list[int]) -> list[dict]:
+    engine = create_async_engine(database_url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    results = []
+    for fmt in ("csv", "ndjson"):
+        for batch_size in batch_sizes:
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.drop_all)
+                await conn.run_sync(Base.metadata.create_all)
+            async with sessions() as db:
+                categories = [models.Category(name=f"C{i}") for i in range(20)]
+                db.add_all(categories)
+                await db.commit()
+                feed = make_feed(fmt, rows, [c.id for c in categories])
+                report = await import_products(
+                    db, chunked(feed), fmt, batch_size, max_errors=100,
+                    max_row_length=config.bulk_import_max_row_length)
+            assert report.rows_imported == rows, report.errors
+            results.append({
+                "format": fmt,
+                "batch_size": batch_size,
+                "rows": rows,
+                "seconds": report.seconds,
+                "rows_per_second": report.rows_per_second,
+            })
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[500, 5000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        for result in asyncio.run(run(url, args.rows, args.batch_sizes)):
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Checkout cost by cart size: the old per-line ORM path vs place_order.
+
+Run with::
+
+    python -m benchmarks.bench_checkout --sizes 1 10 100 --rounds 20
+
+For each cart size the cart is refilled before every round and both
+implementations turn it into an order; the output is the mean latency and
+the number of SQL statements each checkout sent to the database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import models
+from app.checkout import place_order
+from app.database import Base
+
+
+async def legacy_checkout(db, user_id: int):
+    """The previous checkout_cart body, kept here as the baseline."""
+    cart = (await db.execute(select(models.Cart).filter(
+        models.Cart.user_id == user_id))).scalars().first()
+    items = (await db.execute(
+        select(models.CartItem)
+        .options(joinedload(models.CartItem.product))
+        .filter(models.CartItem.cart_id == cart.id)
+    )).scalars().all()
+    total_amount = 0.0
+    order = models.Order(user_id=user_id, total_amount=0.0)
+    db.add(order)
+    await db.flush()
+    await db.refresh(order)
+    for item in items:
+        product = item.product
+        db.add(models.OrderItem(order_id=order.id, product_id=product.id,
+                                quantity=item.quantity, price_at_purchase=product.price))
+        total_amount += product.price * item.quantity
+        await db.delete(item)
+    order.total_amount = total_amount
+    order_id = order.id
+    await db.commit()
+    result = await db.execute(
+        select(models.Order)
+        .options(selectinload(models.Order.order_items))
+        .filter(models.Order.id == order_id)
+    )
+    return result.scalars().unique().one()
+
+
+async def run(database_url: str, sizes: list[int], rounds: int) -> list[dict]:
+    engine = create_async_engine(database_url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    statements = 0
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        category = models.Category(name="Bench")
+        user = models.User(email="bench@example.com", hashed_password="x")
+        db.add_all([category, user])
+        await db.flush()
+        cart = models.Cart(user_id=user.id)
+        db.add(cart)
+        db.add_all(models.Product(name=f"P{i}", price=1.0 + i, stock_quantity=10**9,
+                                  category_id=category.id) for i in range(max(sizes)))
+        await db.commit()
+        user_id, cart_id = user.id, cart.id
+        product_ids = (await db.execute(select(models.Product.id))).scalars().all()
+
+    async def fill(size: int):
+        async with sessions() as db:
+            await db.execute(insert(models.CartItem.__table__), [
+                {"cart_id": cart_id, "product_id": pid, "quantity": 2}
+                for pid in product_ids[:size]])
+            await db.commit()
+
+    results = []
+    for size in sizes:
+        for name, checkout in (("legacy", legacy_checkout), ("set_based", place_order)):
+            elapsed = 0.0
+            total_statements = 0
+            for _ in range(rounds):
+                await fill(size)
+                async with sessions() as db:
+                    statements = 0
+                    started = time.perf_counter()
+                    order = await checkout(db, user_id)
+                    elapsed += time.perf_counter() - started
+                    total_statements += statements
+                assert len(order.order_items) == size
+            results.append({
+                "path": name,
+                "lines": size,
+                "mean_ms": round(elapsed / rounds * 1000, 3),
+                "statements": total_statements // rounds,
+            })
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        for result in asyncio.run(run(url, args.sizes, args.rounds)):
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-request overhead of the request-id/timing middleware, before and after.
+
+Run with::
+
+    python -m benchmarks.bench_middleware --requests 20000
+
+"before" is the previous pair of ``@app.middleware("http")`` functions
+(two BaseHTTPMiddleware layers, ``time.time()``, an eagerly formatted INFO
+log line); "after" is RequestContextMiddleware. Both wrap the same trivial
+route and are driven straight through the ASGI interface, so the numbers
+are the middleware cost plus a constant routing baseline ("none").
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+
+from app.core.middleware import RequestContextMiddleware
+from app.utils.logger import logger
+
+
+def _build_app(mode: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    if mode == "before":
+        @app.middleware("http")
+        async def process_time_middleware(request: Request, call_next):
+            start_time = time.time()
+            response = await call_next(request)
+            response.headers["X-Process-Time"] = str(time.time() - start_time)
+            return response
+
+        @app.middleware("http")
+        async def request_id_middleware(request: Request, call_next):
+            request_id = str(uuid.uuid4())
+            logger.info(
+                f"Request ID: {request_id}: {request.method} {request.url}")
+            response = await call_next(request)
+            response.headers["X-Request-Id"] = request_id
+            return response
+    elif mode == "after":
+        app.add_middleware(RequestContextMiddleware)
+    return app
+
+
+async def _drive(app, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "GET", "scheme": "http", "path": "/ping", "raw_path": b"/ping",
+        "root_path": "", "query_string": b"", "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234), "server": ("bench", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    for _ in range(200):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter_ns()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return (time.perf_counter_ns() - started) / requests / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+    # Match production: uvicorn.error logs at INFO.
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+
+    for mode in ("none", "before", "after"):
+        app = _build_app(mode)
+        us = asyncio.run(_drive(app, args.requests))
+        print(json.dumps({"mode": mode, "requests": args.requests,
+                          "us_per_request": round(us, 2)}))
+
+
+if __name__ == "__main__":
+    main()
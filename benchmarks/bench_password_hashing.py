@@ -0,0 +1,76 @@
+"""Password hashing throughput and event-loop stall, inline vs offloaded.
+
+Run with::
+
+    python -m benchmarks.bench_password_hashing --hashes 64 --concurrency 16
+
+For each mode a ticker coroutine sleeps 1ms in a loop while the hashes run;
+the gap between when it asked to wake up and when it actually woke up is the
+event-loop stall every other request would see.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.utils.hashing import BoundedExecutor
+from app.utils.oauth2 import get_password_hash
+
+
+async def _ticker(stop: asyncio.Event, lags: list[float]):
+    interval = 0.001
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def _run(mode: str, hashes: int, concurrency: int, workers: int) -> dict:
+    executor = BoundedExecutor(
+        max_workers=workers, max_queue=hashes, name="bench-hash")
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            if mode == "inline":
+                get_password_hash(f"password-{i}")
+            else:
+                await executor.run(get_password_hash, f"password-{i}")
+
+    stop = asyncio.Event()
+    lags: list[float] = []
+    ticker = asyncio.create_task(_ticker(stop, lags))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(hashes)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    executor.shutdown()
+
+    lags.sort()
+    return {
+        "mode": mode,
+        "hashes": hashes,
+        "elapsed_s": round(elapsed, 3),
+        "hashes_per_s": round(hashes / elapsed, 1),
+        "loop_stall_p50_ms": round(lags[len(lags) // 2] * 1000, 2) if lags else None,
+        "loop_stall_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hashes", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    for mode in ("inline", "offloaded"):
+        result = asyncio.run(
+            _run(mode, args.hashes, args.concurrency, args.workers))
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
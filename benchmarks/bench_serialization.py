@@ -0,0 +1,144 @@
+"""CPU cost per 1,000 rows of the list endpoints: ORM + schema validation vs columns + to_json.
+
+Run with::
+
+    python -m benchmarks.bench_serialization --rows 5000 --rounds 5
+
+For each list shape (products, categories, cart items, orders with their
+items, users) both paths fetch the same rows from a SQLite file and encode
+the response body; the output is process CPU milliseconds per 1,000 rows
+and whether the two bodies are byte-identical.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import joinedload, selectinload
+
+from app import models, schemas
+from app.database import Base
+from app.routers.auth import USER_COLUMNS, USER_FIELDS
+from app.routers.cart import _list_cart_items
+from app.routers.category import CATEGORY_COLUMNS
+from app.routers.orders import ORDER_COLUMNS, _load_order_items
+from app.routers.products import PRODUCT_COLUMNS, PRODUCT_FIELDS
+from app.utils.fast_json import encode, rows_as_dicts
+
+
+def legacy(model, schema, *options):
+    adapter = TypeAdapter(list[schema])
+
+    async def run(db):
+        rows = (await db.execute(
+            select(model).options(*options).order_by(model.id))).scalars().unique().all()
+        return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+    return run
+
+
+async def fast_products(db):
+    rows = await db.execute(select(*PRODUCT_COLUMNS).order_by(models.Product.id))
+    return encode(rows_as_dicts(rows, PRODUCT_FIELDS))
+
+
+async def fast_categories(db):
+    rows = await db.execute(select(*CATEGORY_COLUMNS).order_by(models.Category.id))
+    return encode(rows_as_dicts(rows, list(schemas.Category.model_fields)))
+
+
+async def fast_cart_items(db):
+    return encode(await _list_cart_items(db, 1))
+
+
+async def fast_orders(db):
+    rows = (await db.execute(select(*ORDER_COLUMNS).order_by(models.Order.id))).all()
+    items = await _load_order_items(db, [row.id for row in rows])
+    return encode([
+        {"user_id": row.user_id, "total_amount": row.total_amount, "id": row.id,
+         "order_items": items[row.id], "created_at": row.created_at}
+        for row in rows])
+
+
+async def fast_users(db):
+    rows = await db.execute(select(*USER_COLUMNS).order_by(models.User.id))
+    return encode(rows_as_dicts(rows, USER_FIELDS))
+
+
+SHAPES = {
+    "products": (legacy(models.Product, schemas.Product), fast_products),
+    "categories": (legacy(models.Category, schemas.Category), fast_categories),
+    "cart_items": (legacy(models.CartItem, schemas.CartItemInList,
+                          joinedload(models.CartItem.product)), fast_cart_items),
+    "orders": (legacy(models.Order, schemas.Order,
+                      selectinload(models.Order.order_items)), fast_orders),
+    "users": (legacy(models.User, schemas.User), fast_users),
+}
+
+
+async def seed(engine, rows: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.Category), [
+            {"name": f"Category {i}", "description": f"About {i}"} for i in range(rows)])
+        await conn.execute(insert(models.Product), [
+            {"name": f"Product {i}", "description": f"Item {i}", "price": 1.5 + i,
+             "stock_quantity": i % 50, "category_id": 1 + i % rows} for i in range(rows)])
+        await conn.execute(insert(models.User), [
+            {"email": f"user{i}@example.com", "hashed_password": "x", "role": "client"}
+            for i in range(rows)])
+        await conn.execute(insert(models.Cart), [{"user_id": 1}])
+        await conn.execute(insert(models.CartItem), [
+            {"cart_id": 1, "product_id": 1 + i, "quantity": 1} for i in range(rows)])
+        # Orders carry two lines each, so "rows" counts orders here.
+        await conn.execute(insert(models.Order), [
+            {"user_id": 1, "total_amount": 3.0} for _ in range(rows)])
+        await conn.execute(insert(models.OrderItem), [
+            {"order_id": 1 + i // 2, "product_id": 1 + i % rows, "quantity": 1,
+             "price_at_purchase": 1.5} for i in range(rows * 2)])
+
+
+async def run(database_url: str, rows: int, rounds: int) -> list[dict]:
+    engine = create_async_engine(database_url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    await seed(engine, rows)
+    results = []
+    for shape, (before, after) in SHAPES.items():
+        result = {"shape": shape, "rows": rows}
+        bodies = {}
+        for name, build in (("before", before), ("after", after)):
+            cpu = 0.0
+            for _ in range(rounds):
+                async with sessions() as db:
+                    started = time.process_time()
+                    bodies[name] = await build(db)
+                    cpu += time.process_time() - started
+            result[f"{name}_cpu_ms_per_1k"] = round(cpu / rounds / rows * 1000 * 1000, 3)
+        result["speedup"] = round(
+            result["before_cpu_ms_per_1k"] / result["after_cpu_ms_per_1k"], 2)
+        result["identical"] = bodies["before"] == bodies["after"]
+        results.append(result)
+    await engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        for result in asyncio.run(run(url, args.rows, args.rounds)):
+            print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
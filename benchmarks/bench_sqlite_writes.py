@@ -0,0 +1,137 @@
+"""Concurrent write throughput on a SQLite file: untuned, PRAGMAs, write queue.
+
+Run with::
+
+    python -m benchmarks.bench_sqlite_writes --writes 5000 --concurrency 32
+
+Each write is what adding to a cart does: take a unit of stock with
+reserve_stock, add one to the cart's line for the product (inserting it
+the first time) and commit. ``--concurrency`` tasks share the writes and
+run them three ways against a fresh database file:
+
+* untuned: a pooled session per write with SQLite's defaults (rollback
+  journal, synchronous=FULL);
+* pragmas: the same, with the PRAGMAs app.database applies (WAL,
+  synchronous=NORMAL, mmap, cache, busy_timeout);
+* queue: the PRAGMAs plus app.write_queue, which runs the writes on one
+  connection and commits each group of waiting writes together.
+
+Writes/sec, failed writes (e.g. "database is locked") and, for the queue,
+the mean group size are printed per mode. Group commit pays most when
+commits sync to disk; compare with ``SQLITE_SYNCHRONOUS=FULL`` set.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.database import Base, _engine_options, tune_sqlite
+from app.inventory import reserve_stock
+from app.write_queue import WriteQueue
+
+PRODUCTS = 100
+
+
+async def add_to_cart(db, cart_id: int, product_id: int):
+    if await reserve_stock(db, product_id, 1) is None:
+        raise RuntimeError("out of stock")
+    # One line per (cart, product), as in app.routers.cart._add_to_cart_item.
+    result = await db.execute(
+        update(models.CartItem)
+        .where(models.CartItem.cart_id == cart_id,
+               models.CartItem.product_id == product_id)
+        .values(quantity=models.CartItem.quantity + 1)
+    )
+    if result.rowcount == 0:
+        await db.execute(insert(models.CartItem).values(
+            cart_id=cart_id, product_id=product_id, quantity=1))
+    await db.commit()
+
+
+async def prepare(url: str, carts: int):
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.Category).values(id=1, name="Bench"))
+        await conn.execute(insert(models.Product), [
+            {"id": i, "name": f"P{i}", "price": 1.0, "stock_quantity": 10**9, "category_id": 1}
+            for i in range(1, PRODUCTS + 1)])
+        await conn.execute(insert(models.User), [
+            {"id": i, "email": f"u{i}@bench", "hashed_password": "x"} for i in range(1, carts + 1)])
+        await conn.execute(insert(models.Cart), [
+            {"id": i, "user_id": i} for i in range(1, carts + 1)])
+    await engine.dispose()
+
+
+async def run_mode(mode: str, url: str, writes: int, concurrency: int) -> dict:
+    await prepare(url, concurrency)
+    options = _engine_options(url)
+    options.update(pool_size=concurrency, max_overflow=0)
+    engine = create_async_engine(url, **options)
+    if mode != "untuned":
+        tune_sqlite(engine)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    queue = None
+    if mode == "queue":
+        queue = WriteQueue(url, max_batch=64)
+        queue.start()
+
+    failed = 0
+    counter = iter(range(writes))
+
+    async def worker(cart_id: int):
+        nonlocal failed
+        for n in counter:
+            product_id = 1 + n % PRODUCTS
+            try:
+                if queue is not None:
+                    await queue.submit(lambda db: add_to_cart(db, cart_id, product_id))
+                else:
+                    async with sessions() as db:
+                        await add_to_cart(db, cart_id, product_id)
+            except (IntegrityError, OperationalError):
+                failed += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(cart_id) for cart_id in range(1, concurrency + 1)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "mode": mode,
+        "writes": writes,
+        "concurrency": concurrency,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "writes_per_second": round((writes - failed) / elapsed),
+    }
+    if queue is not None:
+        stats = queue.stats()
+        result["mean_group_size"] = round(stats["operations"] / stats["groups"], 1)
+        await queue.stop()
+    await engine.dispose()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writes", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--modes", nargs="+", default=["untuned", "pragmas", "queue"],
+                        choices=["untuned", "pragmas", "queue"])
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+            print(json.dumps(asyncio.run(run_mode(mode, url, args.writes, args.concurrency))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Concurrency stress test for /cart/add on a single hot product.
+
+Run with::
+
+    python -m benchmarks.bench_stock_reservation --users 200 --stock 500 --adds-per-user 5
+
+Many users hammer ``POST /cart/add`` for the same product through the ASGI
+app (httpx ASGITransport) against a scratch database. Demand exceeds stock
+on purpose; afterwards the run checks that
+
+    reserved in carts + remaining stock == initial stock, and stock >= 0
+
+i.e. zero oversell, and reports successful adds per second.
+Pass ``--database-url`` to run against PostgreSQL instead of a temp SQLite
+file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from fastapi import Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models, schemas
+from app.database import Base, get_db
+from app.main import app
+from app.utils.oauth2 import get_current_user
+
+
+async def run(database_url: str, users: int, stock: int, adds_per_user: int, concurrency: int) -> dict:
+    engine = create_async_engine(database_url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    async with sessions() as db:
+        category = models.Category(name="Bench")
+        db.add(category)
+        await db.flush()
+        product = models.Product(name="Hot SKU", price=1.0,
+                                 stock_quantity=stock, category_id=category.id)
+        db.add(product)
+        db.add_all(models.User(email=f"user{i}@bench", hashed_password="x")
+                   for i in range(users))
+        await db.commit()
+        product_id = product.id
+        user_ids = (await db.execute(select(models.User.id))).scalars().all()
+
+    async def override_get_db():
+        async with sessions() as db:
+            yield db
+
+    async def bench_user(request: Request):
+        return schemas.User(id=int(request.headers["x-bench-user"]),
+                            email="bench", is_active=True, role="client")
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_current_user] = bench_user
+
+    statuses: dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def add(user_id: int):
+            async with semaphore:
+                response = await client.post(
+                    "/cart/add", json={"product_id": product_id},
+                    headers={"x-bench-user": str(user_id)})
+                statuses[response.status_code] = statuses.get(
+                    response.status_code, 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(add(user_id) for user_id in user_ids
+                               for _ in range(adds_per_user)))
+        elapsed = time.perf_counter() - started
+
+    app.dependency_overrides.pop(get_db, None)
+    app.dependency_overrides.pop(get_current_user, None)
+
+    async with sessions() as db:
+        remaining = (await db.get(models.Product, product_id)).stock_quantity
+        reserved = (await db.execute(
+            select(func.coalesce(func.sum(models.CartItem.quantity), 0))
+            .where(models.CartItem.product_id == product_id))).scalar_one()
+    await engine.dispose()
+
+    return {
+        "attempts": users * adds_per_user,
+        "statuses": statuses,
+        "initial_stock": stock,
+        "reserved": reserved,
+        "remaining": remaining,
+        "oversold": max(0, reserved - stock),
+        "consistent": reserved + remaining == stock and remaining >= 0,
+        "elapsed_s": round(elapsed, 3),
+        "successful_adds_per_s": round(statuses.get(201, 0) / elapsed, 1),
+        "requests_per_s": round(users * adds_per_user / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--stock", type=int, default=500)
+    parser.add_argument("--adds-per-user", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = args.database_url or f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}"
+        result = asyncio.run(run(url, args.users, args.stock,
+                                 args.adds_per_user, args.concurrency))
+    print(json.dumps(result))
+    if not result["consistent"]:
+        raise SystemExit("stock invariant violated")
+
+
+if __name__ == "__main__":
+    main()
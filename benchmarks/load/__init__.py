@@ -0,0 +1,25 @@
+"""Mixed-workload load test for the shopping flow.
+
+Run in-process over the httpx ASGI transport (no sockets, one event
+loop)::
+
+    python -m benchmarks.load --concurrency 32 --duration 30
+
+or against a local uvicorn with N worker processes, which the runner
+starts on a seeded throwaway SQLite file and stops afterwards::
+
+    python -m benchmarks.load --target uvicorn --workers 4 --concurrency 64
+
+or against a server that is already running (its catalog must not be
+empty)::
+
+    python -m benchmarks.load --url http://127.0.0.1:8000
+
+Each virtual user registers and logs in first (reported separately under
+"sign_in"), then loops over actions picked by weight from the workload
+mix (``--mix browse=40,checkout=5,...``; see workload.DEFAULT_MIX). The
+report gives req/s, error count and p50/p95/p99 latency per route.
+``--output`` saves it as JSON together with the git commit, and
+``--compare old.json`` prints the change per route against an earlier
+run.
+"""
@@ -0,0 +1,64 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+from benchmarks.load import __doc__ as package_doc
+from benchmarks.load.workload import parse_mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=package_doc.splitlines()[0])
+    parser.add_argument("--target", choices=["in-process", "uvicorn"], default="in-process")
+    parser.add_argument("--url", help="drive an already running server instead")
+    parser.add_argument("--workers", type=int, default=4, help="uvicorn worker processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds first")
+    parser.add_argument("--mix", help="action weights, e.g. browse=40,checkout=5")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--products", type=int, default=20000)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    # Keep the per-request INFO log line from dominating the measurement.
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite+aiosqlite:///{os.path.join(tmp, 'load.db')}"
+        if args.url:
+            from benchmarks.load import runner
+            result = asyncio.run(runner.run_against(
+                args.url, mix, args.concurrency, args.duration, args.warmup, args.seed))
+        else:
+            # The app reads its database URL when first imported.
+            os.environ["DATABASE_URL"] = database_url
+            from benchmarks.load import runner
+            asyncio.run(runner.seed_catalog(
+                database_url, args.categories, args.products, args.seed))
+            if args.target == "uvicorn":
+                with runner.uvicorn_server(database_url, args.workers) as url:
+                    result = asyncio.run(runner.run_against(
+                        url, mix, args.concurrency, args.duration, args.warmup, args.seed))
+            else:
+                result = asyncio.run(runner.run_in_process(
+                    mix, args.concurrency, args.duration, args.warmup, args.seed))
+
+    result = {**runner.metadata(args, mix), **result}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            for row in runner.compare(json.load(f), result):
+                print(json.dumps(row))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+"""Drive virtual users against an app and summarise the latencies."""
+import asyncio
+import contextlib
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.load.workload import VirtualUser
+
+PERCENTILES = (50, 95, 99)
+
+
+class Recorder:
+    """Latencies and status codes per route, kept as plain lists."""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    def record(self, route: str, seconds: float, status: int | None):
+        self.latencies.setdefault(route, []).append(seconds)
+        if status is None or status >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+    def reset(self):
+        self.latencies.clear()
+        self.errors.clear()
+
+
+def percentile(ordered: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    index = max(0, min(len(ordered) - 1, math.ceil(pct * len(ordered) / 100) - 1))
+    return ordered[index]
+
+
+def summarise(recorder: Recorder, elapsed: float) -> dict:
+    routes = {}
+    for route, latencies in sorted(recorder.latencies.items()):
+        ordered = sorted(latencies)
+        routes[route] = {
+            "requests": len(ordered),
+            "errors": recorder.errors.get(route, 0),
+            "rps": round(len(ordered) / elapsed, 2),
+            "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+            **{f"p{pct}_ms": round(percentile(ordered, pct) * 1000, 3)
+               for pct in PERCENTILES},
+        }
+    every = sorted(latency for latencies in recorder.latencies.values()
+                   for latency in latencies)
+    total = {
+        "requests": len(every),
+        "errors": sum(recorder.errors.values()),
+        "rps": round(len(every) / elapsed, 2) if elapsed else 0.0,
+        **{f"p{pct}_ms": round(percentile(every, pct) * 1000, 3)
+           for pct in PERCENTILES if every},
+    }
+    return {"elapsed_seconds": round(elapsed, 3), "total": total, "routes": routes}
+
+
+async def seed_catalog(database_url: str, categories: int, products: int, seed: int):
+    """Create the schema and a catalog to browse in a fresh database."""
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app import models
+    from app.database import Base
+
+    rng = random.Random(seed)
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(models.Category), [
+            {"name": f"Category {i}", "description": f"Load test category {i}"}
+            for i in range(categories)])
+        await conn.execute(insert(models.Product), [
+            {"name": f"Product {i:07d}", "description": f"Load test product {i}",
+             "price": round(rng.uniform(1, 500), 2), "stock_quantity": 10**9,
+             "category_id": 1 + rng.randrange(categories)}
+            for i in range(products)])
+    await engine.dispose()
+
+
+async def discover_catalog(client: httpx.AsyncClient) -> tuple[list[int], list[int]]:
+    """Product and category ids to pick from, read through the API."""
+    categories = (await client.get("/categories/")).json()
+    product_ids, cursor = [], None
+    while len(product_ids) < 5000:
+        params = {"pagination": "cursor", "limit": 100}
+        if cursor:
+            params["cursor"] = cursor
+        page = (await client.get("/products/", params=params)).json()
+        product_ids += [product["id"] for product in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    if not product_ids or not categories:
+        raise RuntimeError("The target has no products or categories to browse")
+    return product_ids, [category["id"] for category in categories]
+
+
+async def drive(client: httpx.AsyncClient, mix: dict[str, int], concurrency: int,
+                duration: float, warmup: float, seed: int) -> dict:
+    product_ids, category_ids = await discover_catalog(client)
+    recorder = Recorder()
+    run_id = f"{os.getpid()}-{int(time.time())}"
+    rng = random.Random(seed)
+    users = [VirtualUser(client, recorder, product_ids, category_ids,
+                         random.Random(rng.random()), run_id)
+             for _ in range(concurrency)]
+
+    # Registration and login hash a password each, which is slow on
+    # purpose; they run once up front and are reported on their own so
+    # they don't swamp the steady-state numbers.
+    started = time.perf_counter()
+    await asyncio.gather(*(user.sign_in() for user in users))
+    sign_in = summarise(recorder, time.perf_counter() - started)
+    recorder.reset()
+
+    async def phase(seconds: float) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(user.run(mix, started + seconds) for user in users))
+        return time.perf_counter() - started
+
+    if warmup:
+        await phase(warmup)
+        recorder.reset()
+    elapsed = await phase(duration)
+    return {**summarise(recorder, elapsed), "sign_in": sign_in}
+
+
+async def run_in_process(mix, concurrency, duration, warmup, seed) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test",
+                                 timeout=60) as client:
+        return await drive(client, mix, concurrency, duration, warmup, seed)
+
+
+async def run_against(url, mix, concurrency, duration, warmup, seed) -> dict:
+    limits = httpx.Limits(max_connections=concurrency,
+                          max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        return await drive(client, mix, concurrency, duration, warmup, seed)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def uvicorn_server(database_url: str, workers: int):
+    """Run app.main:app under uvicorn with N workers until the block exits."""
+    port = _free_port()
+    env = {**os.environ, "DATABASE_URL": database_url}
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+         "--no-access-log"],
+        env=env,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 60
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if httpx.get(f"{url}/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError("uvicorn did not become healthy within 60s")
+            time.sleep(0.2)
+        yield url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(args, mix: dict[str, int]) -> dict:
+    return {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.url or args.target,
+        "workers": args.workers if args.target == "uvicorn" and not args.url else None,
+        "concurrency": args.concurrency,
+        "duration_seconds": args.duration,
+        "warmup_seconds": args.warmup,
+        "seed": args.seed,
+        "mix": mix,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+    }
+
+
+def compare(old: dict, new: dict) -> list[dict]:
+    """Per-route change in throughput and latency percentiles, new vs old."""
+    rows = []
+    for route in sorted(set(old["routes"]) | set(new["routes"])):
+        before, after = old["routes"].get(route), new["routes"].get(route)
+        row = {"route": route}
+        if before and after:
+            for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                row[key] = after[key]
+                if before[key]:
+                    row[f"{key}_change_pct"] = round(
+                        (after[key] - before[key]) / before[key] * 100, 1)
+        else:
+            row["only_in"] = "new" if after else "old"
+        rows.append(row)
+    return rows
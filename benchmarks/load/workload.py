@@ -0,0 +1,112 @@
+"""The virtual user: actions, their routes and the default mix."""
+import itertools
+import random
+import time
+
+import httpx
+
+# Relative weights of the actions a virtual user loops over.
+DEFAULT_MIX = {
+    "browse": 35,
+    "browse_filtered": 10,
+    "categories": 10,
+    "product": 20,
+    "add_to_cart": 12,
+    "checkout": 4,
+    "orders": 9,
+}
+
+_user_ids = itertools.count()
+
+
+def parse_mix(text: str | None) -> dict[str, int]:
+    """"browse=40,checkout=5" -> weights, starting from DEFAULT_MIX."""
+    mix = dict(DEFAULT_MIX)
+    if text:
+        for part in text.split(","):
+            name, _, weight = part.partition("=")
+            name = name.strip()
+            if name not in DEFAULT_MIX:
+                raise ValueError(
+                    f"Unknown action {name!r}; choose from {', '.join(DEFAULT_MIX)}")
+            mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("The workload mix has no actions with a positive weight")
+    return mix
+
+
+class VirtualUser:
+    """One shopper with its own account, token and cart."""
+
+    def __init__(self, client: httpx.AsyncClient, recorder, product_ids: list[int],
+                 category_ids: list[int], rng: random.Random, run_id: str):
+        self.client = client
+        self.recorder = recorder
+        self.product_ids = product_ids
+        self.category_ids = category_ids
+        self.rng = rng
+        self.email = f"load-{run_id}-{next(_user_ids)}@example.com"
+        self.headers: dict[str, str] = {}
+        self.cart_lines = 0
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.recorder.record(route, time.perf_counter() - started, None)
+            return None
+        self.recorder.record(route, time.perf_counter() - started, response.status_code)
+        return response
+
+    async def sign_in(self):
+        password = "load-test-password"
+        await self.request("POST /auth/register", "POST", "/auth/register",
+                           json={"email": self.email, "password": password})
+        response = await self.request("POST /auth/login", "POST", "/auth/login",
+                                      data={"username": self.email, "password": password})
+        if response is not None and response.status_code == 200:
+            self.headers = {
+                "Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def browse(self):
+        await self.request("GET /products/", "GET", "/products/", params={
+            "pagination": "cursor", "limit": 20,
+            "sort": self.rng.choice(["id", "price", "-created_at", "name"])})
+
+    async def browse_filtered(self):
+        await self.request("GET /products/", "GET", "/products/", params={
+            "pagination": "cursor", "limit": 20, "in_stock": True,
+            "category_id": self.rng.choice(self.category_ids), "sort": "price"})
+
+    async def categories(self):
+        await self.request("GET /categories/", "GET", "/categories/")
+
+    async def product(self):
+        product_id = self.rng.choice(self.product_ids)
+        await self.request("GET /products/{product_id}", "GET", f"/products/{product_id}")
+
+    async def add_to_cart(self):
+        response = await self.request(
+            "POST /cart/add", "POST", "/cart/add", headers=self.headers,
+            json={"product_id": self.rng.choice(self.product_ids)})
+        if response is not None and response.status_code == 201:
+            self.cart_lines += 1
+
+    async def checkout(self):
+        if not self.cart_lines:
+            await self.add_to_cart()
+        response = await self.request("POST /cart/checkout", "POST", "/cart/checkout",
+                                      headers=self.headers)
+        if response is not None and response.status_code == 200:
+            self.cart_lines = 0
+
+    async def orders(self):
+        await self.request("GET /orders/", "GET", "/orders/", headers=self.headers,
+                           params={"pagination": "cursor", "limit": 20})
+
+    async def run(self, mix: dict[str, int], deadline: float):
+        actions = [getattr(self, name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            await self.rng.choices(actions, weights)[0]()
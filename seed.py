@@ -1,139 +1,364 @@
-import sys
-import os
+"""Fill the database with a reproducible synthetic shop at any scale.
+
+Run with::
+
+    python seed.py                                      # a small demo shop
+    python seed.py --reset --products 1000000 --users 200000 --orders 5000000 --processes 8
+
+Categories, products, users, carts with their lines and order history
+with its items are generated from --seed: the same seed and scale give
+the same rows (apart from password salts), however many processes are
+used. Rows are generated in chunks by a pool of worker processes and
+written with bulk core INSERTs, one transaction per chunk. SQLite takes a
+single writer, so there the workers only generate and this process
+writes; on other databases every worker writes its own chunks.
+
+Parent rows get explicit ids so children can reference them without
+reading anything back; cart and order lines take autoincrement ids.
+Passwords are hashed once: user 1 is admin@example.com / admin123 and
+every other user's password is password123. Rows, seconds and rows/sec
+are printed per table as JSON lines.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
 import random
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta, timezone
 
-# Add the current directory to sys.path so we can import from 'app'
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from faker import Faker
+from sqlalchemy import event, func, insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 
-from sqlalchemy.orm import Session
-from app.database import SessionLocal, engine
 from app import models
+from app.core.config import config
+from app.database import Base
 from app.utils.oauth2 import get_password_hash
 
-def seed():
-    db: Session = SessionLocal()
-    
-    try:
-        # 1. Seed Categories
-        categories_data = [
-            {"name": "Electronics", "description": "Gadgets, devices, and more"},
-            {"name": "Clothing", "description": "Fashionable wear for everyone"},
-            {"name": "Home & Kitchen", "description": "Essentials for your living space"},
-            {"name": "Books", "description": "Knowledge and stories"},
-            {"name": "Sports", "description": "Gear for the active life"}
-        ]
-        
-        db_categories = []
-        for cat in categories_data:
-            db_cat = db.query(models.Category).filter(models.Category.name == cat["name"]).first()
-            if not db_cat:
-                db_cat = models.Category(**cat)
-                db.add(db_cat)
-                db.flush()
-            db_categories.append(db_cat)
-        
-        # 2. Seed 20+ Products
-        products_data = [
-            # Electronics (index 0)
-            {"name": "Smartphone X", "description": "Latest generation smartphone", "price": 799, "stock_quantity": 50, "category_id": db_categories[0].id},
-            {"name": "Laptop Pro", "description": "High-performance laptop", "price": 1299, "stock_quantity": 25, "category_id": db_categories[0].id},
-            {"name": "Wireless Earbuds", "description": "Noise-cancelling earbuds", "price": 149, "stock_quantity": 80, "category_id": db_categories[0].id},
-            {"name": "Smart Watch", "description": "Track your fitness and alerts", "price": 199, "stock_quantity": 60, "category_id": db_categories[0].id},
-            {"name": "Tablet Air", "description": "Thin and light tablet", "price": 499, "stock_quantity": 40, "category_id": db_categories[0].id},
-            
-            # Clothing (index 1)
-            {"name": "Cotton T-Shirt", "description": "Comfortable 100% cotton", "price": 25, "stock_quantity": 100, "category_id": db_categories[1].id},
-            {"name": "Denim Jeans", "description": "Classic blue denim", "price": 55, "stock_quantity": 70, "category_id": db_categories[1].id},
-            {"name": "Hoodie", "description": "Warm fleece hoodie", "price": 45, "stock_quantity": 50, "category_id": db_categories[1].id},
-            {"name": "Leather Jacket", "description": "Stylish black leather", "price": 120, "stock_quantity": 20, "category_id": db_categories[1].id},
-            {"name": "Summer Dress", "description": "Light floral summer dress", "price": 35, "stock_quantity": 40, "category_id": db_categories[1].id},
-            
-            # Home & Kitchen (index 2)
-            {"name": "Coffee Maker", "description": "Automatic drip coffee maker", "price": 60, "stock_quantity": 30, "category_id": db_categories[2].id},
-            {"name": "Air Fryer", "description": "Healthy oil-free cooking", "price": 85, "stock_quantity": 25, "category_id": db_categories[2].id},
-            {"name": "Blender", "description": "High-powered smoothie blender", "price": 40, "stock_quantity": 45, "category_id": db_categories[2].id},
-            {"name": "Knife Set", "description": "Professional 12-piece set", "price": 110, "stock_quantity": 15, "category_id": db_categories[2].id},
-            {"name": "Vacuum Cleaner", "description": "Strong suction upright vacuum", "price": 150, "stock_quantity": 20, "category_id": db_categories[2].id},
-            
-            # Books (index 3)
-            {"name": "Python Mastery", "description": "Learn Python like a pro", "price": 29, "stock_quantity": 100, "category_id": db_categories[3].id},
-            {"name": "The Great Gatsby", "description": "Classic American literature", "price": 12, "stock_quantity": 50, "category_id": db_categories[3].id},
-            {"name": "AI Basics", "description": "Introduction to neural networks", "price": 35, "stock_quantity": 60, "category_id": db_categories[3].id},
-            
-            # Sports (index 4)
-            {"name": "Yoga Mat", "description": "Non-slip eco-friendly mat", "price": 20, "stock_quantity": 100, "category_id": db_categories[4].id},
-            {"name": "Dumbbells (Pair)", "description": "5kg cast iron dumbbells", "price": 40, "stock_quantity": 30, "category_id": db_categories[4].id},
-            {"name": "Basketball", "description": "Official size and weight", "price": 25, "stock_quantity": 50, "category_id": db_categories[4].id},
-            {"name": "Running Shoes", "description": "Lightweight breathable shoes", "price": 75, "stock_quantity": 40, "category_id": db_categories[4].id}
-        ]
-        
-        db_products = []
-        for prod in products_data:
-            db_prod = db.query(models.Product).filter(models.Product.name == prod["name"]).first()
-            if not db_prod:
-                db_prod = models.Product(**prod)
-                db.add(db_prod)
-                db.flush()
-            db_products.append(db_prod)
-        
-        # 3. Seed 5+ Users
-        users_data = [
-            {"full_name": "Admin User", "email": "admin@example.com", "hashed_password": get_password_hash("admin123"), "role": "admin"},
-            {"full_name": "John Doe", "email": "john@example.com", "hashed_password": get_password_hash("password123"), "role": "client"},
-            {"full_name": "Jane Smith", "email": "jane@example.com", "hashed_password": get_password_hash("password123"), "role": "client"},
-            {"full_name": "Alice Johnson", "email": "alice@example.com", "hashed_password": get_password_hash("password123"), "role": "client"},
-            {"full_name": "Bob Williams", "email": "bob@example.com", "hashed_password": get_password_hash("password123"), "role": "client"},
-            {"full_name": "Charlie Brown", "email": "charlie@example.com", "hashed_password": get_password_hash("password123"), "role": "client"}
-        ]
-        
-        db_users = []
-        for user in users_data:
-            db_user = db.query(models.User).filter(models.User.email == user["email"]).first()
-            if not db_user:
-                db_user = models.User(**user)
-                db.add(db_user)
-                db.flush()
-            db_users.append(db_user)
-        
-        # 4. Seed Carts and Random Cart Items
-        for user in db_users:
-            if user.role == "admin":
-                continue # Skip admin for cart seeding
-            
-            # Ensure user has a cart
-            db_cart = db.query(models.Cart).filter(models.Cart.user_id == user.id).first()
-            if not db_cart:
-                db_cart = models.Cart(user_id=user.id)
-                db.add(db_cart)
-                db.flush()
-            
-            # Add 2-4 random items per cart
-            num_items = random.randint(2, 4)
-            # Pick unique random products to avoid unique constraint on CartItem(cart_id, product_id)
-            selected_products = random.sample(db_products, num_items)
-            
-            for prod in selected_products:
-                # Check if item already exists
-                existing_item = db.query(models.CartItem).filter(
-                    models.CartItem.cart_id == db_cart.id, 
-                    models.CartItem.product_id == prod.id
-                ).first()
-                if not existing_item:
-                    cart_item = models.CartItem(
-                        cart_id=db_cart.id,
-                        product_id=prod.id,
-                        quantity=random.randint(1, 3)
-                    )
-                    db.add(cart_item)
-        
-        db.commit()
-        print("Database expanded and seeded successfully with random carts!")
-        
-    except Exception as e:
-        print(f"Error seeding database: {e}")
-        db.rollback()
-    finally:
-        db.close()
+ADMIN_EMAIL, ADMIN_PASSWORD = "admin@example.com", "admin123"
+CLIENT_PASSWORD = "password123"
+
+# Tables whose ids are assigned here, in load order; PostgreSQL sequences
+# are moved past them afterwards.
+EXPLICIT_ID_TABLES = ("categories", "products", "users", "carts", "orders")
+
+
+@dataclass(frozen=True)
+class Scale:
+    categories: int = 20
+    products: int = 1000
+    users: int = 100
+    cart_share: float = 0.5
+    max_cart_items: int = 4
+    orders: int = 2000
+    max_order_items: int = 5
+    history_days: int = 365
+
+
+@dataclass(frozen=True)
+class Settings:
+    seed: int
+    scale: Scale
+    until: datetime
+    chunk_size: int
+    admin_hash: str
+    client_hash: str
+    words: tuple
+    first_names: tuple
+    last_names: tuple
+    # Set when workers write their own chunks.
+    database_url: str | None = None
+
+
+def build_settings(args, scale: Scale) -> Settings:
+    """Hash the two passwords and draw the word pools, once."""
+    fake = Faker()
+    fake.seed_instance(args.seed)
+    return Settings(
+        seed=args.seed,
+        scale=scale,
+        until=datetime.fromisoformat(args.until).replace(tzinfo=timezone.utc),
+        chunk_size=args.chunk_size,
+        admin_hash=get_password_hash(ADMIN_PASSWORD),
+        client_hash=get_password_hash(CLIENT_PASSWORD),
+        words=tuple(dict.fromkeys(fake.words(3000))),
+        first_names=tuple(dict.fromkeys(fake.first_name() for _ in range(500))),
+        last_names=tuple(dict.fromkeys(fake.last_name() for _ in range(500))),
+    )
+
+
+def product_price(seed: int, product_id: int) -> float:
+    """A product's price as a pure function of its id, so order lines can
+    quote it without looking the product up."""
+    x = ((product_id * 2654435761 + seed * 40503) % 2**32) / 2**32
+    return round(1 + 499 * x * x, 2)
+
+
+def _skewed(rng: random.Random, low: int, high: int) -> int:
+    """An id in [low, high] favouring the low end: a few heavy users and
+    best-selling products, like real traffic."""
+    return low + int((high - low + 1) * rng.random() ** 2)
+
+
+def _moment(rng: random.Random, settings: Settings) -> datetime:
+    return settings.until - timedelta(
+        seconds=rng.random() * settings.scale.history_days * 86400)
+
+
+def _categories(rng, settings, start, stop):
+    return {"categories": [
+        {"id": i, "name": f"{rng.choice(settings.words).title()} {i}",
+         "description": " ".join(rng.choices(settings.words, k=6)),
+         "created_at": settings.until - timedelta(days=settings.scale.history_days)}
+        for i in range(start, stop)]}
+
+
+def _products(rng, settings, start, stop):
+    scale = settings.scale
+    return {"products": [
+        {"id": i,
+         "name": " ".join(rng.choices(settings.words, k=3)).title(),
+         "description": " ".join(rng.choices(settings.words, k=12)),
+         "price": product_price(settings.seed, i),
+         "stock_quantity": 0 if rng.random() < 0.05 else rng.randint(1, 500),
+         "category_id": rng.randint(1, scale.categories),
+         "created_at": _moment(rng, settings)}
+        for i in range(start, stop)]}
+
+
+def _users(rng, settings, start, stop):
+    rows = []
+    for i in range(start, stop):
+        if i == 1:
+            rows.append({"id": 1, "full_name": "Admin User", "email": ADMIN_EMAIL,
+                         "hashed_password": settings.admin_hash, "role": "admin",
+                         "is_active": 1, "created_at": _moment(rng, settings)})
+            continue
+        first, last = rng.choice(settings.first_names), rng.choice(settings.last_names)
+        rows.append({"id": i, "full_name": f"{first} {last}",
+                     "email": f"{first}.{last}.{i}@example.com".lower(),
+                     "hashed_password": settings.client_hash, "role": "client",
+                     "is_active": 1, "created_at": _moment(rng, settings)})
+    return {"users": rows}
+
+
+def _carts(rng, settings, start, stop):
+    """Carts for a share of client users; cart ids follow user ids."""
+    scale = settings.scale
+    carts, lines = [], []
+    for user_id in range(max(start, 2), stop):
+        if rng.random() >= scale.cart_share:
+            continue
+        created_at = _moment(rng, settings)
+        carts.append({"id": user_id, "user_id": user_id, "created_at": created_at})
+        count = min(rng.randint(1, scale.max_cart_items), scale.products)
+        for product_id in rng.sample(range(1, scale.products + 1), count):
+            lines.append({"cart_id": user_id, "product_id": product_id,
+                          "quantity": rng.randint(1, 3), "reserved_until": None,
+                          "created_at": created_at})
+    return {"carts": carts, "cart_items": lines}
+
+
+def _orders(rng, settings, start, stop):
+    scale = settings.scale
+    orders, lines = [], []
+    for order_id in range(start, stop):
+        created_at = _moment(rng, settings)
+        total = 0.0
+        for _ in range(rng.randint(1, scale.max_order_items)):
+            product_id = _skewed(rng, 1, scale.products)
+            quantity = rng.randint(1, 3)
+            price = product_price(settings.seed, product_id)
+            total += price * quantity
+            lines.append({"order_id": order_id, "product_id": product_id,
+                          "quantity": quantity, "price_at_purchase": price,
+                          "created_at": created_at})
+        orders.append({"id": order_id,
+                       "user_id": _skewed(rng, 2, scale.users) if scale.users > 1 else 1,
+                       "total_amount": round(total, 2), "created_at": created_at})
+    return {"orders": orders, "order_items": lines}
+
+
+# (phase, generator, how many parent ids it spans)
+PHASES = (
+    ("categories", _categories, lambda s: s.categories),
+    ("products", _products, lambda s: s.products),
+    ("users", _users, lambda s: s.users),
+    ("carts", _carts, lambda s: s.users),
+    ("orders", _orders, lambda s: s.orders),
+)
+GENERATORS = {name: generate for name, generate, _ in PHASES}
+
+_settings: Settings | None = None
+
+
+def _init_worker(settings: Settings):
+    global _settings
+    _settings = settings
+
+
+def generate_chunk(job: tuple[str, int, int]) -> dict[str, list[dict]]:
+    """Rows for ids [start, stop) of one phase, from an RNG seeded by the
+    phase and chunk alone."""
+    phase, start, stop = job
+    rng = random.Random(f"{_settings.seed}:{phase}:{start}")
+    return GENERATORS[phase](rng, _settings, start, stop)
+
+
+def _tune_sqlite(engine):
+    @event.listens_for(engine.sync_engine, "connect")
+    def _pragmas(dbapi_connection, _):
+        cursor = dbapi_connection.cursor()
+        # A failed load is simply rerun with --reset, so skip the fsyncs.
+        cursor.execute("PRAGMA synchronous=OFF")
+        cursor.execute("PRAGMA cache_size=-262144")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+async def write_chunk(engine, rows: dict[str, list[dict]]) -> dict[str, int]:
+    async with engine.begin() as conn:
+        for table, table_rows in rows.items():
+            if table_rows:
+                await conn.execute(insert(Base.metadata.tables[table]), table_rows)
+    return {table: len(table_rows) for table, table_rows in rows.items()}
+
+
+def load_chunk(job: tuple[str, int, int]) -> dict[str, int]:
+    """Generate one chunk and write it from this worker process."""
+    async def write():
+        engine = create_async_engine(_settings.database_url, poolclass=NullPool)
+        try:
+            return await write_chunk(engine, generate_chunk(job))
+        finally:
+            await engine.dispose()
+    return asyncio.run(write())
+
+
+def jobs(phase: str, count: int, chunk_size: int):
+    return [(phase, start, min(start + chunk_size, count + 1))
+            for start in range(1, count + 1, chunk_size)]
+
+
+async def prepare(engine, reset: bool):
+    async with engine.begin() as conn:
+        if reset:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        if (await conn.execute(select(func.count()).select_from(models.User))).scalar():
+            raise SystemExit("The database already has users; pass --reset to replace its data")
+
+
+async def finish(engine):
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            for table in EXPLICIT_ID_TABLES:
+                await conn.execute(text(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"coalesce((SELECT max(id) FROM {table}), 0) + 1, false)"))
+
+
+async def load_in_process(engine, pool, settings: Settings) -> list[dict]:
+    """Workers generate, this process writes (one writer, chunks in order)."""
+    loop = asyncio.get_running_loop()
+    report = []
+    for phase, _, size in PHASES:
+        started = time.perf_counter()
+        counts: dict[str, int] = {}
+        phase_jobs = jobs(phase, size(settings.scale), settings.chunk_size)
+        chunks = (pool.imap(generate_chunk, phase_jobs) if pool
+                  else map(generate_chunk, phase_jobs))
+        while (rows := await loop.run_in_executor(None, next, chunks, None)) is not None:
+            for table, written in (await write_chunk(engine, rows)).items():
+                counts[table] = counts.get(table, 0) + written
+        report += phase_report(counts, time.perf_counter() - started)
+    return report
+
+
+def load_in_workers(pool, settings: Settings) -> list[dict]:
+    """Every worker generates and writes its own chunks."""
+    report = []
+    for phase, _, size in PHASES:
+        started = time.perf_counter()
+        counts: dict[str, int] = {}
+        for written in pool.imap_unordered(
+                load_chunk, jobs(phase, size(settings.scale), settings.chunk_size)):
+            for table, rows in written.items():
+                counts[table] = counts.get(table, 0) + rows
+        report += phase_report(counts, time.perf_counter() - started)
+    return report
+
+
+def phase_report(counts: dict[str, int], seconds: float) -> list[dict]:
+    """Tables loaded together (orders and their items) share the phase time."""
+    return [{"table": table, "rows": rows, "seconds": round(seconds, 3),
+             "rows_per_second": round(rows / seconds) if seconds else None}
+            for table, rows in counts.items()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--database-url", default=config.database_url)
+    parser.add_argument("--reset", action="store_true",
+                        help="drop and recreate every table first")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--categories", type=int, default=Scale.categories)
+    parser.add_argument("--products", type=int, default=Scale.products)
+    parser.add_argument("--users", type=int, default=Scale.users)
+    parser.add_argument("--cart-share", type=float, default=Scale.cart_share,
+                        help="fraction of users with a cart")
+    parser.add_argument("--max-cart-items", type=int, default=Scale.max_cart_items)
+    parser.add_argument("--orders", type=int, default=Scale.orders)
+    parser.add_argument("--max-order-items", type=int, default=Scale.max_order_items)
+    parser.add_argument("--history-days", type=int, default=Scale.history_days)
+    parser.add_argument("--until", default="2025-01-01T00:00:00",
+                        help="newest timestamp in the data (UTC); fixed so reruns match")
+    parser.add_argument("--chunk-size", type=int, default=10000,
+                        help="parent rows per chunk and transaction")
+    parser.add_argument("--processes", type=int, default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    scale = Scale(args.categories, args.products, max(1, args.users), args.cart_share,
+                  args.max_cart_items, args.orders, args.max_order_items, args.history_days)
+    if scale.categories < 1 or scale.products < 1:
+        parser.error("--categories and --products must be at least 1")
+    settings = build_settings(args, scale)
+    sqlite = args.database_url.startswith("sqlite")
+    if not sqlite:
+        settings = replace(settings, database_url=args.database_url)
+
+    async def run(pool):
+        engine = create_async_engine(args.database_url, poolclass=NullPool)
+        if sqlite:
+            _tune_sqlite(engine)
+        try:
+            await prepare(engine, args.reset)
+            if sqlite or pool is None:
+                report = await load_in_process(engine, pool, settings)
+            else:
+                report = await asyncio.get_running_loop().run_in_executor(
+                    None, load_in_workers, pool, settings)
+            await finish(engine)
+            return report
+        finally:
+            await engine.dispose()
+
+    _init_worker(settings)
+    started = time.perf_counter()
+    if args.processes > 1:
+        # Forked before any event loop or connection exists.
+        with multiprocessing.Pool(args.processes, _init_worker, (settings,)) as pool:
+            report = asyncio.run(run(pool))
+    else:
+        report = asyncio.run(run(None))
+    for row in report:
+        print(json.dumps(row))
+    print(json.dumps({"table": "total", "rows": sum(row["rows"] for row in report),
+                      "seconds": round(time.perf_counter() - started, 3)}))
+
 
 if __name__ == "__main__":
-    seed()
+    main()
@@ -1,52 +1,69 @@
 import pytest
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.pool import StaticPool
 from fastapi.testclient import TestClient
 
+from app.core.config import config
 from app.main import app
 from app.database import Base, get_db
+from app.utils.oauth2 import principal_cache
+from app.utils.response_cache import catalog_cache
 
 # 1. Create a temporary in-memory SQLite database for testing
 # "check_same_thread=False" is needed for SQLite in multi-threaded tests
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///:memory:"
 
-engine = create_engine(
+engine = create_async_engine(
     SQLALCHEMY_DATABASE_URL,
     connect_args={"check_same_thread": False},
     poolclass=StaticPool,
 )
 
-TestingSessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine)
+TestingSessionLocal = async_sessionmaker(
+    bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 # 2. Override the dependency
 # This forces FastAPI to use our test DB instead of the real one
 
 
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
 app.dependency_overrides[get_db] = override_get_db
+# The sweeper would run against the real database; tests call sweep() directly.
+config.reservation_sweeper_enabled = False
+config.idempotency_janitor_enabled = False
+# Likewise the SQLite write queue; its tests start one on their own file.
+config.sqlite_write_queue_enabled = False
+# Routes that exceed their SQL query budget fail the test that called them.
+config.query_budget_mode = "raise"
+
+
+async def _create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+
+async def _drop_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
 
 # 3. Create a Test Client Fixture
 
 
 @pytest.fixture(scope="function")
 def client():
-    # Create tables in the test DB
-    Base.metadata.create_all(bind=engine)
-
     with TestClient(app) as c:
+        # Create tables in the test DB on the client's event loop
+        c.portal.call(_create_tables)
         yield c
 
-    # Drop tables after tests finish (Clean up)
-    Base.metadata.drop_all(bind=engine)
+        # Drop tables after tests finish (Clean up)
+        c.portal.call(_drop_tables)
+        principal_cache.clear()
+        catalog_cache.clear()
 
 
 @pytest.fixture
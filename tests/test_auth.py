@@ -143,3 +143,62 @@ def test_get_all_users_authenticated_admin(client: TestClient, mock_current_user
     data = response.json()
     assert isinstance(data, list)
     assert len(data) >= 1
+    assert data[0] == {"email": "admin@example.com", "id": data[0]["id"],
+                       "is_active": True, "role": "client"}
+
+
+def test_current_user_is_cached_and_evicted_on_deactivation(client: TestClient):
+    """Test the principal cache serves repeat requests and drops deactivated users"""
+    from app import models
+    from app.utils.oauth2 import principal_cache
+    from tests.conftest import TestingSessionLocal
+
+    user_data = {"email": "cached@example.com", "password": "testpassword"}
+    user_id = client.post("/auth/register", json=user_data).json()["id"]
+    login_response = client.post("/auth/login", data={
+        "username": user_data["email"], "password": user_data["password"]})
+    headers = {
+        "Authorization": f"Bearer {login_response.json()['access_token']}"}
+
+    assert client.get("/cart/", headers=headers).status_code == status.HTTP_200_OK
+    hits = principal_cache.hits
+    assert client.get("/cart/", headers=headers).status_code == status.HTTP_200_OK
+    assert principal_cache.hits == hits + 1
+
+    async def deactivate():
+        async with TestingSessionLocal() as db:
+            user = await db.get(models.User, user_id)
+            user.is_active = 0
+            await db.commit()
+
+    client.portal.call(deactivate)
+
+    response = client.get("/cart/", headers=headers)
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+
+def test_password_executor_rejects_when_queue_full():
+    """Test the hashing executor returns 503 once workers and queue are full"""
+    import asyncio
+    import threading
+    import pytest
+    from fastapi import HTTPException
+    from app.utils.hashing import BoundedExecutor
+
+    executor = BoundedExecutor(max_workers=1, max_queue=1, name="test-hash")
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.ensure_future(executor.run(release.wait))
+                   for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as exc_info:
+            await executor.run(release.wait)
+        release.set()
+        await asyncio.gather(*running)
+        return exc_info.value
+
+    error = asyncio.run(scenario())
+    executor.shutdown()
+    assert error.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert executor.rejected == 1
@@ -275,3 +275,572 @@ def test_cart_checkout_no_cart(client: TestClient, mock_current_user_admin):
     assert response.status_code == status.HTTP_404_NOT_FOUND
     data = response.json()
     assert data["detail"] == "Cart not found"
+
+
+def _create_product(client: TestClient, stock_quantity: int, price: float = 10.0):
+    category_id = client.post(
+        "/categories/add", json={"name": f"Cat {stock_quantity} {price}"}).json()["id"]
+    response = client.post("/products/", json={
+        "name": "Hot Product", "price": price,
+        "stock_quantity": stock_quantity, "category_id": category_id
+    })
+    return response.json()["id"]
+
+
+def _stock(product_id: int) -> int:
+    from app import models
+    from tests.conftest import TestingSessionLocal
+
+    async def read():
+        async with TestingSessionLocal() as db:
+            return (await db.get(models.Product, product_id)).stock_quantity
+    return read
+
+
+def test_add_item_reserves_stock_atomically(client: TestClient, mock_current_user_admin):
+    """Test adds decrement stock, stop at zero, and removals give stock back"""
+    headers = create_authenticated_client(
+        client, "stock@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=3)
+
+    response = client.post("/cart/add", params={"quantity": 2},
+                           json={"product_id": product_id}, headers=headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert response.json()["quantity"] == 2
+    assert response.json()["product"]["id"] == product_id
+
+    response = client.post("/cart/add", params={"quantity": 2},
+                           json={"product_id": product_id}, headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert client.portal.call(_stock(product_id)) == 1
+
+    response = client.post("/cart/add", json={"product_id": product_id},
+                           headers=headers)
+    assert response.json()["quantity"] == 3
+    assert client.portal.call(_stock(product_id)) == 0
+
+    response = client.delete(f"/cart/{product_id}", params={"quantity": 5},
+                             headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    response = client.delete(f"/cart/{product_id}", params={"quantity": 3},
+                             headers=headers)
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+    assert client.portal.call(_stock(product_id)) == 3
+    assert client.get("/cart/", headers=headers).json() == []
+
+    response = client.delete(f"/cart/{product_id}", headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_add_that_loses_a_race_joins_the_winners_cart_line(client: TestClient):
+    """Test an add racing another for the same new cart and line doesn't duplicate or fail"""
+    from sqlalchemy import event, select
+    from app import models
+    from app.routers.cart import _add_to_cart_item, _get_or_create_cart_id
+    from tests.conftest import TestingSessionLocal, engine
+
+    competing = [
+        "INSERT INTO carts (id, user_id) VALUES (99, 1)",
+        "INSERT INTO cart_items (cart_id, product_id, quantity) VALUES (99, 1, 2)",
+    ]
+
+    def other_request_commits_first(conn, cursor, statement, *args):
+        # The other add lands between our lookup and our insert.
+        if statement.startswith("SAVEPOINT") and competing:
+            cursor.execute(competing.pop(0))
+
+    async def run():
+        async with TestingSessionLocal() as db:
+            db.add(models.User(id=1, email="race@example.com", hashed_password="x"))
+            db.add(models.Category(id=1, name="Race"))
+            db.add(models.Product(id=1, name="P", price=1.0, stock_quantity=5, category_id=1))
+            await db.commit()
+        event.listen(engine.sync_engine, "before_cursor_execute", other_request_commits_first)
+        try:
+            async with TestingSessionLocal() as db:
+                cart_id = await _get_or_create_cart_id(db, 1)
+                _, quantity = await _add_to_cart_item(db, cart_id, 1, 1)
+                await db.commit()
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", other_request_commits_first)
+        async with TestingSessionLocal() as db:
+            lines = (await db.execute(
+                select(models.CartItem.cart_id, models.CartItem.quantity))).all()
+        return cart_id, quantity, lines
+
+    assert client.portal.call(run) == (99, 3, [(99, 3)])
+
+
+def test_add_item_rejects_non_positive_quantity(client: TestClient, mock_current_user_admin):
+    """Test a negative quantity can't be used to mint stock"""
+    headers = create_authenticated_client(
+        client, "negative@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=1)
+
+    response = client.post("/cart/add", params={"quantity": -5},
+                           json={"product_id": product_id}, headers=headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+
+def test_expired_reservations_are_released(client: TestClient, mock_current_user_admin):
+    """Test the sweeper returns stock held by expired cart lines, in batches"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import update
+    from app import models
+    from app.reservations import ReservationSweeper
+    from tests.conftest import TestingSessionLocal
+
+    headers = create_authenticated_client(
+        client, "sweep@example.com", "testpassword")
+    kept = _create_product(client, stock_quantity=5)
+    expired = [_create_product(client, stock_quantity=5, price=p)
+               for p in (1.0, 2.0, 3.0)]
+    for product_id in [kept, *expired]:
+        client.post("/cart/add", params={"quantity": 2},
+                    json={"product_id": product_id}, headers=headers)
+
+    async def expire_and_sweep():
+        async with TestingSessionLocal() as db:
+            await db.execute(
+                update(models.CartItem)
+                .where(models.CartItem.product_id.in_(expired))
+                .values(reserved_until=datetime.now(timezone.utc) - timedelta(minutes=1)))
+            await db.commit()
+        sweeper = ReservationSweeper(
+            TestingSessionLocal, interval=60, batch_size=2)
+        return await sweeper.sweep()
+
+    run = client.portal.call(expire_and_sweep)
+    assert run["rows_reclaimed"] == 3
+    assert run["units_released"] == 6
+    assert run["batches"] == 2
+    assert [client.portal.call(_stock(p)) for p in expired] == [5, 5, 5]
+    assert client.portal.call(_stock(kept)) == 3
+    items = client.get("/cart/", headers=headers).json()
+    assert [item["product"]["id"] for item in items] == [kept]
+
+
+def test_checkout_moves_every_line_into_the_order(client: TestClient, mock_current_user_admin):
+    """Test checkout copies each line at its price, totals it, and clears the cart"""
+    headers = create_authenticated_client(
+        client, "checkout@example.com", "testpassword")
+    cheap = _create_product(client, stock_quantity=5, price=2.5)
+    dear = _create_product(client, stock_quantity=5, price=10.0)
+    client.post("/cart/add", params={"quantity": 3},
+                json={"product_id": cheap}, headers=headers)
+    client.post("/cart/add", json={"product_id": dear}, headers=headers)
+
+    response = client.post("/cart/checkout", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    order = response.json()
+    assert order["total_amount"] == 17.5
+    assert [(i["product_id"], i["quantity"], i["price_at_purchase"])
+            for i in order["order_items"]] == [(cheap, 3, 2.5), (dear, 1, 10.0)]
+    assert all(i["order_id"] == order["id"] for i in order["order_items"])
+    assert client.get("/cart/", headers=headers).json() == []
+
+    history = client.get("/orders/", headers=headers).json()
+    assert history[0]["id"] == order["id"]
+    assert history[0]["order_items"] == order["order_items"]
+
+    response = client.post("/cart/checkout", headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Cart is empty"
+
+
+def test_idempotent_checkout_and_add_replay(client: TestClient, mock_current_user_admin):
+    """Test retries with the same Idempotency-Key replay instead of re-running"""
+    headers = create_authenticated_client(
+        client, "retry@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=5)
+
+    add_headers = {**headers, "Idempotency-Key": "add-1"}
+    first = client.post("/cart/add", json={"product_id": product_id},
+                        headers=add_headers)
+    retry = client.post("/cart/add", json={"product_id": product_id},
+                        headers=add_headers)
+    assert first.status_code == retry.status_code == status.HTTP_201_CREATED
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert client.portal.call(_stock(product_id)) == 4
+
+    response = client.post("/cart/add", params={"quantity": 2},
+                           json={"product_id": product_id}, headers=add_headers)
+    assert response.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+    checkout_headers = {**headers, "Idempotency-Key": "checkout-1"}
+    first = client.post("/cart/checkout", headers=checkout_headers)
+    retry = client.post("/cart/checkout", headers=checkout_headers)
+    assert first.status_code == retry.status_code == status.HTTP_200_OK
+    assert retry.json() == first.json()
+    assert len(client.get("/orders/", headers=headers).json()) == 1
+
+
+def test_idempotency_key_released_when_request_fails(client: TestClient, mock_current_user_admin):
+    """Test a failed request doesn't pin its key, so the retry really runs"""
+    headers = create_authenticated_client(
+        client, "failed@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=0)
+
+    retry_headers = {**headers, "Idempotency-Key": "add-oos"}
+    response = client.post("/cart/add", json={"product_id": product_id},
+                           headers=retry_headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    client.put(f"/products/{product_id}", json={"stock_quantity": 1})
+    response = client.post("/cart/add", json={"product_id": product_id},
+                           headers=retry_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+
+
+def test_abandoned_idempotency_claim_is_taken_over(client: TestClient, mock_current_user_admin, monkeypatch):
+    """Test a claim left by a request that died blocks retries only until its lease runs out"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import update
+    from app.core.config import config
+    from app.idempotency import keys
+    from tests.conftest import TestingSessionLocal
+
+    headers = create_authenticated_client(
+        client, "crashed@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=5)
+    retry_headers = {**headers, "Idempotency-Key": "add-crashed"}
+    client.post("/cart/add", json={"product_id": product_id}, headers=retry_headers)
+
+    async def abandon(claimed_at):
+        # What a worker killed between claiming and storing leaves behind.
+        async with TestingSessionLocal() as db:
+            await db.execute(update(keys).values(
+                status_code=None, response_body=None, claimed_at=claimed_at))
+            await db.commit()
+
+    monkeypatch.setattr(config, "idempotency_wait_seconds", 0.1)
+    client.portal.call(abandon, datetime.now(timezone.utc))
+    response = client.post("/cart/add", json={"product_id": product_id},
+                           headers=retry_headers)
+    assert response.status_code == status.HTTP_409_CONFLICT
+
+    client.portal.call(abandon, datetime.now(timezone.utc) - timedelta(
+        seconds=config.idempotency_claim_lease_seconds + 1))
+    response = client.post("/cart/add", json={"product_id": product_id},
+                           headers=retry_headers)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert "Idempotent-Replayed" not in response.headers
+    assert client.post("/cart/add", json={"product_id": product_id},
+                       headers=retry_headers).headers["Idempotent-Replayed"] == "true"
+
+
+def test_janitor_only_purges_expired_keys(client: TestClient):
+    """Test the janitor leaves another user's live row with the same key alone"""
+    from datetime import datetime, timedelta, timezone
+    from sqlalchemy import insert, select
+    from app import models
+    from app.idempotency import IdempotencyKeyJanitor, keys
+    from tests.conftest import TestingSessionLocal
+
+    async def run():
+        now = datetime.now(timezone.utc)
+        async with TestingSessionLocal() as db:
+            await db.execute(insert(models.User), [
+                {"id": 1, "email": "a@example.com", "hashed_password": "x"},
+                {"id": 2, "email": "b@example.com", "hashed_password": "x"}])
+            await db.execute(insert(keys), [
+                {"user_id": 1, "key": "k", "fingerprint": "f",
+                 "expires_at": now - timedelta(hours=1)},
+                {"user_id": 2, "key": "k", "fingerprint": "f",
+                 "expires_at": now + timedelta(hours=1)}])
+            await db.commit()
+        purged = await IdempotencyKeyJanitor(TestingSessionLocal, interval=60).run_once()
+        async with TestingSessionLocal() as db:
+            left = (await db.execute(select(keys.c.user_id))).scalars().all()
+        return purged, left
+
+    assert client.portal.call(run) == (1, [2])
+
+
+def test_patch_cart_applies_batch(client: TestClient, mock_current_user_admin):
+    """Test PATCH /cart applies several adds and removals in one go"""
+    headers = create_authenticated_client(
+        client, "batch@example.com", "testpassword")
+    kept, removed, added = (_create_product(client, stock_quantity=5, price=p)
+                            for p in (1.0, 2.0, 3.0))
+    client.post("/cart/add", params={"quantity": 2},
+                json={"product_id": kept}, headers=headers)
+    client.post("/cart/add", json={"product_id": removed}, headers=headers)
+
+    response = client.patch("/cart/", json=[
+        {"product_id": kept, "quantity": 1},
+        {"product_id": removed, "quantity": -1},
+        {"product_id": added, "quantity": 2},
+        {"product_id": added, "quantity": 1},
+    ], headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    cart = {item["product"]["id"]: item["quantity"] for item in response.json()}
+    assert cart == {kept: 3, added: 3}
+    assert response.json() == client.get("/cart/", headers=headers).json()
+    assert [client.portal.call(_stock(p)) for p in (kept, removed, added)] == [2, 5, 2]
+
+
+def test_patch_cart_is_all_or_nothing(client: TestClient, mock_current_user_admin):
+    """Test one failing change leaves stock and the cart untouched"""
+    headers = create_authenticated_client(
+        client, "batchfail@example.com", "testpassword")
+    plenty = _create_product(client, stock_quantity=5, price=1.0)
+    scarce = _create_product(client, stock_quantity=1, price=2.0)
+
+    response = client.patch("/cart/", json=[
+        {"product_id": plenty, "quantity": 2},
+        {"product_id": scarce, "quantity": 2},
+    ], headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    response = client.patch("/cart/", json=[
+        {"product_id": plenty, "quantity": 2},
+        {"product_id": 999999, "quantity": 1},
+    ], headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.patch("/cart/", json=[
+        {"product_id": plenty, "quantity": -1},
+    ], headers=headers)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    assert client.get("/cart/", headers=headers).json() == []
+    assert [client.portal.call(_stock(p)) for p in (plenty, scarce)] == [5, 1]
+
+
+def test_cart_items_match_schema_serialization(client: TestClient, mock_current_user_admin):
+    """Test the column-based cart listing is byte-identical to dumping the schemas"""
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import joinedload
+    from app import models, schemas
+    from tests.conftest import TestingSessionLocal
+
+    headers = create_authenticated_client(
+        client, "bytes@example.com", "testpassword")
+    for price in (0.1, 2.0):
+        client.post("/cart/add", json={
+            "product_id": _create_product(client, stock_quantity=3, price=price)},
+            headers=headers)
+
+    async def expected():
+        async with TestingSessionLocal() as db:
+            items = (await db.execute(
+                select(models.CartItem)
+                .options(joinedload(models.CartItem.product))
+                .order_by(models.CartItem.id)
+            )).scalars().all()
+            adapter = TypeAdapter(list[schemas.CartItemInList])
+            return adapter.dump_json(adapter.validate_python(items, from_attributes=True))
+
+    response = client.get("/cart/", headers=headers)
+    assert response.content == client.portal.call(expected)
+
+
+def test_checkout_query_count_is_independent_of_cart_size(client: TestClient, mock_current_user_admin):
+    """Test checkout issues the same few statements for 1 or 10 cart lines"""
+    from app.core.query_budget import QueryCapture
+
+    counts = []
+    for size in (1, 10):
+        headers = create_authenticated_client(
+            client, f"budget{size}@example.com", "testpassword")
+        client.patch("/cart/", json=[
+            {"product_id": _create_product(client, stock_quantity=5, price=size + i),
+             "quantity": 1} for i in range(size)], headers=headers)
+        with QueryCapture() as queries:
+            response = client.post("/cart/checkout", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        counts.append(queries.last.statements)
+    assert counts[0] == counts[1] <= 4
+
+
+def test_write_queue_group_commits_and_isolates_failures(tmp_path):
+    """Test queued writes share one commit and a failing one rolls back alone"""
+    import asyncio
+    from fastapi import HTTPException
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app import models
+    from app.database import Base
+    from app.write_queue import WriteQueue
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'writes.db'}"
+
+    def add_category(name: str, fail: bool = False):
+        async def operation(db):
+            db.add(models.Category(name=name))
+            await db.commit()
+            if fail:
+                db.add(models.Category(name=name + " again"))
+                await db.flush()
+                raise HTTPException(status_code=409, detail="conflict")
+            return name
+        return operation
+
+    async def scenario():
+        setup = create_async_engine(url)
+        async with setup.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await setup.dispose()
+
+        queue = WriteQueue(url, max_batch=64)
+        queue.start()
+        try:
+            results = await asyncio.gather(
+                *(queue.submit(add_category(f"C{i}", fail=i == 3)) for i in range(20)),
+                return_exceptions=True)
+            async with queue.engine.connect() as conn:
+                pragmas = [(await conn.exec_driver_sql(f"PRAGMA {name}")).scalar()
+                           for name in ("journal_mode", "synchronous", "busy_timeout")]
+                names = (await conn.execute(select(models.Category.name))).scalars().all()
+            return results, queue.stats(), pragmas, names
+        finally:
+            await queue.stop()
+
+    results, stats, pragmas, names = asyncio.run(scenario())
+
+    assert isinstance(results[3], HTTPException)
+    assert results[:3] + results[4:] == [f"C{i}" for i in range(20) if i != 3]
+    assert stats["groups"] == 1 and stats["operations"] == 20
+    # The failed operation keeps what it committed before failing, like a
+    # request on its own session would, and loses only the rest.
+    assert sorted(names) == sorted(f"C{i}" for i in range(20))
+    assert pragmas == ["wal", 1, 5000]
+
+
+def test_write_queue_holds_commit_effects_until_the_group_commits(tmp_path):
+    """Test after_commit effects of queued writes wait for the group COMMIT and drop with it"""
+    import asyncio
+    import contextvars
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app import models
+    from app.database import Base
+    from app.replicas import recent_writers
+    from app.utils.oauth2 import current_user_id
+    from app.write_queue import WriteQueue
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'effects.db'}"
+
+    class Abort(BaseException):
+        pass
+
+    async def add_category(db):
+        db.add(models.Category(name=f"Effects {current_user_id.get()}"))
+        await db.commit()
+
+    async def seen_as_writer(db):
+        return recent_writers.get(current_user_id.get())
+
+    async def abort(db):
+        raise Abort()
+
+    async def scenario():
+        setup = create_async_engine(url)
+        async with setup.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await setup.dispose()
+
+        queue = WriteQueue(url, max_batch=64)
+        queue.start()
+        try:
+            current_user_id.set(9001)
+            mid_group = (await asyncio.gather(
+                queue.submit(add_category), queue.submit(seen_as_writer)))[1]
+            after_group = recent_writers.get(9001)
+
+            current_user_id.set(9002)
+            loop = asyncio.get_running_loop()
+            group = [(operation, contextvars.copy_context(), loop.create_future())
+                     for operation in (add_category, abort)]
+            try:
+                await queue._commit_group(group)
+            except Abort:
+                pass
+            return mid_group, after_group, recent_writers.get(9002)
+        finally:
+            await queue.stop()
+
+    mid_group, after_group, failed_group = asyncio.run(scenario())
+
+    assert mid_group is None
+    assert after_group is True
+    assert failed_group is None
+
+
+def test_waiting_idempotent_retry_does_not_block_the_write_queue(client: TestClient, mock_current_user_admin, tmp_path, monkeypatch):
+    """Test a retry waiting on its key leaves the queued writer free for other users"""
+    import asyncio
+    import hashlib
+    import json
+    import time
+    from datetime import datetime, timedelta, timezone
+    import httpx
+    from sqlalchemy import insert
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import write_queue as write_queue_module
+    from app.core.config import config
+    from app.database import Base, get_db
+    from app.idempotency import keys
+    from app.main import app
+    from app.write_queue import WriteQueue
+
+    url = f"sqlite+aiosqlite:///{tmp_path / 'shop.db'}"
+    engine = create_async_engine(url)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def file_db():
+        async with sessions() as db:
+            yield db
+
+    async def create_tables():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    client.portal.call(create_tables)
+    monkeypatch.setitem(app.dependency_overrides, get_db, file_db)
+    monkeypatch.setattr(config, "idempotency_wait_seconds", 1.0)
+    waiting = create_authenticated_client(client, "waiting@example.com", "testpassword")
+    other = create_authenticated_client(client, "other@example.com", "testpassword")
+    product_id = _create_product(client, stock_quantity=5)
+
+    body = json.dumps({"product_id": product_id}).encode()
+    fingerprint = hashlib.sha256(b"POST" + b"/cart/add" + body).hexdigest()
+
+    async def claim_in_flight():
+        # The first request with this key is still running elsewhere.
+        now = datetime.now(timezone.utc)
+        async with sessions() as db:
+            await db.execute(insert(keys).values(
+                user_id=1, key="busy", fingerprint=fingerprint, claimed_at=now,
+                expires_at=now + timedelta(hours=1)))
+            await db.commit()
+
+    queue = WriteQueue(url, max_batch=64)
+    monkeypatch.setattr(write_queue_module, "write_queue", queue)
+
+    async def scenario():
+        await claim_in_flight()
+        queue.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                         base_url="http://test") as http:
+                retry = asyncio.create_task(http.post(
+                    "/cart/add", content=body,
+                    headers={**waiting, "Idempotency-Key": "busy",
+                             "Content-Type": "application/json"}))
+                await asyncio.sleep(0.1)
+                started = time.perf_counter()
+                added = await http.post("/cart/add", json={"product_id": product_id},
+                                        headers=other)
+                elapsed, retry_still_waiting = time.perf_counter() - started, not retry.done()
+                return (await retry).status_code, added.status_code, elapsed, retry_still_waiting
+        finally:
+            await queue.stop()
+            await engine.dispose()
+
+    retry_status, added_status, elapsed, retry_still_waiting = client.portal.call(scenario)
+    assert retry_status == status.HTTP_409_CONFLICT
+    assert added_status == status.HTTP_201_CREATED
+    assert retry_still_waiting and elapsed < 0.5
+    assert queue.operations >= 1
@@ -73,3 +73,41 @@ def test_delete_category_admin_only(client: TestClient):
     # Success: Admin user
     response = client.delete(f"/categories/{cat_id}", headers=admin_headers)
     assert response.status_code == status.HTTP_204_NO_CONTENT
+
+
+def test_category_reads_are_cached_until_a_write(client: TestClient, mock_current_user_admin):
+    """Test category lists are served from the response cache and purged by writes"""
+    from app.utils.response_cache import catalog_cache
+
+    client.post("/categories/add", json={"name": "Garden"})
+    first = client.get("/categories/")
+    hits = catalog_cache.hits
+    second = client.get("/categories/")
+    assert catalog_cache.hits == hits + 1
+    assert second.content == first.content
+
+    cat_id = first.json()[0]["id"]
+    client.put(f"/categories/{cat_id}", json={"name": "Outdoor"})
+    response = client.get("/categories/")
+    assert [c["name"] for c in response.json()] == ["Outdoor"]
+
+
+def test_response_built_before_a_write_is_not_cached(client: TestClient):
+    """Test a read that overlaps an invalidation doesn't cache its stale body"""
+    from fastapi import Request
+    from app.utils.response_cache import cached_response, catalog_cache
+
+    request = Request({"type": "http", "method": "GET", "path": "/categories/",
+                       "query_string": b"", "headers": []})
+
+    async def build():
+        rows = [{"id": 1, "name": "Before"}]
+        # The write commits and purges while this response is being built.
+        catalog_cache.invalidate("categories")
+        return rows
+
+    async def read():
+        await cached_response(request, "categories", None, build)
+        return len(catalog_cache)
+
+    assert client.portal.call(read) == 0
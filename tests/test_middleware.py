@@ -0,0 +1,81 @@
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+
+
+def test_request_id_generated_and_timed(client: TestClient):
+    """Test every response carries a request id and a process time"""
+    response = client.get("/health")
+
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.headers["X-Request-Id"]) == 32
+    assert float(response.headers["X-Process-Time"]) >= 0
+
+
+def test_request_id_propagated(client: TestClient):
+    """Test a well-formed incoming request id is echoed back, others replaced"""
+    response = client.get("/health", headers={"X-Request-Id": "edge-42.a"})
+    assert response.headers["X-Request-Id"] == "edge-42.a"
+
+    response = client.get("/health", headers={"X-Request-Id": "bad id\n"})
+    assert response.headers["X-Request-Id"] != "bad id\n"
+
+
+def test_metrics_exposition(client: TestClient):
+    """Test /metrics reports route, status and per-route DB counters"""
+    from app.core import metrics
+
+    metrics.registry.clear()
+    client.get("/products/", params={"limit": 5})
+    client.get("/products/999999")
+    client.get("/products/999998")
+    client.get("/no-such-page")
+
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/products/{product_id}",status="404"} 2' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/products/"} 1' in text
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/products/",le="+Inf"} 1' in text
+    assert 'http_requests_in_flight{method="GET"} 1' in text
+    assert metrics.db_statements_total.get(("/products/{product_id}",)) == 2
+    assert metrics.db_statement_duration_seconds.count(("/products/{product_id}",)) == 2
+
+
+def test_query_budget_flags_overruns_and_repeats():
+    """Test a route over its statement budget or repeating a statement is flagged"""
+    from types import SimpleNamespace
+    from app.core.metrics import RequestStats
+    from app.core.query_budget import QueryBudgetExceeded, check_request, query_budget
+
+    @query_budget(2)
+    async def endpoint():
+        pass
+
+    route = SimpleNamespace(path="/things", endpoint=endpoint)
+    stats = RequestStats()
+    stats.statements, stats.patterns = 2, {"SELECT a": 1, "SELECT b": 1}
+    check_request("GET", route, stats)
+
+    stats.statements, stats.patterns["SELECT c"] = 3, 1
+    with pytest.raises(QueryBudgetExceeded, match="3 statements, budget is 2"):
+        check_request("GET", route, stats)
+
+    stats = RequestStats()
+    stats.statements, stats.patterns = 6, {"SELECT * FROM products WHERE id = ?": 6}
+    with pytest.raises(QueryBudgetExceeded, match="ran 6 times"):
+        check_request("GET", SimpleNamespace(path="/loop", endpoint=None), stats)
+
+
+def test_query_capture_counts_requests(client: TestClient):
+    """Test tests can capture and assert the statements a request issued"""
+    from app.core.query_budget import QueryCapture
+
+    with QueryCapture() as queries:
+        client.get("/categories/")
+        client.get("/health")
+    assert [route for _, route, _ in queries.requests] == ["/categories/", "/health"]
+    assert queries.requests[0][2].statements == 1
+    assert queries.last.statements == 0
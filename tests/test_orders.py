@@ -59,3 +59,338 @@ def test_cart_checkout_creates_order(client: TestClient, mock_current_user_admin
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert len(data) == 0
+
+
+def test_orders_conditional_get(client: TestClient):
+    """Test order history answers revalidation with 304 until it changes"""
+    headers = create_authenticated_client(
+        client, "etag@example.com", "userpass")
+
+    response = client.get("/orders/", headers=headers)
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        "/orders/", headers={**headers, "If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.content == b""
+
+    response = client.get(
+        "/orders/", headers={**headers, "If-None-Match": '"stale"'})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_orders_if_modified_since_never_hides_a_new_order(client: TestClient):
+    """Test order history sends no Last-Modified, so same-second orders aren't missed"""
+    headers = create_authenticated_client(
+        client, "ims@example.com", "userpass")
+    client.portal.call(_insert_orders("ims@example.com", 1))
+
+    response = client.get("/orders/", headers=headers)
+    assert "Last-Modified" not in response.headers
+    client.portal.call(_insert_orders("ims@example.com", 1, items_per_order=1))
+    response = client.get("/orders/", headers={
+        **headers, "If-Modified-Since": "Fri, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 2
+
+
+def test_catalog_if_modified_since_sees_a_same_second_update(client: TestClient, mock_current_user_admin):
+    """Test a cached product's Last-Modified moves past one served before a same-second update"""
+    category_id = client.post(
+        "/categories/add", json={"name": "Revalidated"}).json()["id"]
+    product_id = client.post("/products/", json={
+        "name": "Revalidated Product", "price": 10, "stock_quantity": 5,
+        "category_id": category_id}).json()["id"]
+
+    response = client.get(f"/products/{product_id}")
+    last_modified = response.headers["Last-Modified"]
+    client.put(f"/products/{product_id}", json={"price": 11})
+    response = client.get(f"/products/{product_id}",
+                          headers={"If-Modified-Since": last_modified})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["price"] == 11
+    assert response.headers["Last-Modified"] != last_modified
+
+    response = client.get(f"/products/{product_id}", headers={
+        "If-Modified-Since": response.headers["Last-Modified"]})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def _insert_orders(email: str, count: int, items_per_order: int = 2):
+    from sqlalchemy import insert, select
+    from app import models
+    from tests.conftest import TestingSessionLocal
+
+    async def insert_orders():
+        async with TestingSessionLocal() as db:
+            user_id = (await db.execute(select(models.User.id).where(
+                models.User.email == email))).scalar_one()
+            category = models.Category(
+                name=f"History {email} {count}x{items_per_order}")
+            db.add(category)
+            await db.flush()
+            product = models.Product(name="History Product", price=2.0,
+                                     stock_quantity=0, category_id=category.id)
+            db.add(product)
+            await db.flush()
+            # All inserted in the same second, so the id tiebreak matters.
+            order_ids = (await db.execute(
+                insert(models.Order).returning(models.Order.id),
+                [{"user_id": user_id, "total_amount": 2.0 * items_per_order}
+                 for _ in range(count)])).scalars().all()
+            if items_per_order:
+                await db.execute(insert(models.OrderItem), [
+                    {"order_id": order_id, "product_id": product.id,
+                     "quantity": 1, "price_at_purchase": 2.0}
+                    for order_id in order_ids for _ in range(items_per_order)])
+            await db.commit()
+            return order_ids
+    return insert_orders
+
+
+def test_orders_cursor_pagination(client: TestClient):
+    """Test order history pages newest-first with a cursor and no gaps"""
+    headers = create_authenticated_client(
+        client, "history@example.com", "userpass")
+    order_ids = client.portal.call(_insert_orders("history@example.com", 7))
+
+    seen, cursor = [], None
+    while True:
+        params = {"pagination": "cursor", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/orders/", params=params, headers=headers).json()
+        assert all(len(order["order_items"]) == 2 for order in page["items"])
+        seen += [order["id"] for order in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(order_ids, reverse=True)
+
+    response = client.get("/orders/", params={"cursor": "!!"}, headers=headers)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_orders_summary_mode(client: TestClient):
+    """Test summary=true returns per-order counts and totals without items"""
+    headers = create_authenticated_client(
+        client, "summary@example.com", "userpass")
+    client.portal.call(_insert_orders("summary@example.com", 3, 4))
+
+    response = client.get("/orders/", params={"summary": True}, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    for order in response.json():
+        assert "order_items" not in order
+        assert order["item_count"] == 4
+        assert order["unit_count"] == 4
+        assert order["total_amount"] == 8.0
+
+    page = client.get("/orders/", params={
+        "summary": True, "pagination": "cursor", "limit": 2}, headers=headers).json()
+    assert len(page["items"]) == 2 and page["next_cursor"]
+
+
+def test_order_history_query_uses_index(client: TestClient):
+    """Test a history page is an index range scan with no sort step"""
+    from sqlalchemy import text
+    from app.routers.orders import build_order_history_query
+    from tests.conftest import engine
+
+    for summary in (False, True):
+        query, _ = build_order_history_query("sqlite", 1, summary)
+        sql = str(query.limit(20).compile(
+            engine.sync_engine, compile_kwargs={"literal_binds": True}))
+
+        async def explain():
+            async with engine.connect() as conn:
+                rows = await conn.execute(text("EXPLAIN QUERY PLAN " + sql))
+                return [row[-1] for row in rows]
+
+        plan = client.portal.call(explain)
+        assert "ix_orders_user_id_created_at_id" in plan[0], plan
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_export_orders_streams_lines(client: TestClient, mock_current_user_admin):
+    """Test the admin export streams every order line, resumable by since_id"""
+    import csv
+    import json
+
+    create_authenticated_client(client, "export@example.com", "userpass")
+    order_ids = client.portal.call(_insert_orders("export@example.com", 5, 2))
+    empty_order = client.portal.call(_insert_orders("export@example.com", 1, 0))
+
+    response = client.get("/orders/export", params={"batch_size": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["order_id"] for row in rows] == sorted(order_ids * 2) + empty_order
+    assert len({row["item_id"] for row in rows[:-1]}) == 10
+    assert rows[-1]["item_id"] is None
+
+    response = client.get("/orders/export", params={
+        "format": "csv", "since_id": order_ids[2], "batch_size": 1})
+    rows = list(csv.DictReader(response.text.splitlines()))
+    assert [int(row["order_id"]) for row in rows] == sorted(order_ids[3:] * 2) + empty_order
+
+    response = client.get("/orders/export", params={
+        "created_from": "2100-01-01T00:00:00"})
+    assert response.text == ""
+
+
+def test_order_history_matches_schema_serialization(client: TestClient):
+    """Test the column-based order history is byte-identical to dumping the schemas"""
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+    from app import models, schemas
+    from tests.conftest import TestingSessionLocal
+
+    headers = create_authenticated_client(
+        client, "bytes@example.com", "userpass")
+    client.portal.call(_insert_orders("bytes@example.com", 3, 2))
+
+    async def expected():
+        async with TestingSessionLocal() as db:
+            orders = (await db.execute(
+                select(models.Order)
+                .options(selectinload(models.Order.order_items))
+                .order_by(models.Order.created_at.desc(), models.Order.id.desc())
+            )).scalars().all()
+            adapter = TypeAdapter(list[schemas.Order])
+            return adapter.dump_json(adapter.validate_python(orders, from_attributes=True))
+
+    response = client.get("/orders/", headers=headers)
+    assert response.content == client.portal.call(expected)
+
+
+def _replica_urls(tmp_path, count: int) -> list[str]:
+    return [f"sqlite+aiosqlite:///{tmp_path / f'replica{i}.db'}" for i in range(1, count + 1)]
+
+
+def _create_database(url: str, category: str | None = None):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app import models
+    from app.database import Base
+
+    async def create():
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            if category is not None:
+                await conn.execute(models.Category.__table__.insert().values(name=category))
+        await engine.dispose()
+    return create
+
+
+def test_reads_use_replicas_except_right_after_a_write(client: TestClient, tmp_path):
+    """Test reads rotate over replicas, but a user who just wrote reads the primary"""
+    from app import models
+    from app.replicas import recent_writers, replicas
+    from app.utils.response_cache import catalog_cache
+    from tests.conftest import TestingSessionLocal
+
+    urls = _replica_urls(tmp_path, 2)
+    for i, url in enumerate(urls, 1):
+        client.portal.call(_create_database(url, f"Replica {i}"))
+    replicas.configure(urls)
+    try:
+        names = []
+        for _ in range(2):
+            catalog_cache.clear()
+            names.append([c["name"] for c in client.get("/categories/").json()])
+        assert sorted(names) == [["Replica 1"], ["Replica 2"]]
+
+        async def add_product():
+            async with TestingSessionLocal() as db:
+                category = models.Category(name="Primary")
+                db.add(category)
+                await db.flush()
+                product = models.Product(name="Fresh", price=3.0, stock_quantity=5,
+                                         category_id=category.id)
+                db.add(product)
+                await db.commit()
+                return product.id
+        product_id = client.portal.call(add_product)
+        headers = create_authenticated_client(client, "sticky@example.com", "userpass")
+        assert client.get("/orders/", headers=headers).json() == []
+
+        client.post("/cart/add", json={"product_id": product_id}, headers=headers)
+        assert client.post("/cart/checkout", headers=headers).status_code == status.HTTP_200_OK
+        orders = client.get("/orders/", headers=headers).json()
+        assert [order["total_amount"] for order in orders] == [3.0]
+
+        # Once the window has passed, the user reads the (lagging) replicas again.
+        recent_writers.clear()
+        assert client.get("/orders/", headers=headers).json() == []
+    finally:
+        client.portal.call(replicas.dispose)
+        replicas.configure([])
+        recent_writers.clear()
+
+
+def test_catalog_cache_is_not_filled_from_a_lagging_replica(client: TestClient, mock_current_user_admin, tmp_path, monkeypatch):
+    """Test a write's stale replica rows don't get cached, and its writer skips the cache"""
+    from app import models
+    from app.core.config import config
+    from app.replicas import recent_writers, replicas
+    from app.utils.oauth2 import decode_access_token
+    from app.utils.response_cache import catalog_cache
+    from tests.conftest import TestingSessionLocal
+
+    urls = _replica_urls(tmp_path, 1)
+    client.portal.call(_create_database(urls[0], "Old"))
+
+    async def add_category():
+        async with TestingSessionLocal() as db:
+            db.add(models.Category(name="Old"))
+            await db.commit()
+    client.portal.call(add_category)
+    headers = create_authenticated_client(client, "writer@example.com", "userpass")
+    replicas.configure(urls)
+    try:
+        def names(**kwargs):
+            return [c["name"] for c in client.get("/categories/", **kwargs).json()]
+
+        assert names() == ["Old"]
+        client.put("/categories/1", json={"name": "New"})
+        recent_writers.set(int(decode_access_token(headers["Authorization"][7:])["id"]), True)
+        # The replica hasn't caught up; what it returns isn't cached.
+        assert names() == ["Old"]
+        assert len(catalog_cache) == 0
+        assert names(headers=headers) == ["New"]
+
+        # Outside the window the replica fills the cache, and the writer,
+        # still on the primary, reads past it.
+        monkeypatch.setattr(config, "read_your_writes_seconds", 0)
+        assert names() == ["Old"]
+        assert len(catalog_cache) == 1
+        assert names(headers=headers) == ["New"]
+    finally:
+        client.portal.call(replicas.dispose)
+        replicas.configure([])
+        recent_writers.clear()
+
+
+def test_sqlite_replicator_copies_primary(client: TestClient, tmp_path):
+    """Test the local replication stand-in copies a SQLite primary into replicas"""
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app import models
+    from app.replicas import SQLiteReplicator
+
+    primary = f"sqlite+aiosqlite:///{tmp_path / 'primary.db'}"
+    urls = _replica_urls(tmp_path, 2)
+    client.portal.call(_create_database(primary, "Copied"))
+    replicator = SQLiteReplicator(primary, urls, interval=1.0)
+    assert SQLiteReplicator.supported(primary, urls)
+    client.portal.call(replicator.run_once)
+
+    async def replica_categories(url):
+        engine = create_async_engine(url)
+        async with engine.connect() as conn:
+            names = (await conn.execute(select(models.Category.name))).scalars().all()
+        await engine.dispose()
+        return names
+    for url in urls:
+        assert client.portal.call(replica_categories, url) == ["Copied"]
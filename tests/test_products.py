@@ -1,3 +1,4 @@
+import json
 from fastapi import status
 from fastapi.testclient import TestClient
 import pytest
@@ -93,4 +94,463 @@ def test_delete_product_admin_only(client: TestClient):
 
     # Admin delete - success
     response = client.delete(f"/products/{prod_id}", headers=admin_headers)
-    assert response.status_code == status.HTTP_204_NO_CONTENT
\ No newline at end of file
+    assert response.status_code == status.HTTP_204_NO_CONTENT
+
+def _create_catalog(client: TestClient, prices: list[float]):
+    response = client.post(
+        "/categories/add", json={"name": "Catalog", "description": "Test"})
+    category_id = response.json()["id"]
+    ids = []
+    for i, price in enumerate(prices):
+        response = client.post("/products/", json={
+            "name": f"Product {i}", "price": price, "stock_quantity": 5,
+            "category_id": category_id
+        })
+        ids.append(response.json()["id"])
+    return category_id, ids
+
+
+def test_read_products_cursor_pagination(client: TestClient, mock_current_user_admin):
+    """Test cursor pagination walks every product exactly once, in sort order"""
+    _, ids = _create_catalog(client, [30, 10, 20, 10, 50])
+
+    seen, cursor = [], None
+    while True:
+        params = {"pagination": "cursor", "limit": 2, "sort": "price"}
+        if cursor:
+            params["cursor"] = cursor
+        response = client.get("/products/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert [p["price"] for p in seen] == [10, 10, 20, 30, 50]
+    assert sorted(p["id"] for p in seen) == sorted(ids)
+
+
+def test_read_products_cursor_with_count(client: TestClient, mock_current_user_admin):
+    """Test cursor pages report exact and estimated totals on request"""
+    _create_catalog(client, [1, 2, 3])
+
+    response = client.get(
+        "/products/", params={"pagination": "cursor", "count": "exact"})
+    assert response.json()["total"] == 3
+    assert response.json()["total_is_estimate"] is False
+
+    response = client.get(
+        "/products/", params={"pagination": "cursor", "count": "estimate"})
+    assert response.json()["total"] == 3
+    assert response.json()["total_is_estimate"] is True
+
+
+def test_read_products_offset_mode_unchanged(client: TestClient, mock_current_user_admin):
+    """Test offset pagination still returns a plain list"""
+    _create_catalog(client, [1, 2, 3])
+
+    response = client.get("/products/", params={"page": 2, "limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["price"] for p in response.json()] == [3]
+
+
+def test_read_products_invalid_cursor(client: TestClient):
+    """Test a malformed cursor is rejected"""
+    response = client.get("/products/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_read_products_rejects_forged_or_replayed_cursors(client: TestClient, mock_current_user_admin):
+    """Test cursors with non-scalar values or from another sort are rejected"""
+    import base64
+    import json
+
+    _create_catalog(client, [1, 2, 3])
+
+    def forged(payload):
+        return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+    params = {"pagination": "cursor", "sort": "price"}
+    for payload in ([[1, 2], 3],
+                    {"sort": "price", "after": [[1, 2], 3]},
+                    {"sort": "price", "after": [{"$dt": 1}, 3]},
+                    {"sort": "price", "after": [1]}):
+        response = client.get("/products/", params={**params, "cursor": forged(payload)})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    cursor = client.get("/products/", params={**params, "limit": 1}).json()["next_cursor"]
+    response = client.get("/products/", params={**params, "cursor": cursor})
+    assert response.status_code == status.HTTP_200_OK
+    response = client.get("/products/", params={**params, "sort": "name", "cursor": cursor})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.parametrize("sort", ["id", "price", "-created_at", "name"])
+@pytest.mark.parametrize("filters", [
+    {"category_id": 1},
+    {"min_price": 1.0, "max_price": 5.0},
+    {"name_prefix": "Lap"},
+    {"category_id": 1, "min_price": 1.0},
+    {"category_id": 1, "name_prefix": "Lap", "in_stock": True},
+    {"min_price": 1.0, "name_prefix": "Lap"},
+    {"in_stock": True},
+    {},
+])
+def test_product_filter_query_plans_use_indexes(client: TestClient, filters, sort):
+    """Test every filter/sort combination seeks an index instead of scanning products"""
+    from sqlalchemy import text
+    from app.routers.products import build_product_query, product_filters
+    from tests.conftest import engine
+
+    query, _, _ = build_product_query(
+        "sqlite", sort, product_filters(**filters))
+    sql = str(query.limit(10).compile(
+        engine.sync_engine, compile_kwargs={"literal_binds": True}))
+
+    async def explain():
+        async with engine.connect() as conn:
+            rows = await conn.execute(text("EXPLAIN QUERY PLAN " + sql))
+            return [row[-1] for row in rows]
+
+    plan = client.portal.call(explain)
+    if {"category_id", "min_price", "max_price", "name_prefix"} & filters.keys():
+        assert plan[0].startswith("SEARCH products USING INDEX"), plan
+    else:
+        # No selective filter: walk an index in sort order and stop at LIMIT.
+        assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_read_products_filters(client: TestClient, mock_current_user_admin):
+    """Test category, price, stock and name-prefix filters combine"""
+    category_id, _ = _create_catalog(client, [5, 15, 25])
+    other = client.post(
+        "/categories/add", json={"name": "Other"}).json()["id"]
+    client.post("/products/", json={
+        "name": "Product 9", "price": 15, "stock_quantity": 0,
+        "category_id": other})
+
+    response = client.get("/products/", params={
+        "min_price": 10, "max_price": 30, "sort": "-price"})
+    assert [p["price"] for p in response.json()] == [25, 15, 15]
+
+    response = client.get("/products/", params={
+        "min_price": 10, "in_stock": True, "category_id": category_id})
+    assert [p["name"] for p in response.json()] == ["Product 1", "Product 2"]
+
+    response = client.get("/products/", params={"name_prefix": "Product 9"})
+    assert [p["category_id"] for p in response.json()] == [other]
+
+
+def test_name_prefix_at_the_top_of_unicode(client: TestClient, mock_current_user_admin):
+    """Test prefixes ending in the last code point or before the surrogates still filter"""
+    category_id = client.post("/categories/add", json={"name": "Edge"}).json()["id"]
+    for name in ("A\U0010ffff", "A\U0010ffffz", "B", "\ud7ffx"):
+        client.post("/products/", json={
+            "name": name, "price": 1.0, "stock_quantity": 1, "category_id": category_id})
+
+    for prefix, names in (("A\U0010ffff", ["A\U0010ffff", "A\U0010ffffz"]),
+                          ("\U0010ffff", []),
+                          ("\ud7ff", ["\ud7ffx"])):
+        response = client.get("/products/", params={"name_prefix": prefix})
+        assert response.status_code == status.HTTP_200_OK
+        assert [p["name"] for p in response.json()] == names
+
+
+def test_search_products_ranked_and_kept_in_sync(client: TestClient, mock_current_user_admin):
+    """Test search matches name/description, ranks, and follows updates and deletes"""
+    category_id = client.post(
+        "/categories/add", json={"name": "Search"}).json()["id"]
+    laptop = client.post("/products/", json={
+        "name": "Laptop Pro", "description": "Laptop for laptop lovers",
+        "price": 10, "category_id": category_id}).json()["id"]
+    bag = client.post("/products/", json={
+        "name": "Bag", "description": "Fits a laptop",
+        "price": 10, "category_id": category_id}).json()["id"]
+    client.post("/products/", json={
+        "name": "Mug", "description": "Coffee", "price": 10,
+        "category_id": category_id})
+
+    response = client.get("/products/search", params={"q": "lapt"})
+    assert response.status_code == status.HTTP_200_OK
+    assert [p["id"] for p in response.json()] == [laptop, bag]
+
+    response = client.get(
+        "/products/search", params={"q": "lapt", "limit": 1, "page": 2})
+    assert [p["id"] for p in response.json()] == [bag]
+
+    client.put(f"/products/{bag}", json={"description": "Fits a tablet"})
+    response = client.get("/products/search", params={"q": "laptop"})
+    assert [p["id"] for p in response.json()] == [laptop]
+
+    client.delete(f"/products/{laptop}")
+    response = client.get("/products/search", params={"q": "laptop"})
+    assert response.json() == []
+
+    response = client.get("/products/search", params={"q": '"*('})
+    assert response.status_code == status.HTTP_200_OK
+
+
+def test_product_reads_are_cached_until_a_write(client: TestClient, mock_current_user_admin):
+    """Test product reads are served from cache and purged by admin writes"""
+    _, ids = _create_catalog(client, [10])
+
+    first = client.get(f"/products/{ids[0]}")
+    assert client.get(f"/products/{ids[0]}").content == first.content
+    assert client.get("/products/").json()[0]["price"] == 10
+
+    client.put(f"/products/{ids[0]}", json={"price": 12})
+    assert client.get(f"/products/{ids[0]}").json()["price"] == 12
+    assert client.get("/products/").json()[0]["price"] == 12
+
+    client.delete(f"/products/{ids[0]}")
+    assert client.get(f"/products/{ids[0]}").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/products/").json() == []
+
+
+def test_product_conditional_get(client: TestClient, mock_current_user_admin):
+    """Test catalog reads carry validators and answer revalidation with 304"""
+    _, ids = _create_catalog(client, [10])
+
+    response = client.get(f"/products/{ids[0]}")
+    etag = response.headers["ETag"]
+    last_modified = response.headers["Last-Modified"]
+
+    response = client.get(
+        f"/products/{ids[0]}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    response = client.get(
+        f"/products/{ids[0]}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    client.put(f"/products/{ids[0]}", json={"price": 11})
+    response = client.get(
+        f"/products/{ids[0]}", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["ETag"] != etag
+
+
+def test_import_products_csv(client: TestClient, mock_current_user_admin):
+    """Test CSV import writes valid rows in batches and reports bad ones"""
+    category_id = client.post(
+        "/categories/add", json={"name": "Feed"}).json()["id"]
+    feed = (
+        "name,description,price,stock_quantity,category_id\r\n"
+        f'Widget,"Small, blue\nand round",2.5,10,{category_id}\r\n'
+        f"Gadget,,3,,{category_id}\r\n"
+        f"Broken,,not-a-price,1,{category_id}\r\n"
+        "Orphan,,1,1,999999\r\n"
+        f"Negative,,-1,1,{category_id}\r\n"
+        f"Gizmo,,4,2,{category_id}"
+    )
+
+    def chunks():
+        # Split mid-line, mid-field and mid-character to exercise buffering.
+        data = feed.encode()
+        for i in range(0, len(data), 7):
+            yield data[i:i + 7]
+
+    response = client.post("/products/import", params={"batch_size": 2},
+                           content=chunks(), headers={"Content-Type": "text/csv"})
+    assert response.status_code == status.HTTP_200_OK
+    report = response.json()
+    assert report["rows_received"] == 6
+    assert report["rows_imported"] == 3
+    assert sorted(error["row"] for error in report["errors"]) == [3, 4, 5]
+    assert "price" in report["errors"][0]["error"]
+
+    products = client.get("/products/", params={"limit": 10}).json()
+    assert {p["name"]: p["stock_quantity"] for p in products} == {
+        "Widget": 10, "Gadget": 0, "Gizmo": 2}
+    assert products[0]["description"] == "Small, blue\nand round"
+
+
+def test_import_products_ndjson(client: TestClient, mock_current_user_admin):
+    """Test NDJSON import and content-type negotiation"""
+    category_id = client.post(
+        "/categories/add", json={"name": "Feed"}).json()["id"]
+    feed = "\n".join([
+        json.dumps({"name": "One", "price": 1, "category_id": category_id}),
+        "[1, 2]",
+        "",
+        json.dumps({"name": "Two", "price": 2, "category_id": category_id}),
+    ])
+    response = client.post("/products/import", content=feed,
+                           headers={"Content-Type": "application/x-ndjson"})
+    report = response.json()
+    assert (report["rows_imported"], report["rows_failed"]) == (2, 1)
+    assert report["errors"] == [{"row": 2, "error": "Row is not a JSON object"}]
+
+    response = client.post("/products/import", content=feed,
+                           headers={"Content-Type": "application/octet-stream"})
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+
+
+def test_import_rejects_overlong_rows_without_buffering_them(client: TestClient, mock_current_user_admin, monkeypatch):
+    """Test an overlong line or unterminated quoted field fails its row and the rest still import"""
+    from app.core.config import config
+
+    monkeypatch.setattr(config, "bulk_import_max_row_length", 100)
+    category_id = client.post(
+        "/categories/add", json={"name": "Feed"}).json()["id"]
+    feed = "\n".join([
+        json.dumps({"name": "One", "price": 1, "category_id": category_id}),
+        "x" * 10_000,
+        json.dumps({"name": "Two", "price": 2, "category_id": category_id}),
+    ])
+    response = client.post("/products/import", content=feed,
+                           headers={"Content-Type": "application/x-ndjson"})
+    report = response.json()
+    assert (report["rows_imported"], report["rows_failed"]) == (2, 1)
+    assert report["errors"] == [{"row": 2, "error": "Row is longer than 100 characters"}]
+
+    feed = "\n".join(
+        ["name,price,category_id", f"Three,3,{category_id}", 'Open,"never closed']
+        + ["more text"] * 50
+        + [f"Four,4,{category_id}"])
+    response = client.post("/products/import", content=feed,
+                           headers={"Content-Type": "text/csv"})
+    report = response.json()
+    # Reading picks up again after the dropped record, so Four still imports.
+    assert report["rows_imported"] == 2
+    assert report["errors"][0] == {"row": 2, "error": "Row is longer than 100 characters"}
+
+
+def test_list_responses_match_schema_serialization(client: TestClient, mock_current_user_admin):
+    """Test the column-based list path is byte-identical to dumping the schemas"""
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from app import models, schemas
+    from tests.conftest import TestingSessionLocal
+
+    _create_catalog(client, [0.1 + 0.2, 10, 1e20])
+    client.post("/products/", json={
+        "name": "Ünïcode \"quoted\" <b>", "description": None, "price": 3.5,
+        "stock_quantity": 1, "category_id": 1})
+
+    async def expected(model, schema):
+        async with TestingSessionLocal() as db:
+            rows = (await db.execute(select(model).order_by(model.id))).scalars().all()
+            adapter = TypeAdapter(list[schema])
+            return adapter.dump_json(adapter.validate_python(rows, from_attributes=True))
+
+    response = client.get("/products/", params={"limit": 100})
+    assert response.content == client.portal.call(
+        expected, models.Product, schemas.Product)
+    response = client.get("/categories/")
+    assert response.content == client.portal.call(
+        expected, models.Category, schemas.Category)
+
+
+def test_invalidation_reaches_other_workers(client: TestClient, tmp_path):
+    """Test a product update published by one worker evicts another's cache"""
+    import asyncio
+    from app.core import metrics
+    from app.invalidation import InvalidationBus, SQLiteBackend
+
+    path = str(tmp_path / "invalidations.db")
+    publisher = InvalidationBus(SQLiteBackend(path, poll_interval=0.01, retention=60))
+    receiver = InvalidationBus(SQLiteBackend(path, poll_interval=0.01, retention=60))
+    seen = {"publisher": [], "receiver": []}
+    publisher.subscribe("products", seen["publisher"].append)
+    receiver.subscribe("products", seen["receiver"].append)
+    lag_before = metrics.cache_invalidation_lag_seconds.count(("products",))
+
+    async def propagate():
+        await publisher.start()
+        await receiver.start()
+        try:
+            publisher.publish("products", 7)
+            for _ in range(200):
+                if seen["receiver"]:
+                    break
+                await asyncio.sleep(0.01)
+            # Give the publisher's own poller time to see its echo.
+            await asyncio.sleep(0.05)
+        finally:
+            await receiver.stop()
+            await publisher.stop()
+
+    client.portal.call(propagate)
+    assert seen == {"publisher": [7], "receiver": [7]}
+    assert metrics.cache_invalidation_lag_seconds.count(("products",)) == lag_before + 1
+
+
+def test_invalidation_over_the_redis_protocol(client: TestClient):
+    """Test the Redis backend against a minimal in-process RESP server"""
+    import asyncio
+    from app.invalidation import InvalidationBus, RedisBackend, _resp_read
+
+    subscribers = []
+
+    def array(*parts: bytes | int) -> bytes:
+        return b"*%d\r\n" % len(parts) + b"".join(
+            b":%d\r\n" % part if isinstance(part, int)
+            else b"$%d\r\n%s\r\n" % (len(part), part) for part in parts)
+
+    async def serve(reader, writer):
+        try:
+            while True:
+                command = await _resp_read(reader)
+                if command[0] == b"SUBSCRIBE":
+                    subscribers.append(writer)
+                    writer.write(array(b"subscribe", command[1], 1))
+                elif command[0] == b"PUBLISH":
+                    for subscriber in subscribers:
+                        subscriber.write(array(b"message", command[1], command[2]))
+                    writer.write(b":%d\r\n" % len(subscribers))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+
+    async def silent(reader, writer):
+        await reader.read()
+
+    async def scenario():
+        server = await asyncio.start_server(serve, "127.0.0.1", 0)
+        url = "redis://127.0.0.1:%d/0" % server.sockets[0].getsockname()[1]
+        publisher = InvalidationBus(RedisBackend(url, "invalidations"))
+        receiver = InvalidationBus(RedisBackend(url, "invalidations"))
+        seen = {"publisher": [], "receiver": []}
+        publisher.subscribe("users", seen["publisher"].append)
+        receiver.subscribe("users", seen["receiver"].append)
+        await publisher.start()
+        await receiver.start()
+        try:
+            publisher.publish("users", 3)
+            publisher.publish("users", 4)
+            for _ in range(100):
+                if len(seen["receiver"]) == 2:
+                    break
+                await asyncio.sleep(0.01)
+            delivered = {name: list(keys) for name, keys in seen.items()}
+            # Events may be missed while a subscription is down, so a
+            # reconnect clears everything.
+            for subscriber in subscribers:
+                subscriber.close()
+            subscribers.clear()
+            for _ in range(100):
+                if receiver.backend.reconnects:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await receiver.stop()
+            await publisher.stop()
+            server.close()
+
+        hung = await asyncio.start_server(silent, "127.0.0.1", 0)
+        port = hung.sockets[0].getsockname()[1]
+        backend = RedisBackend(f"redis://:secret@127.0.0.1:{port}/0", "x", connect_timeout=0.1)
+        try:
+            await backend._connect()
+            timed_out = False
+        except ConnectionError:
+            timed_out = True
+        finally:
+            hung.close()
+        return delivered, seen["receiver"][2:], timed_out
+
+    delivered, after_reconnect, timed_out = client.portal.call(scenario)
+    assert delivered == {"publisher": [3, 4], "receiver": [3, 4]}
+    assert None in after_reconnect
+    assert timed_out